@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 准入控制：按请求类别限制并发数，超出的请求排队，队列满或等待超时返回 429 和 Retry-After。
+# 限制是每个进程各自的（多进程部署时总并发为 进程数 × 限制）
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_IMPORT_LIMIT = int(os.getenv("ADMISSION_IMPORT_LIMIT", "1"))
+ADMISSION_IMPORT_QUEUE = int(os.getenv("ADMISSION_IMPORT_QUEUE", "4"))
+ADMISSION_CALCULATION_LIMIT = int(os.getenv("ADMISSION_CALCULATION_LIMIT", "2"))
+ADMISSION_CALCULATION_QUEUE = int(os.getenv("ADMISSION_CALCULATION_QUEUE", "8"))
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "32"))
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", "256"))
+# 排队超过这么多秒仍未轮到的请求返回 429
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# 类别，数字越小优先级越高：有交互式读请求在排队时，不开始新的计算和导入
+READ = "read"
+CALCULATION = "calculation"
+IMPORT = "import"
+
+# (方法, 路径正则, 类别)，按顺序匹配；没有匹配的 GET 归为 read，其他请求不限制
+RULES: List[Tuple[str, "re.Pattern", Optional[str]]] = [
+    # 监控和统计接口不限制，过载时也要能看到状态
+    ("GET", re.compile(r"^/metrics$|^/api/[\w-]+/stats$|^/api/profiler/"), None),
+    ("POST", re.compile(r"^/api/(import-products|import-stock|sales/import|sales/batch|arrivals/import)$"), IMPORT),
+    ("POST", re.compile(r"^/api/(products/batch-delete|arrivals/batch-delete|arrivals/resync-products|reset-database)$"), IMPORT),
+    ("POST", re.compile(r"^/api/(maintenance/archive-sales|analytics/snapshot|changes/compact)$"), IMPORT),
+    # 按 ID 删除与批量删除同样限流：删除商品要级联删除它的销量、到货和采购建议
+    ("DELETE", re.compile(r"^/api/(products|arrivals|sales)/\d+$"), IMPORT),
+    ("POST", re.compile(r"^/api/(calculate-order|export/calculation)$"), CALCULATION),
+    ("GET", re.compile(r"^/api/export/|^/api/analytics/(?!snapshot$)"), CALCULATION),
+]
+
+
+class Rejected(Exception):
+    def __init__(self, lane: "Lane", reason: str):
+        self.lane = lane
+        self.reason = reason
+
+
+class Lane:
+    __slots__ = ("name", "priority", "limit", "queue_size", "active", "waiters", "service_seconds",
+                 "admitted", "rejected")
+
+    def __init__(self, name: str, priority: int, limit: int, queue_size: int):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # 最近请求执行时间的指数移动平均，用来估计 Retry-After
+        self.service_seconds = 1.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_seconds * (len(self.waiters) + 1) / self.limit))
+
+
+class AdmissionController:
+    """各类别的并发计数和等待队列，只在事件循环线程中访问，不需要加锁"""
+
+    def __init__(self, lanes: List[Lane], queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self._by_priority = sorted(lanes, key=lambda lane: lane.priority)
+        self._queue_timeout = queue_timeout
+
+    def classify(self, method: str, path: str) -> Optional[Lane]:
+        for rule_method, pattern, name in RULES:
+            if method == rule_method and pattern.search(path):
+                return self.lanes.get(name) if name else None
+        return self.lanes.get(READ) if method == "GET" else None
+
+    def _blocked(self, lane: Lane) -> bool:
+        # 优先级更高的类别有请求在排队时，低优先级的类别不开始新请求
+        return any(other.waiters for other in self._by_priority if other.priority < lane.priority)
+
+    def _publish(self, lane: Lane):
+        metrics.ADMISSION_ACTIVE.set(lane.name, value=lane.active)
+        metrics.ADMISSION_QUEUED.set(lane.name, value=len(lane.waiters))
+
+    async def acquire(self, lane: Lane):
+        if lane.active < lane.limit and not lane.waiters and not self._blocked(lane):
+            lane.active += 1
+            lane.admitted += 1
+            self._publish(lane)
+            metrics.ADMISSION_WAIT.observe(0.0, lane.name)
+            return
+        if len(lane.waiters) >= lane.queue_size:
+            raise Rejected(lane, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        self._publish(lane)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self._queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # 超时的同时刚好被放行：占用的名额要还回去
+                self.release(lane, 0.0)
+            else:
+                waiter.cancel()
+                lane.waiters.remove(waiter)
+                self._publish(lane)
+                self._dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Rejected(lane, "timeout") from None
+        metrics.ADMISSION_WAIT.observe(time.perf_counter() - started, lane.name)
+
+    def release(self, lane: Lane, elapsed: float):
+        lane.active -= 1
+        if elapsed:
+            lane.service_seconds = 0.8 * lane.service_seconds + 0.2 * elapsed
+        self._publish(lane)
+        self._dispatch()
+
+    def _dispatch(self):
+        # 按优先级放行排队的请求；放行时直接占用名额，避免被新来的请求抢走
+        for lane in self._by_priority:
+            while lane.waiters and lane.active < lane.limit and not self._blocked(lane):
+                waiter = lane.waiters.popleft()
+                if waiter.done():
+                    continue
+                lane.active += 1
+                lane.admitted += 1
+                waiter.set_result(None)
+                self._publish(lane)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            lane.name: {
+                "priority": lane.priority,
+                "limit": lane.limit,
+                "queue_size": lane.queue_size,
+                "active": lane.active,
+                "queued": len(lane.waiters),
+                "admitted": lane.admitted,
+                "rejected": lane.rejected,
+                "avg_service_seconds": round(lane.service_seconds, 4),
+                "retry_after": lane.retry_after(),
+            }
+            for lane in self._by_priority
+        }
+
+
+admission = AdmissionController([
+    Lane(READ, 0, ADMISSION_READ_LIMIT, ADMISSION_READ_QUEUE),
+    Lane(CALCULATION, 1, ADMISSION_CALCULATION_LIMIT, ADMISSION_CALCULATION_QUEUE),
+    Lane(IMPORT, 2, ADMISSION_IMPORT_LIMIT, ADMISSION_IMPORT_QUEUE),
+])
+
+
+class AdmissionMiddleware:
+    """纯 ASGI 中间件：按方法和路径分类，名额占用到响应体发送完（包括流式导出）为止"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        lane = None
+        if ADMISSION_ENABLED and scope["type"] == "http":
+            lane = self.controller.classify(scope["method"], scope["path"])
+        if lane is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(lane)
+        except Rejected as e:
+            lane.rejected += 1
+            metrics.ADMISSION_REJECTED.inc(lane.name, e.reason)
+            retry_after = lane.retry_after()
+            logger.warning("准入控制拒绝 %s %s（类别 %s，%s），建议 %s 秒后重试",
+                           scope["method"], scope["path"], lane.name, e.reason, retry_after)
+            response = JSONResponse(
+                {"detail": "服务繁忙，请稍后重试", "class": lane.name, "reason": e.reason},
+                status_code=429, headers={"Retry-After": str(retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(lane, time.perf_counter() - start)
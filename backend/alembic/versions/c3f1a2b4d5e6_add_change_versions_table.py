@@ -0,0 +1,36 @@
+"""add change_versions table
+
+Revision ID: c3f1a2b4d5e6
+Revises: add_product_fields_arrivals, merge_heads_revision
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a2b4d5e6'
+down_revision: Union[str, Sequence[str], None] = ('add_product_fields_arrivals', 'merge_heads_revision')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the per-table change counters used to invalidate in-process caches."""
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    if 'change_versions' not in inspector.get_table_names():
+        op.create_table('change_versions',
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False, server_default='0'),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade() -> None:
+    """Drop the change counters table."""
+    op.drop_table('change_versions')
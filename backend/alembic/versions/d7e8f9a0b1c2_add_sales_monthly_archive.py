@@ -0,0 +1,46 @@
+"""add sales_monthly archive table and sales (product_id, date) index
+
+Revision ID: d7e8f9a0b1c2
+Revises: c3f1a2b4d5e6
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e8f9a0b1c2'
+down_revision: Union[str, None] = 'c3f1a2b4d5e6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the monthly sales archive and the hot-path index on sales."""
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    if 'sales_monthly' not in inspector.get_table_names():
+        op.create_table('sales_monthly',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.Date(), nullable=False),
+            sa.Column('quantity', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('days', sa.Integer(), nullable=False, server_default='0'),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('product_id', 'month', name='uq_sales_monthly_product_month')
+        )
+        op.create_index(op.f('ix_sales_monthly_id'), 'sales_monthly', ['id'], unique=False)
+    if 'ix_sales_product_date' not in {index['name'] for index in inspector.get_indexes('sales')}:
+        op.create_index('ix_sales_product_date', 'sales', ['product_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    """Drop the archive table and the index."""
+    op.drop_index('ix_sales_product_date', table_name='sales')
+    op.drop_index(op.f('ix_sales_monthly_id'), table_name='sales_monthly')
+    op.drop_table('sales_monthly')
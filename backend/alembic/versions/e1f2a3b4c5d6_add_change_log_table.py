@@ -0,0 +1,45 @@
+"""add change_log table
+
+Revision ID: e1f2a3b4c5d6
+Revises: d7e8f9a0b1c2
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f2a3b4c5d6'
+down_revision: Union[str, None] = 'd7e8f9a0b1c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the change log read by the /api/changes feed."""
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    if 'change_log' not in inspector.get_table_names():
+        op.create_table('change_log',
+            sa.Column('seq', sa.Integer(), nullable=False),
+            sa.Column('entity', sa.String(), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=True),
+            sa.Column('op', sa.String(), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('seq'),
+            sqlite_autoincrement=True
+        )
+        op.create_index('ix_change_log_entity', 'change_log', ['entity', 'entity_id'], unique=False)
+        op.create_index('ix_change_log_created_at', 'change_log', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Drop the change log."""
+    op.drop_index('ix_change_log_created_at', table_name='change_log')
+    op.drop_index('ix_change_log_entity', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,63 @@
+"""add suggestions tables
+
+Revision ID: f2a3b4c5d6e7
+Revises: e1f2a3b4c5d6
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a3b4c5d6e7'
+down_revision: Union[str, None] = 'e1f2a3b4c5d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create the precomputed suggestions table and the dirty-product queue."""
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    tables = inspector.get_table_names()
+    if 'suggestions' not in tables:
+        op.create_table('suggestions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('order_date', sa.Date(), nullable=False),
+            sa.Column('order_quantity', sa.Float(), nullable=False),
+            sa.Column('expected_date', sa.Date(), nullable=False),
+            sa.Column('estimated_sales', sa.Float(), nullable=True),
+            sa.Column('median_daily_sales', sa.Float(), nullable=True),
+            sa.Column('reference_days', sa.Integer(), nullable=False),
+            sa.Column('current_stock', sa.Float(), nullable=False),
+            sa.Column('in_transit_stock', sa.Float(), nullable=False),
+            sa.Column('message', sa.String(), nullable=True),
+            sa.Column('sales_data', sa.Text(), nullable=True),
+            sa.Column('computed_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('product_id', 'order_date', name='uq_suggestions_product_date')
+        )
+        op.create_index('ix_suggestions_order_date', 'suggestions', ['order_date'], unique=False)
+    if 'suggestion_dirty' not in tables:
+        op.create_table('suggestion_dirty',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=True),
+            sa.Column('marked_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sqlite_autoincrement=True
+        )
+        op.create_index('ix_suggestion_dirty_product_id', 'suggestion_dirty', ['product_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Drop the suggestions tables."""
+    op.drop_index('ix_suggestion_dirty_product_id', table_name='suggestion_dirty')
+    op.drop_table('suggestion_dirty')
+    op.drop_index('ix_suggestions_order_date', table_name='suggestions')
+    op.drop_table('suggestions')
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+
+import models
+from catalog import catalog
+from database import read_engine
+from retention import next_month
+
+logger = logging.getLogger(__name__)
+
+# 分析快照目录：按月分区的 Parquet 文件，分析查询只读这里，不访问生产数据库
+ANALYTICS_SNAPSHOT_DIR = os.path.abspath(os.getenv("ANALYTICS_SNAPSHOT_DIR", "./analytics_snapshot"))
+# 自动增量快照的间隔分钟数，0 表示只通过接口手动生成
+ANALYTICS_SNAPSHOT_INTERVAL_MINUTES = float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL_MINUTES", "60"))
+
+MANIFEST = "manifest.json"
+GROUP_KEYS = ("product", "week", "month")
+
+_snapshot_lock = threading.Lock()
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _pyarrow():
+    # pyarrow 只在生成快照和分析查询时需要，按需导入
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("分析功能需要安装 pyarrow") from e
+    return pa, pc, pq
+
+
+def _month_key(column):
+    if read_engine.dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+
+# 每个表：导出的列、分区依据的日期列、用于判断分区是否变化的指纹聚合
+def _sales_source():
+    s = models.Sales
+    return {
+        "columns": {"id": s.id, "product_id": s.product_id, "date": s.date, "quantity": s.quantity},
+        "date_column": s.date,
+        "fingerprint": (func.count(s.id), func.sum(s.id), func.sum(s.product_id), func.sum(s.quantity),
+                        func.sum(s.id * s.quantity)),
+    }
+
+
+def _arrivals_source():
+    a = models.Arrival
+    return {
+        "columns": {"id": a.id, "product_id": a.product_id, "order_date": a.order_date,
+                    "expected_date": a.expected_date, "quantity": a.quantity, "status": a.status},
+        "date_column": a.order_date,
+        "fingerprint": (func.count(a.id), func.sum(a.id), func.sum(a.quantity), func.max(a.updated_at)),
+    }
+
+
+SOURCES = {"sales": _sales_source, "arrivals": _arrivals_source}
+
+_ARROW_TYPES = {
+    "id": "int64", "product_id": "int64", "quantity": "float64", "days": "int64",
+    "date": "date32", "order_date": "date32", "expected_date": "date32", "month": "date32",
+    "status": "string", "code": "string", "name": "string", "unit": "string",
+}
+
+
+def _to_table(columns: Dict[str, list]):
+    pa, _, _ = _pyarrow()
+    return pa.table({
+        name: pa.array(values, type=getattr(pa, _ARROW_TYPES[name])())
+        for name, values in columns.items()
+    })
+
+
+def _write_table(table, path):
+    _, _, pq = _pyarrow()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def _load_manifest() -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(ANALYTICS_SNAPSHOT_DIR, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_manifest(manifest):
+    path = os.path.join(ANALYTICS_SNAPSHOT_DIR, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _snapshot_table(conn, name, previous: Dict[str, list], full: bool) -> Dict[str, Any]:
+    source = SOURCES[name]()
+    month = _month_key(source["date_column"]).label("month")
+    fingerprints = {
+        key: [str(value) for value in values]
+        for key, *values in conn.execute(
+            select(month, *source["fingerprint"]).where(source["date_column"].isnot(None)).group_by(month)
+        )
+    }
+
+    written = 0
+    for key, fingerprint in fingerprints.items():
+        if not full and previous.get(key) == fingerprint:
+            continue
+        start = datetime.strptime(key, "%Y-%m").date()
+        rows = conn.execute(
+            select(*source["columns"].values()).where(
+                source["date_column"] >= start, source["date_column"] < next_month(start)
+            )
+        ).all()
+        columns = {column: [row[i] for row in rows] for i, column in enumerate(source["columns"])}
+        _write_table(_to_table(columns), os.path.join(ANALYTICS_SNAPSHOT_DIR, name, f"month={key}", "part.parquet"))
+        written += 1
+
+    stale = set(previous)
+    if full:
+        # 全量重建时也清理清单中没有记录的分区目录（清单丢失或损坏时留下的）
+        table_dir = os.path.join(ANALYTICS_SNAPSHOT_DIR, name)
+        if os.path.isdir(table_dir):
+            stale.update(entry[len("month="):] for entry in os.listdir(table_dir) if entry.startswith("month="))
+    removed = sorted(key for key in stale if key not in fingerprints)
+    for key in removed:
+        shutil.rmtree(os.path.join(ANALYTICS_SNAPSHOT_DIR, name, f"month={key}"), ignore_errors=True)
+    return {"fingerprints": fingerprints, "written": written,
+            "unchanged": len(fingerprints) - written, "removed": len(removed)}
+
+
+def build_snapshot(full: bool = False) -> Dict[str, Any]:
+    """增量导出销量和到货记录到按月分区的 Parquet 文件。
+
+    每个月分区用一条 GROUP BY 查询算出的聚合指纹判断是否变化，只重写变化的月份；
+    同时导出商品表和归档的月汇总（数据量小，每次全量）。full=True 时重写全部分区。
+    """
+    _pyarrow()
+    with _snapshot_lock:
+        # full=True 只是强制重写，仍要用旧清单找出已经没有数据的月份分区并删除
+        manifest = _load_manifest() or {"partitions": {}}
+        summary: Dict[str, Any] = {}
+        with read_engine.connect() as conn:
+            for name in SOURCES:
+                result = _snapshot_table(conn, name, manifest["partitions"].get(name, {}), full)
+                manifest["partitions"][name] = result.pop("fingerprints")
+                summary[name] = result
+
+            archived = conn.execute(
+                select(models.SalesMonthly.product_id, models.SalesMonthly.month,
+                       models.SalesMonthly.quantity, models.SalesMonthly.days)
+            ).all()
+        _write_table(
+            _to_table({column: [row[i] for row in archived]
+                       for i, column in enumerate(("product_id", "month", "quantity", "days"))}),
+            os.path.join(ANALYTICS_SNAPSHOT_DIR, "sales_monthly.parquet"),
+        )
+
+        products = catalog.refresh().all()
+        _write_table(
+            _to_table({
+                "id": [p.id for p in products],
+                "code": [p.code for p in products],
+                "name": [p.name for p in products],
+                "unit": [p.unit for p in products],
+            }),
+            os.path.join(ANALYTICS_SNAPSHOT_DIR, "products.parquet"),
+        )
+
+        manifest["snapshot_at"] = datetime.now().isoformat(timespec="seconds")
+        _save_manifest(manifest)
+        summary["snapshot_at"] = manifest["snapshot_at"]
+        logger.info("分析快照已更新: %s", summary)
+        return summary
+
+
+def snapshot_status() -> Optional[Dict[str, Any]]:
+    manifest = _load_manifest()
+    if manifest is None:
+        return None
+    return {
+        "snapshot_at": manifest.get("snapshot_at"),
+        "partitions": {name: sorted(months) for name, months in manifest["partitions"].items()},
+    }
+
+
+async def run_periodic_snapshot():
+    while True:
+        try:
+            await run_in_threadpool(build_snapshot)
+        except Exception:
+            logger.exception("生成分析快照出错")
+        await asyncio.sleep(ANALYTICS_SNAPSHOT_INTERVAL_MINUTES * 60)
+
+
+def _parse_group_by(group_by: str) -> List[str]:
+    keys = [key.strip() for key in group_by.split(",") if key.strip()]
+    if not keys or any(key not in GROUP_KEYS for key in keys) or ("week" in keys and "month" in keys):
+        raise ValueError("group_by 只能是 product、week、month 或 product 与 week/month 的组合，如 product,month")
+    return keys
+
+
+def _read_partitions(name, columns, date_field, start_date, end_date, product_ids):
+    _, _, pq = _pyarrow()
+    path = os.path.join(ANALYTICS_SNAPSHOT_DIR, name)
+    filters = []
+    # 先按分区目录名裁剪月份，再按日期过滤
+    if start_date:
+        filters += [("month", ">=", start_date.strftime("%Y-%m")), (date_field, ">=", start_date)]
+    if end_date:
+        filters += [("month", "<=", end_date.strftime("%Y-%m")), (date_field, "<=", end_date)]
+    if product_ids:
+        filters.append(("product_id", "in", list(product_ids)))
+    if not os.path.isdir(path) or not os.listdir(path):
+        return None
+    return pq.read_table(path, columns=columns, filters=filters or None, memory_map=True)
+
+
+def _group(table, date_field, keys, value_column, count_column=None):
+    """按 product_id 和/或 period 分组求和，返回 {(product_id, period): [数量, 记录数]}"""
+    _, pc, _ = _pyarrow()
+    group_columns = []
+    if "product" in keys:
+        group_columns.append("product_id")
+    period = next((key for key in keys if key in ("week", "month")), None)
+    if period:
+        table = table.append_column(
+            "period", pc.floor_temporal(table[date_field], unit=period, week_starts_monday=True)
+        )
+        group_columns.append("period")
+    aggregations = [(value_column, "sum")]
+    aggregations.append((count_column, "sum") if count_column else (value_column, "count"))
+    grouped = table.group_by(group_columns).aggregate(aggregations).to_pylist()
+
+    result = {}
+    for row in grouped:
+        key = (row.get("product_id") if "product" in keys else None, row.get("period"))
+        result[key] = [row[f"{value_column}_sum"] or 0,
+                       row[f"{count_column}_sum" if count_column else f"{value_column}_count"]]
+    return result
+
+
+def aggregate(name: str, group_by: str = "product", start_date: Optional[date] = None,
+              end_date: Optional[date] = None, product_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """从快照读取销量（sales）或到货（arrivals，按下单日期）并分组汇总。
+
+    销量按 product 或 month 分组时会并入已归档的月汇总；按 week 分组时归档月份无法拆分，不计入。
+    """
+    _, _, pq = _pyarrow()
+    keys = _parse_group_by(group_by)
+    manifest = _load_manifest()
+    if manifest is None:
+        raise FileNotFoundError("尚未生成分析快照")
+
+    date_field = "date" if name == "sales" else "order_date"
+    table = _read_partitions(name, ["product_id", date_field, "quantity"], date_field,
+                             start_date, end_date, product_ids)
+    groups = _group(table, date_field, keys, "quantity") if table is not None else {}
+
+    if name == "sales" and "week" not in keys:
+        filters = []
+        if start_date:
+            filters.append(("month", ">=", start_date.replace(day=1)))
+        if end_date:
+            filters.append(("month", "<=", end_date))
+        if product_ids:
+            filters.append(("product_id", "in", list(product_ids)))
+        archived = pq.read_table(os.path.join(ANALYTICS_SNAPSHOT_DIR, "sales_monthly.parquet"),
+                                 filters=filters or None, memory_map=True)
+        if archived.num_rows:
+            for key, (quantity, records) in _group(archived, "month", keys, "quantity", "days").items():
+                total = groups.setdefault(key, [0, 0])
+                total[0] += quantity
+                total[1] += records
+
+    products = {
+        row["id"]: row
+        for row in pq.read_table(os.path.join(ANALYTICS_SNAPSHOT_DIR, "products.parquet"), memory_map=True).to_pylist()
+    }
+    rows = []
+    for (product_id, period), (quantity, records) in sorted(
+        groups.items(), key=lambda item: (item[0][1] or date.min, item[0][0] or 0)
+    ):
+        row: Dict[str, Any] = {}
+        if "product" in keys:
+            product = products.get(product_id, {})
+            row.update(product_id=product_id, product_code=product.get("code"), product_name=product.get("name"))
+        if period is not None:
+            row["period"] = period
+        row.update(quantity=round(quantity, 4), records=records)
+        rows.append(row)
+    return {"snapshot_at": manifest.get("snapshot_at"), "group_by": keys, "rows": rows}
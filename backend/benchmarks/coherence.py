@@ -0,0 +1,175 @@
+"""多进程一致性检查：以 WORKERS 个进程启动应用，每次写入后从各个进程反复读取，确认没有进程返回旧数据。
+
+每个读请求使用新连接，由内核分配到不同的工作进程。检查项：
+商品目录（采购计算中的商品名称）、销量序列（采购计算中的销量）、列表接口的 ETag（写入后不能再返回 304）、
+后台删除任务的状态查询，以及只有一个主进程。
+
+    python -m benchmarks.coherence --workers 4
+    python -m benchmarks.coherence --workers 4 --no-shared   # 关闭共享计数器，对照 ETag 过期的情况
+
+VERSION_MIRROR_TTL 设为 60 秒，计数器镜像只能靠共享内存发现其他进程的写入。发现不一致时退出码为 1。
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def start_server(backend_dir, workers, port, shared, log_path):
+    env = dict(os.environ, WORKERS=str(workers), PORT=str(port), VERSION_MIRROR_TTL="60", LOG_LEVEL="WARNING")
+    for name in ("SALES_ARCHIVE_INTERVAL_HOURS", "ANALYTICS_SNAPSHOT_INTERVAL_MINUTES",
+                 "CHANGE_LOG_COMPACT_INTERVAL_MINUTES", "SUGGESTIONS_REFRESH_SECONDS"):
+        env.setdefault(name, "0")
+    if not shared:
+        env["VERSION_SHARED_FILE"] = ""
+    with open(log_path, "w") as log:
+        return subprocess.Popen([sys.executable, os.path.join(backend_dir, "main.py")],
+                                cwd=os.path.dirname(log_path), env=env, stdout=subprocess.DEVNULL, stderr=log)
+
+
+class Checker:
+    def __init__(self, base_url, reads):
+        import httpx
+
+        # 不复用连接，每个请求重新连接，分散到各个工作进程
+        self.client = httpx.Client(base_url=base_url, timeout=30,
+                                   limits=httpx.Limits(max_keepalive_connections=0))
+        self.reads = reads
+        self.results = {}
+
+    def wait_for_workers(self, workers, timeout):
+        deadline = time.monotonic() + timeout
+        pids = {}
+        while time.monotonic() < deadline:
+            try:
+                stats = self.client.get("/api/workers/stats").json()
+            except Exception:
+                time.sleep(0.2)
+                continue
+            pids[stats["pid"]] = stats
+            if len(pids) >= workers:
+                break
+        return pids
+
+    def check(self, name, request, ok):
+        """写入后发出 reads 个读请求，ok(response) 为 False 的计为读到旧数据"""
+        stale = []
+        for _ in range(self.reads):
+            response = request()
+            if not ok(response):
+                stale.append(response.status_code)
+        self.results[name] = {"reads": self.reads, "stale": len(stale), "stale_statuses": sorted(set(stale))}
+
+    def warm(self, path, **kwargs):
+        # 写入前让每个进程都缓存上当前版本
+        for _ in range(self.reads):
+            self.client.get(path, **kwargs)
+        return self.client.get(path, **kwargs).headers.get("etag")
+
+
+def run_checks(checker):
+    client = checker.client
+    today = (utc_now() + timedelta(hours=8)).date()
+    code = f"COH{os.getpid()}{int(time.time())}"
+
+    def calculate(product_id):
+        return client.post("/api/calculate-order", json={
+            "order_date": utc_now().isoformat(),
+            "items": [{"product_id": product_id, "current_stock": 0, "in_transit_stock": 0, "reference_days": 5}],
+        })
+
+    etag = checker.warm("/api/products")
+    product = client.post("/api/products/", json={"code": code, "name": "一致性", "unit": "个"}).json()
+    product_id = product["id"]
+    checker.check("products_etag_after_create",
+                  lambda: client.get("/api/products", headers={"If-None-Match": etag}),
+                  lambda r: r.status_code == 200 and any(p["code"] == code for p in r.json()))
+    checker.check("catalog_after_create", lambda: calculate(product_id),
+                  lambda r: r.status_code == 200 and r.json()[0].get("product_code") == code)
+
+    etag = checker.warm("/api/products")
+    client.put(f"/api/products/{product_id}", json={"code": code, "name": "一致性-改名", "unit": "个"})
+    checker.check("products_etag_after_update",
+                  lambda: client.get("/api/products", headers={"If-None-Match": etag}),
+                  lambda r: r.status_code == 200)
+    checker.check("catalog_after_update", lambda: calculate(product_id),
+                  lambda r: r.status_code == 200 and r.json()[0].get("product_name") == "一致性-改名")
+
+    etag = checker.warm("/api/sales")
+    sales_day = today - timedelta(days=1)
+    client.post("/api/sales", json={"product_id": product_id, "date": sales_day.isoformat(), "quantity": 7})
+    checker.check("sales_etag_after_create",
+                  lambda: client.get("/api/sales", headers={"If-None-Match": etag}),
+                  lambda r: r.status_code == 200)
+    checker.check("sales_store_after_create", lambda: calculate(product_id),
+                  lambda r: r.status_code == 200 and [sales_day.isoformat(), 7.0] in r.json()[0].get("sales_data", []))
+
+    etag = checker.warm("/api/arrivals")
+    client.post("/api/arrivals", json={"product_id": product_id, "order_date": today.isoformat(),
+                                       "expected_date": (today + timedelta(days=2)).isoformat(), "quantity": 3})
+    checker.check("arrivals_etag_after_create",
+                  lambda: client.get("/api/arrivals", headers={"If-None-Match": etag}),
+                  lambda r: r.status_code == 200 and any(a["product_id"] == product_id for a in r.json()))
+
+    job = client.post("/api/products/batch-delete", json={"product_ids": [product_id], "background": True}).json()
+    checker.check("delete_job_status", lambda: client.get(f"/api/products/delete-jobs/{job['job_id']}"),
+                  lambda r: r.status_code == 200)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--reads", type=int, default=40, help="每次写入后的读请求数")
+    parser.add_argument("--no-shared", action="store_true", help="关闭共享计数器文件")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    port = free_port()
+    log_path = os.path.join(tempfile.mkdtemp(prefix="po-coherence-"), "server.log")
+    server = start_server(os.path.abspath(args.backend_dir), args.workers, port, not args.no_shared, log_path)
+    try:
+        checker = Checker(f"http://127.0.0.1:{port}", args.reads)
+        workers = checker.wait_for_workers(args.workers, args.startup_timeout)
+        if not workers:
+            with open(log_path) as log:
+                raise SystemExit(f"服务没有启动：{log.read()[-2000:]}")
+        run_checks(checker)
+        # 检查结束后重新统计，确认读请求确实分散到了多个进程
+        seen = checker.wait_for_workers(args.workers, 10)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    leaders = [stats["pid"] for stats in seen.values() if stats["leader"]]
+    report = {
+        "workers": args.workers,
+        "workers_seen": len(seen),
+        "leaders": len(leaders),
+        "shared_counters": not args.no_shared,
+        "checks": checker.results,
+    }
+    # 所有进程都统计到时必须恰好有一个主进程
+    leaders_ok = len(leaders) == 1 if len(seen) == args.workers else len(leaders) <= 1
+    report["ok"] = leaders_ok and all(result["stale"] == 0 for result in checker.results.values())
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,124 @@
+"""混合负载并发基准：整库采购计算进行时，测量轻量列表请求的延迟。
+
+在临时目录中创建独立的 SQLite 数据库，通过 ASGI 直接驱动应用，不需要启动 uvicorn。
+
+    python -m benchmarks.concurrency --products 300 --days 60 --duration 10
+    python -m benchmarks.concurrency --backend-dir /path/to/other/checkout/backend
+
+--backend-dir 可以指向另一个版本的 backend 目录，便于对比改动前后的结果。
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_app(backend_dir):
+    # 数据库地址是相对路径，先切换到临时目录再导入应用
+    os.chdir(tempfile.mkdtemp(prefix="po-bench-"))
+    sys.path.insert(0, backend_dir)
+    import main
+    # 表结构在启动事件中由迁移创建，预置数据在启动之前，先手动执行一次（旧版本在导入时已经建表）
+    ensure_schema = getattr(main, "ensure_schema", None)
+    if ensure_schema is not None:
+        ensure_schema()
+    return main
+
+
+def seed(main, products, days):
+    import models
+    today = date.today()
+    with main.engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), [
+            {"id": i, "code": f"P{i:05d}", "name": f"商品{i}", "unit": "个",
+             "reference_days": 7, "current_stock": 0, "description": "T+2"}
+            for i in range(1, products + 1)
+        ])
+        conn.execute(models.Sales.__table__.insert(), [
+            {"product_id": i, "date": today - timedelta(days=d), "quantity": float((i * d) % 17)}
+            for i in range(1, products + 1) for d in range(1, days + 1)
+        ])
+
+
+async def run(main, products, duration, heavy_workers):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    payload = {
+        "order_date": datetime.now().isoformat(),
+        "items": [
+            {"product_id": i, "current_stock": 0, "in_transit_stock": 0, "reference_days": 7}
+            for i in range(1, products + 1)
+        ],
+    }
+    light_latencies = []
+    heavy_latencies = []
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def heavy():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.post("/api/calculate-order", json=payload)
+                response.raise_for_status()
+                heavy_latencies.append(time.perf_counter() - start)
+
+        async def light():
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                start = time.perf_counter()
+                response = await client.get("/api/products", params={"code": f"P{i % products:05d}"})
+                response.raise_for_status()
+                light_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(light(), *(heavy() for _ in range(heavy_workers)))
+
+    def summary(latencies):
+        ms = [value * 1000 for value in latencies]
+        return {
+            "count": len(ms),
+            "p50_ms": percentile(ms, 50),
+            "p95_ms": percentile(ms, 95),
+            "max_ms": max(ms) if ms else None,
+            "mean_ms": statistics.mean(ms) if ms else None,
+        }
+
+    return {"light_reads": summary(light_latencies), "calculate_order": summary(heavy_latencies)}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--heavy-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    # 应用里的调试 print 会淹没结果，运行期间丢弃标准输出
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        app_module = load_app(os.path.abspath(args.backend_dir))
+        seed(app_module, args.products, args.days)
+        result = asyncio.run(run(app_module, args.products, args.duration, args.heavy_workers))
+    result["params"] = vars(args)
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main_cli()
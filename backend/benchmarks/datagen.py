@@ -0,0 +1,164 @@
+"""确定性的基准数据生成器：商品目录、销量、到货记录和四种导入文件。
+
+同样的参数和种子总是生成同样的数据；日期都相对于 today（默认当天），
+因此不同日期运行时数据的形状和采购计算的结果保持一致。
+"""
+import io
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+UNITS = ("个", "箱", "袋", "瓶", "kg")
+
+
+class DatasetSpec:
+    __slots__ = ("products", "days", "arrival_ratio", "arrivals_per_product", "seed", "today")
+
+    def __init__(self, products: int = 500, days: int = 90, arrival_ratio: float = 0.3,
+                 arrivals_per_product: int = 3, seed: int = 42, today: Optional[date] = None):
+        self.products = products
+        self.days = days
+        self.arrival_ratio = arrival_ratio  # 有到货记录的商品比例
+        self.arrivals_per_product = arrivals_per_product
+        self.seed = seed
+        self.today = today or date.today()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def product_code(i: int) -> str:
+    return f"P{i:06d}"
+
+
+def products(spec: DatasetSpec) -> List[Dict[str, Any]]:
+    rng = random.Random(spec.seed)
+    return [
+        {"id": i, "code": product_code(i), "name": f"商品{i}", "unit": rng.choice(UNITS),
+         "specification": f"规格{rng.randint(1, 20)}", "description": f"T+{rng.randint(0, 5)}",
+         "reference_days": rng.choice((5, 7, 10, 14, 30)), "current_stock": float(rng.randint(0, 200))}
+        for i in range(1, spec.products + 1)
+    ]
+
+
+def _daily_profile(rng: random.Random):
+    # 每个商品有自己的基础销量、周波动和缺失率
+    base = rng.uniform(0, 40)
+    weekly = [rng.uniform(0.6, 1.4) for _ in range(7)]
+    missing = rng.uniform(0, 0.2)
+    return base, weekly, missing
+
+
+def sales(spec: DatasetSpec) -> List[Dict[str, Any]]:
+    rng = random.Random(spec.seed + 1)
+    rows = []
+    for i in range(1, spec.products + 1):
+        base, weekly, missing = _daily_profile(rng)
+        for d in range(1, spec.days + 1):
+            if rng.random() < missing:
+                continue
+            day = spec.today - timedelta(days=d)
+            rows.append({"product_id": i, "date": day,
+                         "quantity": float(round(base * weekly[day.weekday()] * rng.uniform(0.5, 1.5)))})
+    return rows
+
+
+def arrivals(spec: DatasetSpec) -> List[Dict[str, Any]]:
+    rng = random.Random(spec.seed + 2)
+    rows = []
+    for i in range(1, spec.products + 1):
+        if rng.random() >= spec.arrival_ratio:
+            continue
+        for _ in range(spec.arrivals_per_product):
+            order_date = spec.today + timedelta(days=rng.randint(-20, 5))
+            rows.append({
+                "product_id": i, "product_code": product_code(i), "product_name": f"商品{i}",
+                "order_date": order_date, "expected_date": order_date + timedelta(days=rng.randint(1, 7)),
+                "quantity": float(rng.randint(10, 300)),
+                "status": rng.choice(("pending", "pending", "arrived", "cancelled")),
+            })
+    # 同一商品同一下单日期只保留一条（与手工录入的去重规则一致）
+    unique = {(row["product_id"], row["order_date"]): row for row in rows}
+    return list(unique.values())
+
+
+def seed_database(engine, spec: DatasetSpec) -> Dict[str, int]:
+    """把生成的数据批量写入数据库，返回各表行数"""
+    import models
+    data = {"products": products(spec), "sales": sales(spec), "arrivals": arrivals(spec)}
+    with engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), data["products"])
+        if data["sales"]:
+            conn.execute(models.Sales.__table__.insert(), data["sales"])
+        if data["arrivals"]:
+            conn.execute(models.Arrival.__table__.insert(), data["arrivals"])
+    return {name: len(rows) for name, rows in data.items()}
+
+
+def _xlsx(frame) -> bytes:
+    buffer = io.BytesIO()
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _date_column(day: date) -> str:
+    return f"{day.year}/{day.month}/{day.day}"
+
+
+def products_workbook(spec: DatasetSpec) -> bytes:
+    """商品导入文件：全部已有商品（改名，触发到货记录同步）加 10% 新商品"""
+    import pandas as pd
+    rows = products(spec)
+    extra = max(1, spec.products // 10)
+    return _xlsx(pd.DataFrame({
+        "商品编码": [row["code"] for row in rows] + [product_code(spec.products + i) for i in range(1, extra + 1)],
+        "商品名称": [row["name"] + "*" for row in rows] + [f"新商品{i}" for i in range(1, extra + 1)],
+        "单位": [row["unit"] for row in rows] + ["个"] * extra,
+        "规格": [row["specification"] for row in rows] + [None] * extra,
+        "预估天数": [row["reference_days"] for row in rows] + [7] * extra,
+        "描述": [row["description"] for row in rows] + ["T+1"] * extra,
+    }))
+
+
+def sales_workbook(spec: DatasetSpec, days: int = 7) -> bytes:
+    """销量导入文件：全部商品最近 days 天（含已有记录的更新）"""
+    import pandas as pd
+    rng = random.Random(spec.seed + 3)
+    columns = {"商品编码": [product_code(i) for i in range(1, spec.products + 1)]}
+    for d in range(days, 0, -1):
+        columns[_date_column(spec.today - timedelta(days=d - 1))] = [
+            rng.randint(0, 50) for _ in range(spec.products)
+        ]
+    return _xlsx(pd.DataFrame(columns))
+
+
+def stock_workbook(spec: DatasetSpec) -> bytes:
+    import pandas as pd
+    rng = random.Random(spec.seed + 4)
+    return _xlsx(pd.DataFrame({
+        "商品编码": [product_code(i) for i in range(1, spec.products + 1)],
+        "实时库存": [rng.randint(0, 500) for _ in range(spec.products)],
+    }))
+
+
+def arrivals_workbook(spec: DatasetSpec, days: int = 3) -> bytes:
+    """到货导入文件：有到货的商品未来 days 天的到货数量"""
+    import pandas as pd
+    rng = random.Random(spec.seed + 5)
+    codes = [product_code(i) for i in range(1, spec.products + 1) if rng.random() < spec.arrival_ratio]
+    columns = {"商品编码": codes}
+    for d in range(1, days + 1):
+        columns[_date_column(spec.today + timedelta(days=d))] = [rng.randint(1, 100) for _ in codes]
+    return _xlsx(pd.DataFrame(columns))
+
+
+def order_request(spec: DatasetSpec) -> Dict[str, Any]:
+    rng = random.Random(spec.seed + 6)
+    return {
+        "order_date": f"{spec.today.isoformat()}T02:00:00",
+        "items": [
+            {"product_id": i, "current_stock": float(rng.randint(0, 100)), "in_transit_stock": 0,
+             "reference_days": rng.choice((5, 7, 14))}
+            for i in range(1, spec.products + 1)
+        ],
+    }
@@ -0,0 +1,403 @@
+"""负载测试：按可配置的比例回放计划员的日常请求，按接口统计延迟分位数和吞吐量，逐级加压找出饱和点。
+
+请求类别：calculate（整库采购计算，集中在早上）、browse（带筛选条件的列表和单品销量浏览）、
+edit（修改单条销量）、import（定期导入销量文件）。请求按泊松过程发出（开环），不等前一个请求返回，
+延迟从计划发出的时刻算起，服务跟不上时排队时间会体现在延迟里。
+
+默认在临时目录中创建数据库并预置数据，通过 ASGI 直接驱动应用（负载生成器和应用在同一进程中，
+数值偏保守）；--url 指向已启动的服务时通过 HTTP 发送，不预置数据。两种方式都只调用现有接口，
+商品和销量记录也从接口读取，因此可以用同样的参数比较不同版本：
+
+    python -m benchmarks.loadtest --rates 5,10,20,40 --duration 20 --output base.json
+    python -m benchmarks.loadtest --mix morning --rates 2,4,8
+    python -m benchmarks.loadtest --mix calculate=1,browse=30,edit=5,import=0.5 --compare base.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --rates 10,20,40
+
+429（准入控制拒绝）单独计数，不算作错误。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from benchmarks import datagen
+from benchmarks.concurrency import load_app, percentile
+from benchmarks.suite import XLSX_MEDIA_TYPE, git_commit
+
+# 各类请求的相对权重；--mix 可以用名称选择，也可以写成 calculate=1,browse=20
+MIXES = {
+    "default": {"calculate": 1, "browse": 20, "edit": 5, "import": 0.2},
+    # 早上集中下单：计算占比高，导入前一天的销量
+    "morning": {"calculate": 5, "browse": 10, "edit": 1, "import": 1},
+    "browse": {"browse": 1},
+}
+
+# 浏览请求内部的比例：大部分是筛选后的小列表，偶尔打开完整销量列表
+BROWSE_WEIGHTS = {
+    "list_products_by_code": 6,
+    "list_products_by_name": 3,
+    "list_products": 2,
+    "list_arrivals_pending": 3,
+    "product_sales": 6,
+    "sales_rollup": 3,
+    "list_sales": 1,
+}
+
+# 饱和判定：成功吞吐量低于发送速率的这个比例、429 或错误比例超过阈值、或整体 p95 超过 --slo-ms
+SATURATION_THROUGHPUT = 0.9
+SATURATION_FAILURE_RATIO = 0.01
+
+
+def parse_mix(text):
+    if text in MIXES:
+        return dict(MIXES[text])
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in MIXES["default"]:
+            raise ValueError(f"未知请求类别: {name}（可选: {', '.join(MIXES['default'])}）")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Workload:
+    """从接口读取的商品和销量记录，按类别生成 (接口名称, 方法, 路径, httpx 请求参数)"""
+
+    def __init__(self, products, sales, today, rng):
+        self.products = products
+        self.sales = sales
+        self.today = today
+        self.rng = rng
+        self.order = {
+            "order_date": datetime.now().replace(microsecond=0).isoformat(),
+            "items": [
+                {"product_id": product["id"], "current_stock": product.get("current_stock") or 0,
+                 "in_transit_stock": 0, "reference_days": product.get("reference_days") or 7}
+                for product in products
+            ],
+        }
+        self.workbook = self._sales_workbook()
+        self._browse = list(BROWSE_WEIGHTS)
+        self._browse_weights = list(BROWSE_WEIGHTS.values())
+
+    def _sales_workbook(self):
+        """全部商品前一天的销量，和每天早上导入的文件形状一致"""
+        import pandas as pd
+
+        day = self.today - timedelta(days=1)
+        buffer = io.BytesIO()
+        pd.DataFrame({
+            "商品编码": [product["code"] for product in self.products],
+            f"{day.year}/{day.month}/{day.day}": [self.rng.randint(0, 50) for _ in self.products],
+        }).to_excel(buffer, index=False)
+        return buffer.getvalue()
+
+    def calculate(self):
+        return "calculate_order", "POST", "/api/calculate-order", {"json": self.order}
+
+    def browse(self):
+        name = self.rng.choices(self._browse, self._browse_weights)[0]
+        product = self.rng.choice(self.products)
+        if name == "list_products_by_code":
+            return name, "GET", "/api/products", {"params": {"code": product["code"]}}
+        if name == "list_products_by_name":
+            return name, "GET", "/api/products", {"params": {"name": product["name"]}}
+        if name == "list_products":
+            return name, "GET", "/api/products", {}
+        if name == "list_arrivals_pending":
+            return name, "GET", "/api/arrivals", {"params": {"status": "pending"}}
+        if name == "product_sales":
+            start = (self.today - timedelta(days=60)).isoformat()
+            return name, "GET", f"/api/sales/product/{product['id']}", {"params": {"start_date": start}}
+        if name == "sales_rollup":
+            return name, "GET", "/api/sales/rollup", {"params": {"product_id": product["id"], "granularity": "week"}}
+        return name, "GET", "/api/sales", {}
+
+    def edit(self):
+        if not self.sales:
+            return self.browse()
+        sale = self.rng.choice(self.sales)
+        body = {"product_id": sale["product_id"], "date": sale["date"], "quantity": float(self.rng.randint(0, 50))}
+        return "edit_sale", "PUT", f"/api/sales/{sale['id']}", {"json": body}
+
+    def import_sales(self):
+        files = {"file": ("sales.xlsx", self.workbook, XLSX_MEDIA_TYPE)}
+        return "import_sales", "POST", "/api/sales/import", {"files": files}
+
+    def generator(self, kind):
+        return {"calculate": self.calculate, "browse": self.browse, "edit": self.edit,
+                "import": self.import_sales}[kind]
+
+
+async def discover(client, sample, rng):
+    """读取商品列表，并抽样读取部分商品最近两周的销量记录作为修改对象"""
+    response = await client.get("/api/products")
+    response.raise_for_status()
+    products = response.json()
+    if not products:
+        raise SystemExit("数据库中没有商品，先导入数据或去掉 --url 使用预置数据")
+    today = date.today()
+    sales = []
+    for product in rng.sample(products, min(sample, len(products))):
+        response = await client.get(f"/api/sales/product/{product['id']}",
+                                    params={"start_date": (today - timedelta(days=14)).isoformat()})
+        response.raise_for_status()
+        sales.extend(row for row in response.json() if row.get("id") is not None)
+    return products, sales, today
+
+
+async def send(client, request, scheduled, records, timeout):
+    name, method, path, kwargs = request
+    try:
+        response = await asyncio.wait_for(client.request(method, path, **kwargs), timeout)
+        status = response.status_code
+    except asyncio.TimeoutError:
+        status = "timeout"
+    except Exception as e:
+        status = type(e).__name__
+    records.append((name, scheduled, time.perf_counter(), status))
+
+
+async def run_step(client, workload, mix, rate, duration, max_inflight, timeout, rng):
+    """以 rate 次/秒的平均速率发送 duration 秒，等所有请求结束后返回本轮统计"""
+    kinds = list(mix)
+    weights = list(mix.values())
+    records, tasks = [], set()
+    dropped = 0
+    start = time.perf_counter()
+    next_at = start
+    while True:
+        next_at += rng.expovariate(rate)
+        if next_at - start >= duration:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # 在途请求过多时不再发送，避免负载生成器自己耗尽内存；丢弃的请求单独计数
+        if len(tasks) >= max_inflight:
+            dropped += 1
+            continue
+        request = workload.generator(rng.choices(kinds, weights)[0])()
+        task = asyncio.create_task(send(client, request, next_at, records, timeout))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return summarize_step(records, rate, duration, time.perf_counter() - start, dropped)
+
+
+def _latencies(records):
+    ms = [(finished - scheduled) * 1000 for _, scheduled, finished, _ in records]
+    return {
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+    }
+
+
+def summarize_step(records, rate, duration, elapsed, dropped):
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record[0]].append(record)
+
+    def counts(rows):
+        ok = [row for row in rows if isinstance(row[3], int) and row[3] < 400]
+        rejected = sum(1 for row in rows if row[3] == 429)
+        return {
+            "count": len(rows),
+            "ok": len(ok),
+            "rejected": rejected,
+            "errors": len(rows) - len(ok) - rejected,
+            # 吞吐量按发送时长计算：排空在途请求的时间不计入，跟不上时吞吐量会低于发送速率
+            "throughput_rps": len(ok) / duration,
+            # 延迟只统计成功的请求，被拒绝的请求返回很快，会把分位数拉低
+            **_latencies(ok),
+        }
+
+    endpoints = {name: counts(rows) for name, rows in sorted(by_endpoint.items())}
+    for name, rows in by_endpoint.items():
+        statuses = sorted({str(row[3]) for row in rows if not (isinstance(row[3], int) and row[3] < 400)})
+        if statuses:
+            endpoints[name]["failure_statuses"] = statuses
+    return {
+        "offered_rps": rate,
+        "duration_s": duration,
+        "drain_s": max(0.0, elapsed - duration),
+        "dropped": dropped,
+        "overall": counts(records),
+        "endpoints": endpoints,
+    }
+
+
+def saturation(step, slo_ms):
+    """本轮是否已饱和，返回原因列表（空列表表示没有饱和）"""
+    overall = step["overall"]
+    reasons = []
+    if overall["throughput_rps"] < step["offered_rps"] * SATURATION_THROUGHPUT:
+        reasons.append("throughput")
+    if overall["count"] and (overall["rejected"] + overall["errors"]) / overall["count"] > SATURATION_FAILURE_RATIO:
+        reasons.append("failures")
+    if step["dropped"]:
+        reasons.append("dropped")
+    if slo_ms and overall["p95_ms"] is not None and overall["p95_ms"] > slo_ms:
+        reasons.append("p95")
+    return reasons
+
+
+async def sweep(client, args, mix, rng):
+    products, sales, today = await discover(client, args.edit_sample, rng)
+    workload = Workload(products, sales, today, rng)
+    # 每种请求先发一次，冷缓存（商品目录、销量序列、模板）不计入第一轮
+    for kind in mix:
+        name, method, path, kwargs = workload.generator(kind)()
+        await client.request(method, path, **kwargs)
+
+    steps = []
+    for i, rate in enumerate(args.rates):
+        if i and args.cooldown:
+            await asyncio.sleep(args.cooldown)
+        step = await run_step(client, workload, mix, rate, args.duration, args.max_inflight, args.timeout, rng)
+        step["saturated"] = saturation(step, args.slo_ms)
+        steps.append(step)
+        if step["saturated"] and args.stop_on_saturation:
+            break
+    return {"products": len(products), "edit_targets": len(sales)}, steps
+
+
+async def run_asgi(main, args, mix, rng):
+    import httpx
+
+    # 手动进入 lifespan，执行启动事件（目录缓存、销量序列预热、写队列）
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return await sweep(client, args, mix, rng)
+
+
+async def run_http(url, args, mix, rng):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        return await sweep(client, args, mix, rng)
+
+
+def compare(current, baseline):
+    """按发送速率逐轮比较各接口的 p95，ratio > 1 表示变慢；另外比较最高未饱和速率"""
+    baseline_steps = {step["offered_rps"]: step for step in baseline.get("steps", [])}
+    rows = {}
+    for step in current["steps"]:
+        before = baseline_steps.get(step["offered_rps"])
+        if not before:
+            continue
+        for name, result in [("overall", step["overall"]), *step["endpoints"].items()]:
+            previous = before["overall"] if name == "overall" else before["endpoints"].get(name)
+            if not previous or not previous.get("p95_ms") or result.get("p95_ms") is None:
+                continue
+            rows[f"{step['offered_rps']}rps.{name}"] = {
+                "baseline_p95_ms": previous["p95_ms"],
+                "current_p95_ms": result["p95_ms"],
+                "ratio": result["p95_ms"] / previous["p95_ms"],
+            }
+    same_setup = all(current["meta"].get(key) == baseline.get("meta", {}).get(key)
+                     for key in ("mix", "duration_s", "target"))
+    return {
+        "baseline_commit": baseline.get("meta", {}).get("commit"),
+        "same_setup": same_setup,
+        "baseline_max_sustained_rps": baseline.get("max_sustained_rps"),
+        "current_max_sustained_rps": current["max_sustained_rps"],
+        "cases": rows,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--url", help="已启动的服务地址；不指定时在进程内驱动应用")
+    parser.add_argument("--products", type=int, default=500, help="预置的商品数（仅进程内模式）")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mix", default="default",
+                        help=f"请求比例：{', '.join(MIXES)}，或 calculate=1,browse=20,edit=5,import=0.2")
+    parser.add_argument("--rates", default="5,10,20,40", help="逐级发送速率（次/秒），逗号分隔")
+    parser.add_argument("--duration", type=float, default=15.0, help="每一级的发送时长（秒）")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="两级之间的间隔（秒）")
+    parser.add_argument("--slo-ms", type=float, default=2000, help="整体 p95 超过该值视为饱和，0 表示不判断")
+    parser.add_argument("--stop-on-saturation", action="store_true", help="饱和后不再继续加压")
+    parser.add_argument("--max-inflight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时（秒）")
+    parser.add_argument("--edit-sample", type=int, default=50, help="抽取多少个商品的近期销量作为修改对象")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 比较")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+        args.rates = [float(rate) for rate in args.rates.split(",")]
+    except ValueError as e:
+        parser.error(str(e))
+    backend_dir = os.path.abspath(args.backend_dir)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    rng = random.Random(args.seed)
+
+    meta = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": args.url or "asgi",
+        "mix": mix,
+        "duration_s": args.duration,
+        "slo_ms": args.slo_ms,
+    }
+    if args.url:
+        # 被测服务的版本无法从这里得知，记录的是本地仓库的提交
+        meta["commit"] = git_commit(backend_dir)
+        workload, steps = asyncio.run(run_http(args.url.rstrip("/"), args, mix, rng))
+    else:
+        # 后台归档、分析快照和日志压缩会和被测请求抢 CPU，关闭
+        for name in ("SALES_ARCHIVE_INTERVAL_HOURS", "ANALYTICS_SNAPSHOT_INTERVAL_MINUTES",
+                     "CHANGE_LOG_COMPACT_INTERVAL_MINUTES"):
+            os.environ.setdefault(name, "0")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        spec = datagen.DatasetSpec(args.products, args.days, seed=args.seed)
+        # 应用里的调试 print 会淹没结果，运行期间丢弃标准输出
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            app_module = load_app(backend_dir)
+            rows = datagen.seed_database(app_module.engine, spec)
+            workload, steps = asyncio.run(run_asgi(app_module, args, mix, rng))
+        meta["commit"] = git_commit(backend_dir)
+        meta["dataset"] = {**spec.as_dict(), "rows": rows}
+    meta["workload"] = workload
+
+    sustained = [step["offered_rps"] for step in steps if not step["saturated"]]
+    saturated = [step for step in steps if step["saturated"]]
+    report = {
+        "meta": meta,
+        "steps": steps,
+        # 最高的未饱和速率和第一个饱和的速率
+        "max_sustained_rps": max(sustained) if sustained else None,
+        "saturated_at_rps": saturated[0]["offered_rps"] if saturated else None,
+    }
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
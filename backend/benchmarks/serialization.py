@@ -0,0 +1,198 @@
+"""列表接口序列化基准：对比旧写法（ORM 对象 + joinedload + jsonable_encoder）与按列取元组 + orjson。
+
+在临时目录中创建独立的 SQLite 数据库，分别测量生成 /api/sales、/api/arrivals、/api/products
+响应体的 CPU 时间和 Python 内存峰值（tracemalloc），结果按每行折算。
+
+    python -m benchmarks.serialization --rows 100000 --repeat 3
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from benchmarks.concurrency import load_app
+
+
+def seed(main, rows):
+    import models
+    products = max(1, rows // 100)
+    today = date.today()
+    with main.engine.begin() as conn:
+        conn.execute(models.Product.__table__.insert(), [
+            {"id": i, "code": f"P{i:05d}", "name": f"商品{i}", "unit": "个", "specification": f"规格{i % 7}",
+             "description": "T+2", "reference_days": 7, "current_stock": float(i % 50)}
+            for i in range(1, products + 1)
+        ])
+        conn.execute(models.Sales.__table__.insert(), [
+            {"product_id": i % products + 1, "date": today - timedelta(days=i // products),
+             "quantity": float(i % 17)}
+            for i in range(rows)
+        ])
+        conn.execute(models.Arrival.__table__.insert(), [
+            {"product_id": i % products + 1, "product_code": f"P{i % products + 1:05d}",
+             "product_name": f"商品{i % products + 1}", "order_date": today - timedelta(days=i // products),
+             "expected_date": today - timedelta(days=i // products - 2), "quantity": float(i % 9),
+             "status": "pending"}
+            for i in range(rows)
+        ])
+    return products
+
+
+def legacy_sales(main):
+    # 改动前 get_sales 的写法
+    import models
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy.orm import joinedload
+    db = main.ReadSessionLocal()
+    try:
+        sales = db.query(models.Sales).options(joinedload(models.Sales.product)).order_by(models.Sales.date.desc()).all()
+        content = [
+            {
+                "id": sale.id,
+                "product_id": sale.product_id,
+                "date": sale.date.strftime("%Y-%m-%d") if sale.date else None,
+                "quantity": sale.quantity,
+                "product": {"id": sale.product.id, "name": sale.product.name, "code": sale.product.code}
+                if sale.product is not None else None,
+            }
+            for sale in sales
+        ]
+        return JSONResponse(jsonable_encoder(content)).body
+    finally:
+        db.close()
+
+
+def legacy_arrivals(main):
+    # 改动前 get_arrivals 的写法（同步会话，省去事件循环的开销）
+    import models
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+    db = main.ReadSessionLocal()
+    try:
+        arrivals = db.execute(
+            select(models.Arrival).options(joinedload(models.Arrival.product))
+            .order_by(models.Arrival.expected_date.desc())
+        ).scalars().all()
+        content = [{
+            "id": arrival.id,
+            "product_id": arrival.product_id,
+            "product_code": arrival.product_code,
+            "product_name": arrival.product_name,
+            "order_date": arrival.order_date.strftime("%Y-%m-%d") if arrival.order_date else None,
+            "expected_date": arrival.expected_date.strftime("%Y-%m-%d") if arrival.expected_date else None,
+            "quantity": arrival.quantity,
+            "status": arrival.status,
+            "product": {
+                "id": arrival.product.id, "code": arrival.product.code, "name": arrival.product.name,
+                "specification": arrival.product.specification, "unit": arrival.product.unit,
+            } if arrival.product else None,
+        } for arrival in arrivals]
+        return JSONResponse(jsonable_encoder(content)).body
+    finally:
+        db.close()
+
+
+def legacy_products(main):
+    # 改动前 get_products 直接返回 ORM 对象，由 FastAPI 用 jsonable_encoder 转换
+    import models
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy import select
+    db = main.ReadSessionLocal()
+    try:
+        products = db.execute(select(models.Product)).scalars().all()
+        return JSONResponse(jsonable_encoder(products)).body
+    finally:
+        db.close()
+
+
+def _request():
+    from starlette.requests import Request
+    return Request({"type": "http", "method": "GET", "query_string": b"", "headers": []})
+
+
+def current_sales(main):
+    from starlette.responses import Response
+    db = main.ReadSessionLocal()
+    try:
+        return main.get_sales(_request(), Response(), db).body
+    finally:
+        db.close()
+
+
+def current_arrivals(main):
+    import asyncio
+    from starlette.responses import Response
+
+    async def run():
+        async with main.AsyncReadSessionLocal() as db:
+            return (await main.get_arrivals(_request(), Response(), db=db)).body
+    return asyncio.run(run())
+
+
+def current_products(main):
+    import asyncio
+    from starlette.responses import Response
+
+    async def run():
+        async with main.AsyncReadSessionLocal() as db:
+            return (await main.get_products(_request(), Response(), db=db)).body
+    return asyncio.run(run())
+
+
+def measure(fn, main, repeat):
+    cpu = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.process_time()
+        body = fn(main)
+        cpu.append(time.process_time() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn(main)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_s": min(cpu), "peak_mb": peak / 1024 / 1024, "bytes": len(body)}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    cases = {
+        "sales": (legacy_sales, current_sales, args.rows),
+        "arrivals": (legacy_arrivals, current_arrivals, args.rows),
+        "products": (legacy_products, current_products, None),
+    }
+    result = {"params": vars(args)}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        app_module = load_app(os.path.abspath(args.backend_dir))
+        products = seed(app_module, args.rows)
+        for name, (legacy, current, rows) in cases.items():
+            rows = rows or products
+            before = measure(legacy, app_module, args.repeat)
+            after = measure(current, app_module, args.repeat)
+            result[name] = {
+                "rows": rows,
+                "legacy": before,
+                "current": after,
+                "cpu_us_per_row": {"legacy": before["cpu_s"] / rows * 1e6, "current": after["cpu_s"] / rows * 1e6},
+                "peak_bytes_per_row": {"legacy": before["peak_mb"] * 1048576 / rows,
+                                       "current": after["peak_mb"] * 1048576 / rows},
+                "speedup": before["cpu_s"] / after["cpu_s"] if after["cpu_s"] else None,
+            }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
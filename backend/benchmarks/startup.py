@@ -0,0 +1,146 @@
+"""启动耗时基准：在独立的子进程中测量导入 main、执行启动事件和整个进程的耗时。
+
+cold 每次使用全新的空目录（没有数据库，启动时建表）；warm 复用一个预置了数据的数据库（迁移已是最新）。
+每次都是新进程，模块导入不会被上一次运行缓存：
+
+    python -m benchmarks.startup --repeat 5 --output startup.json
+    python -m benchmarks.startup --backend-dir /path/to/other/checkout/backend --output base.json
+    python -m benchmarks.startup --compare base.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.suite import git_commit
+
+HEAVY_MODULES = ("pandas", "openpyxl", "pytz", "pyarrow", "alembic")
+
+# 在子进程中执行：argv[1] 为被测的 backend 目录
+PROBE = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import main
+imported = time.perf_counter()
+
+async def lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(lifespan())
+print(json.dumps({"import": imported - started, "startup": ready - imported,
+                  "loaded": [name for name in sys.argv[2].split(",") if name in sys.modules]}))
+"""
+
+# 在子进程中预置 warm 场景的数据库：argv[1] 为被测的 backend 目录，argv[2] 为本基准所在的 backend 目录
+PREPARE = r"""
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import main
+ensure_schema = getattr(main, "ensure_schema", None)
+if ensure_schema is not None:
+    ensure_schema()
+sys.path.insert(0, sys.argv[2])
+from benchmarks import datagen
+print(json.dumps(datagen.seed_database(main.engine, datagen.DatasetSpec(*json.loads(sys.argv[3])))))
+"""
+
+
+def _run(code, args, cwd):
+    env = dict(os.environ)
+    # 后台归档、分析快照、日志压缩和建议重算与启动耗时无关，关闭
+    for name in ("SALES_ARCHIVE_INTERVAL_HOURS", "ANALYTICS_SNAPSHOT_INTERVAL_MINUTES",
+                 "CHANGE_LOG_COMPACT_INTERVAL_MINUTES", "SUGGESTIONS_REFRESH_SECONDS"):
+        env.setdefault(name, "0")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", code, *args], cwd=cwd, env=env,
+                               capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+    # 旧版本在导入时有 print 输出，结果在最后一行
+    return json.loads(completed.stdout.strip().splitlines()[-1]), elapsed
+
+
+def measure(backend_dir, cwd_factory, repeat):
+    samples = {"import_ms": [], "startup_ms": [], "process_ms": []}
+    loaded = set()
+    for _ in range(repeat):
+        result, elapsed = _run(PROBE, [backend_dir, ",".join(HEAVY_MODULES)], cwd_factory())
+        samples["import_ms"].append(result["import"] * 1000)
+        samples["startup_ms"].append(result["startup"] * 1000)
+        samples["process_ms"].append(elapsed * 1000)
+        loaded.update(result["loaded"])
+    summary = {name: {"median": statistics.median(values), "min": min(values), "max": max(values)}
+               for name, values in samples.items()}
+    summary["heavy_modules_loaded"] = sorted(loaded)
+    return summary
+
+
+def compare(current, baseline):
+    """按中位数比较，ratio < 1 表示启动更快"""
+    rows = {}
+    for scenario, result in current["results"].items():
+        before = baseline.get("results", {}).get(scenario, {})
+        for name in ("import_ms", "startup_ms", "process_ms"):
+            if name in before and name in result:
+                rows[f"{scenario}.{name}"] = {
+                    "baseline_ms": before[name]["median"],
+                    "current_ms": result[name]["median"],
+                    "ratio": result[name]["median"] / before[name]["median"],
+                }
+    return {"baseline_commit": baseline.get("meta", {}).get("commit"), "cases": rows}
+
+
+def main_cli():
+    own_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=own_dir)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--products", type=int, default=500, help="warm 场景预置的商品数")
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 比较")
+    args = parser.parse_args()
+
+    backend_dir = os.path.abspath(args.backend_dir)
+    warm_dir = tempfile.mkdtemp(prefix="po-bench-")
+    rows, _ = _run(PREPARE, [backend_dir, own_dir, json.dumps([args.products, args.days])], warm_dir)
+    # 第一次启动会生成销量序列缓存等文件，不计入结果
+    _run(PROBE, [backend_dir, ""], warm_dir)
+
+    report = {
+        "meta": {
+            "commit": git_commit(backend_dir),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "warm_dataset": {"products": args.products, "days": args.days, "rows": rows},
+        },
+        "results": {
+            "cold": measure(backend_dir, lambda: tempfile.mkdtemp(prefix="po-bench-"), args.repeat),
+            "warm": measure(backend_dir, lambda: warm_dir, args.repeat),
+        },
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,190 @@
+"""可复现的基准套件：用确定性数据驱动采购计算、四种导入、列表接口和模板下载。
+
+在临时目录中创建独立的 SQLite 数据库，通过 ASGI 直接驱动应用（包括启动/关闭事件），不需要启动 uvicorn。
+结果写成 JSON，带上当前提交，便于在不同提交之间比较：
+
+    python -m benchmarks.suite --products 500 --days 90 --output base.json
+    python -m benchmarks.suite --products 500 --days 90 --output new.json --compare base.json
+    python -m benchmarks.suite --only calculate_order,list_sales --repeat 10
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+from benchmarks import datagen
+from benchmarks.concurrency import load_app, percentile
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def git_commit(path):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_cases(spec):
+    """{用例名称: 返回 (方法, 路径, httpx 请求参数) 的函数}。
+
+    导入会修改数据，但重复执行的工作量相同（更新同样的行），可以多次计时。
+    """
+    order = datagen.order_request(spec)
+    workbooks = {
+        "import_products": ("/api/import-products", datagen.products_workbook(spec)),
+        "import_sales": ("/api/sales/import", datagen.sales_workbook(spec)),
+        "import_stock": ("/api/import-stock", datagen.stock_workbook(spec)),
+        "import_arrivals": ("/api/arrivals/import", datagen.arrivals_workbook(spec)),
+    }
+    middle = spec.products // 2 or 1
+
+    cases = {
+        "calculate_order": lambda: ("POST", "/api/calculate-order", {"json": order}),
+        "list_products": lambda: ("GET", "/api/products", {}),
+        "list_products_filtered": lambda: ("GET", "/api/products", {"params": {"code": "P0001"}}),
+        "list_sales": lambda: ("GET", "/api/sales", {}),
+        "list_arrivals": lambda: ("GET", "/api/arrivals", {"params": {"status": "pending"}}),
+        "product_sales": lambda: ("GET", f"/api/sales/product/{middle}", {}),
+        "template_sales": lambda: ("GET", "/api/download-sales-template", {}),
+        "template_stock": lambda: ("GET", "/api/download-stock-template", {}),
+        "template_product": lambda: ("GET", "/api/download-product-template", {}),
+    }
+    for name, (path, content) in workbooks.items():
+        cases[name] = (lambda path=path, content=content, name=name: (
+            "POST", path, {"files": {"file": (f"{name}.xlsx", content, XLSX_MEDIA_TYPE)}}
+        ))
+    return cases
+
+
+def summarize(latencies, sizes, statuses):
+    ms = [value * 1000 for value in latencies]
+    return {
+        "count": len(ms),
+        "first_ms": ms[0] if ms else None,
+        "min_ms": min(ms) if ms else None,
+        "median_ms": statistics.median(ms) if ms else None,
+        "mean_ms": statistics.mean(ms) if ms else None,
+        "p95_ms": percentile(ms, 95),
+        "max_ms": max(ms) if ms else None,
+        "response_bytes": sizes[-1] if sizes else None,
+        "statuses": sorted(set(statuses)),
+    }
+
+
+async def run(main, cases, repeat, warmup):
+    import httpx
+
+    results = {}
+    # 手动进入 lifespan，执行启动事件（目录缓存、销量序列预热、后台任务）
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, make_request in cases.items():
+                latencies, sizes, statuses = [], [], []
+                for i in range(warmup + repeat):
+                    method, path, kwargs = make_request()
+                    start = time.perf_counter()
+                    response = await client.request(method, path, **kwargs)
+                    elapsed = time.perf_counter() - start
+                    if response.status_code >= 400:
+                        raise RuntimeError(f"{name}: {response.status_code} {response.text[:200]}")
+                    # 第一次请求（冷缓存）单独记录在 first_ms 中，预热轮次不计入统计
+                    if i == 0 or i >= warmup:
+                        latencies.append(elapsed)
+                        sizes.append(len(response.content))
+                        statuses.append(response.status_code)
+                results[name] = summarize(latencies, sizes, statuses)
+    return results
+
+
+def compare(current, baseline):
+    """按 median_ms 比较两次结果，ratio > 1 表示变慢"""
+    rows = {}
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before.get("median_ms") or result.get("median_ms") is None:
+            continue
+        rows[name] = {
+            "baseline_ms": before["median_ms"],
+            "current_ms": result["median_ms"],
+            "ratio": result["median_ms"] / before["median_ms"],
+        }
+    # 数据规模不同时比较没有意义，标记出来（日期不同不影响）
+    dataset = {key: value for key, value in current["meta"]["dataset"].items() if key != "today"}
+    baseline_dataset = {key: value for key, value in baseline.get("meta", {}).get("dataset", {}).items()
+                        if key != "today"}
+    return {"baseline_commit": baseline.get("meta", {}).get("commit"),
+            "same_dataset": dataset == baseline_dataset, "cases": rows}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--arrival-ratio", type=float, default=0.3)
+    parser.add_argument("--arrivals-per-product", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", help="只运行这些用例，逗号分隔")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 比较")
+    args = parser.parse_args()
+
+    backend_dir = os.path.abspath(args.backend_dir)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    # 后台归档、分析快照、日志压缩和建议重算会和被测请求抢 CPU，基准中关闭
+    for name in ("SALES_ARCHIVE_INTERVAL_HOURS", "ANALYTICS_SNAPSHOT_INTERVAL_MINUTES",
+                 "CHANGE_LOG_COMPACT_INTERVAL_MINUTES", "SUGGESTIONS_REFRESH_SECONDS"):
+        os.environ.setdefault(name, "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    spec = datagen.DatasetSpec(args.products, args.days, args.arrival_ratio, args.arrivals_per_product, args.seed)
+
+    # 应用里的调试 print 会淹没结果，运行期间丢弃标准输出
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        app_module = load_app(backend_dir)
+        rows = datagen.seed_database(app_module.engine, spec)
+        cases = build_cases(spec)
+        if args.only:
+            names = [name.strip() for name in args.only.split(",")]
+            unknown = [name for name in names if name not in cases]
+            if unknown:
+                parser.error(f"未知用例: {', '.join(unknown)}（可选: {', '.join(cases)}）")
+            cases = {name: cases[name] for name in names}
+        results = asyncio.run(run(app_module, cases, args.repeat, args.warmup))
+
+    report = {
+        "meta": {
+            "commit": git_commit(backend_dir),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": {**spec.as_dict(), "rows": rows},
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,203 @@
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+
+import models
+from database import read_engine, async_read_engine
+from versions import PRODUCTS, read_versions, read_versions_async
+
+LEAD_DAYS_PATTERN = re.compile(r'T\+(\d+)')
+# 在写会话中按 IN 条件预加载商品时每批的参数个数（与 main.SQL_IN_BATCH_SIZE 相同）
+PRELOAD_BATCH_SIZE = 500
+
+
+def parse_lead_days(description: Optional[str]) -> Optional[int]:
+    # 商品描述中的 T+n 表示送货天数
+    if not description:
+        return None
+    match = LEAD_DAYS_PATTERN.search(description)
+    return int(match.group(1)) if match else None
+
+
+class ProductInfo:
+    """商品目录中的一条记录（不含实时库存这类频繁变化的字段）"""
+    __slots__ = ("id", "code", "name", "unit", "specification", "description", "reference_days", "lead_days")
+
+    def __init__(self, id, code, name, unit, specification, description, reference_days):
+        self.id = id
+        self.code = code
+        self.name = name
+        self.unit = unit
+        self.specification = specification
+        self.description = description
+        self.reference_days = reference_days
+        self.lead_days = parse_lead_days(description)
+
+
+class CatalogCache:
+    """进程内商品目录缓存：id -> 商品信息、编码 -> id。
+
+    change_versions 表中的 products 计数器由商品写操作在同一事务中加一，
+    缓存每次使用前比较计数器（一次主键查询），其他进程修改商品后也能发现并重新加载。
+    只通过只读连接加载，不会读到未提交的数据。
+    """
+
+    _columns = (
+        models.Product.id, models.Product.code, models.Product.name, models.Product.unit,
+        models.Product.specification, models.Product.description, models.Product.reference_days,
+    )
+
+    def __init__(self):
+        self._by_id: Dict[int, ProductInfo] = {}
+        self._by_code: Dict[str, ProductInfo] = {}
+        self._version = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def _install(self, version, rows):
+        by_id = {}
+        by_code = {}
+        for row in rows:
+            info = ProductInfo(*row)
+            by_id[info.id] = info
+            if info.code is not None:
+                by_code[info.code] = info
+        with self._lock:
+            # 整体替换，读者不会看到加载到一半的目录
+            self._by_id, self._by_code = by_id, by_code
+            self._version = version
+            self._loaded_at = time.time()
+            self.reloads += 1
+
+    def refresh(self):
+        """同步检查版本，变化时重新加载（线程池、写线程中使用）"""
+        with read_engine.connect() as conn:
+            version = read_versions(conn, [PRODUCTS])[PRODUCTS]
+            if version != self._version:
+                self._install(version, conn.execute(select(*self._columns)).all())
+        return self
+
+    def for_session(self, db):
+        """写线程中使用：刷新后和写会话中的计数器比较。
+
+        批量事务里前面的任务新增或修改了商品时（尚未提交，只读连接看不到），
+        返回直接在写会话中查询的 SessionProducts，否则返回缓存本身。
+        """
+        self.refresh()
+        if read_versions(db, [PRODUCTS])[PRODUCTS] == self._version:
+            return self
+        return SessionProducts(db)
+
+    def preload(self, ids: Iterable[int] = (), codes: Iterable[str] = ()):
+        # 缓存中已经是全部商品，和 SessionProducts 的接口保持一致
+        return self
+
+    async def refresh_async(self):
+        """异步检查版本，变化时重新加载（async 端点中使用）"""
+        async with async_read_engine.connect() as conn:
+            version = (await read_versions_async(conn, [PRODUCTS]))[PRODUCTS]
+            if version != self._version:
+                self._install(version, (await conn.execute(select(*self._columns))).all())
+        return self
+
+    def get(self, product_id) -> Optional[ProductInfo]:
+        info = self._by_id.get(product_id)
+        self._count(info)
+        return info
+
+    def get_by_code(self, code) -> Optional[ProductInfo]:
+        info = self._by_code.get(code)
+        self._count(info)
+        return info
+
+    def all(self) -> List[ProductInfo]:
+        return list(self._by_id.values())
+
+    def _count(self, info):
+        if info is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._by_id),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "reloads": self.reloads,
+            "loaded_at": self._loaded_at,
+        }
+
+
+class SessionProducts:
+    """在写会话中查询商品，能读到当前事务中未提交的修改；查询方法与 CatalogCache 相同。
+
+    查到的商品缓存在对象里（只在一个写任务内使用）。按行查找前先 preload 要用到的 ID 和编码，
+    用 IN 条件分批一次查出，避免逐行查询。
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._by_id: Dict[int, ProductInfo] = {}
+        self._by_code: Dict[str, ProductInfo] = {}
+        # 查过但不存在的 ID 和编码
+        self._absent_ids = set()
+        self._absent_codes = set()
+        self._complete = False
+
+    def _load(self, condition=None) -> List[ProductInfo]:
+        query = select(*CatalogCache._columns)
+        if condition is not None:
+            query = query.where(condition)
+        infos = [ProductInfo(*row) for row in self._db.execute(query)]
+        for info in infos:
+            self._by_id[info.id] = info
+            if info.code is not None:
+                self._by_code[info.code] = info
+        return infos
+
+    def preload(self, ids: Iterable[int] = (), codes: Iterable[str] = ()):
+        if self._complete:
+            return self
+        ids = [i for i in dict.fromkeys(ids) if i is not None and i not in self._by_id]
+        codes = [c for c in dict.fromkeys(codes) if c is not None and c not in self._by_code]
+        for i in range(0, len(ids), PRELOAD_BATCH_SIZE):
+            self._load(models.Product.id.in_(ids[i:i + PRELOAD_BATCH_SIZE]))
+        for i in range(0, len(codes), PRELOAD_BATCH_SIZE):
+            self._load(models.Product.code.in_(codes[i:i + PRELOAD_BATCH_SIZE]))
+        self._absent_ids.update(i for i in ids if i not in self._by_id)
+        self._absent_codes.update(c for c in codes if c not in self._by_code)
+        return self
+
+    def get(self, product_id) -> Optional[ProductInfo]:
+        if product_id not in self._by_id and not self._complete and product_id not in self._absent_ids:
+            self.preload(ids=[product_id])
+        return self._by_id.get(product_id)
+
+    def get_by_code(self, code) -> Optional[ProductInfo]:
+        if code not in self._by_code and not self._complete and code not in self._absent_codes:
+            self.preload(codes=[code])
+        return self._by_code.get(code)
+
+    def all(self) -> List[ProductInfo]:
+        self._by_id.clear()
+        self._by_code.clear()
+        infos = self._load()
+        self._complete = True
+        return infos
+
+
+catalog = CatalogCache()
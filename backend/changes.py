@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import models
+from database import IS_SQLITE, read_engine
+from versions import read_versions
+from write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+# 实体类型
+PRODUCT = "product"
+SALE = "sale"
+ARRIVAL = "arrival"
+
+# 操作类型：upsert/delete 针对单条记录；delete_where 是批量删除，条件在 payload 中
+# （{} 表示全部，{"product_id": [...]} 表示这些商品的记录，{"before": "YYYY-MM-DD"} 表示该日期之前的记录）
+UPSERT = "upsert"
+DELETE = "delete"
+DELETE_WHERE = "delete_where"
+
+# 压缩时删除超过这么多天的日志；落后于被删除部分的客户端需要全量同步
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+# 自动压缩的间隔分钟数，0 表示只通过接口手动压缩
+CHANGE_LOG_COMPACT_INTERVAL_MINUTES = float(os.getenv("CHANGE_LOG_COMPACT_INTERVAL_MINUTES", "60"))
+# 一次请求最多返回的变更条数
+CHANGES_PAGE_SIZE = 10000
+CHANGES_BATCH_SIZE = 500
+
+# change_versions 中记录已被截断的最大序号
+CHANGE_LOG_FLOOR = "change_log_floor"
+
+# upsert 时随变更一起返回的当前数据
+ENTITY_COLUMNS = {
+    PRODUCT: (models.Product, ("id", "code", "name", "unit", "specification", "description",
+                               "reference_days", "current_stock")),
+    SALE: (models.Sales, ("id", "product_id", "date", "quantity")),
+    ARRIVAL: (models.Arrival, ("id", "product_id", "product_code", "product_name", "order_date",
+                               "expected_date", "quantity", "status")),
+}
+
+
+def record_change(db: Session, entity: str, op: str, ids: Iterable[int] = (),
+                  payload: Optional[Dict[str, Any]] = None):
+    """在当前写事务中写入变更日志，随事务一起提交或回滚"""
+    now = datetime.utcnow()
+    if op == DELETE_WHERE:
+        rows = [{"entity": entity, "entity_id": None, "op": op,
+                 "payload": json.dumps(payload or {}, default=str), "created_at": now}]
+    else:
+        rows = [{"entity": entity, "entity_id": entity_id, "op": op, "payload": None, "created_at": now}
+                for entity_id in dict.fromkeys(ids) if entity_id is not None]
+    if rows:
+        db.execute(insert(models.ChangeLog), rows)
+
+
+def change_log_floor() -> int:
+    with read_engine.connect() as conn:
+        return read_versions(conn, [CHANGE_LOG_FLOOR])[CHANGE_LOG_FLOOR]
+
+
+def _dumps(value) -> bytes:
+    return (json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def iter_changes(since: int, limit: int = CHANGES_PAGE_SIZE) -> Iterator[bytes]:
+    """按序号输出 since 之后的变更（NDJSON，每行一条），最后一行是 {"last_seq", "has_more"}。
+
+    upsert 带上记录的当前数据；记录已不存在时输出为 delete。
+    """
+    log = models.ChangeLog
+    with read_engine.connect() as conn:
+        if IS_SQLITE:
+            # 所有批次在同一个读快照中
+            conn.exec_driver_sql("BEGIN")
+        result = conn.execution_options(yield_per=CHANGES_BATCH_SIZE).execute(
+            select(log.seq, log.entity, log.entity_id, log.op, log.payload)
+            .where(log.seq > since).order_by(log.seq).limit(limit)
+        )
+        last_seq, count = since, 0
+        for batch in result.partitions():
+            current: Dict[str, Dict[int, Dict[str, Any]]] = {}
+            for entity, (model, columns) in ENTITY_COLUMNS.items():
+                ids = [entity_id for _, e, entity_id, op, _ in batch if e == entity and op == UPSERT]
+                if ids:
+                    current[entity] = {
+                        row[0]: dict(zip(columns, row))
+                        for row in conn.execute(
+                            select(*(getattr(model, column) for column in columns)).where(model.id.in_(ids))
+                        )
+                    }
+            lines = []
+            for seq, entity, entity_id, op, payload in batch:
+                change: Dict[str, Any] = {"seq": seq, "entity": entity, "op": op}
+                if op == DELETE_WHERE:
+                    change["where"] = json.loads(payload or "{}")
+                else:
+                    change["id"] = entity_id
+                    if op == UPSERT:
+                        data = current.get(entity, {}).get(entity_id)
+                        if data is None:
+                            change["op"] = DELETE
+                        else:
+                            change["data"] = data
+                lines.append(_dumps(change))
+                last_seq = seq
+            count += len(batch)
+            yield b"".join(lines)
+        yield _dumps({"last_seq": last_seq, "has_more": count >= limit})
+
+
+def compact_change_log(db: Session, retention_days: float = CHANGE_LOG_RETENTION_DAYS) -> Dict[str, int]:
+    """压缩变更日志（写队列任务）。
+
+    1. 同一条记录只保留最新的一条日志：客户端拿到的是记录的当前数据，旧的 upsert/delete 没有意义；
+    2. 删除超过保留期的日志，并把截断位置记到 change_log_floor，落后于它的客户端会收到 410。
+    """
+    log = models.ChangeLog
+    latest = (
+        select(func.max(log.seq)).where(log.entity_id.isnot(None)).group_by(log.entity, log.entity_id)
+    )
+    superseded = db.execute(
+        delete(log).where(log.entity_id.isnot(None), log.seq.not_in(latest))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    expired = 0
+    floor = db.execute(
+        select(func.max(log.seq)).where(log.created_at < datetime.utcnow() - timedelta(days=retention_days))
+    ).scalar()
+    if floor:
+        expired = db.execute(
+            delete(log).where(log.seq <= floor).execution_options(synchronize_session=False)
+        ).rowcount
+        updated = db.execute(
+            update(models.ChangeVersion)
+            .where(models.ChangeVersion.name == CHANGE_LOG_FLOOR, models.ChangeVersion.version < floor)
+            .values(version=floor)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated and db.get(models.ChangeVersion, CHANGE_LOG_FLOOR) is None:
+            db.add(models.ChangeVersion(name=CHANGE_LOG_FLOOR, version=floor))
+    remaining = db.execute(select(func.count()).select_from(log)).scalar()
+    return {"superseded": superseded, "expired": expired, "remaining": remaining}
+
+
+async def run_periodic_compaction():
+    while True:
+        await asyncio.sleep(CHANGE_LOG_COMPACT_INTERVAL_MINUTES * 60)
+        try:
+            result = await write_queue.run(compact_change_log, batchable=False)
+            logger.info("变更日志已压缩: %s", result)
+        except Exception:
+            logger.exception("压缩变更日志出错")
@@ -1,12 +1,124 @@
-from sqlalchemy import create_engine
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# 数据库地址和连接参数都可以通过环境变量（或 .env 文件）配置
+load_dotenv()
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+
+# 连接配置：production 启用 WAL 和调优参数，default 保持 SQLite 默认设置
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# 读连接池大小，只读端点（列表查询、采购计算）共享
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "10"))
+# 等待唯一写连接的最长秒数
+DB_WRITE_POOL_TIMEOUT = float(os.getenv("DB_WRITE_POOL_TIMEOUT", "60"))
+
+
+def _async_url(url):
+    # 同步驱动地址换成对应的异步驱动
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    # 其他数据库的同步驱动不能用于 async 端点，启动时就报错，而不是在第一个请求时失败
+    raise ValueError(
+        f"不支持为 {url.get_backend_name()} 自动选择异步驱动，请通过 ASYNC_DATABASE_URL 指定异步连接地址"
+    )
+
+
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(SQLALCHEMY_DATABASE_URL)
+
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+USE_PRODUCTION_PROFILE = IS_SQLITE and DB_PROFILE == "production"
+
+
+def _apply_sqlite_pragmas(dbapi_connection, read_only):
+    cursor = dbapi_connection.cursor()
+    try:
+        if not read_only:
+            # journal_mode 会持久化到数据库文件，只需由写连接设置
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+def _configure_sqlite(sync_engine, read_only):
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, read_only)
+
+
+def _configure_sqlite_writer(sync_engine):
+    # pysqlite 自己管理 BEGIN 时 SAVEPOINT 不可靠，改为由 SQLAlchemy 显式开启事务；
+    # production 下用 BEGIN IMMEDIATE 在事务开始时就拿到写锁，配合 busy_timeout 排队
+    begin_statement = "BEGIN IMMEDIATE" if USE_PRODUCTION_PROFILE else "BEGIN"
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sync_engine, "begin")
+    def on_begin(connection):
+        connection.exec_driver_sql(begin_statement)
+
+
+def _engine_kwargs(read_only):
+    if not IS_SQLITE:
+        return {}
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if USE_PRODUCTION_PROFILE:
+        if read_only:
+            kwargs.update(pool_size=DB_READ_POOL_SIZE, max_overflow=DB_READ_MAX_OVERFLOW)
+        else:
+            # 只有一个写连接：进程内的写操作在连接池排队，而不是争抢文件锁
+            kwargs.update(pool_size=1, max_overflow=0, pool_timeout=DB_WRITE_POOL_TIMEOUT)
+    return kwargs
+
+
+# 写连接（所有修改数据的操作）
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(read_only=False))
+# 只读连接（GET 和采购计算端点）
+read_engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_kwargs(read_only=True))
+# 异步只读连接（aiosqlite 驱动），供 async 端点使用；aiosqlite 默认不复用连接，显式指定连接池
+async_read_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    **_engine_kwargs(read_only=True),
+    **({"poolclass": AsyncAdaptedQueuePool} if USE_PRODUCTION_PROFILE else {})
 )
+
+if IS_SQLITE:
+    _configure_sqlite_writer(engine)
+if USE_PRODUCTION_PROFILE:
+    _configure_sqlite(engine, read_only=False)
+    _configure_sqlite(read_engine, read_only=True)
+    _configure_sqlite(async_read_engine.sync_engine, read_only=True)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+# 提交后不让对象过期，避免在会话关闭后序列化时触发隐式查询
+AsyncReadSessionLocal = async_sessionmaker(
+    async_read_engine, autoflush=False, expire_on_commit=False
+)
 
-Base = declarative_base() 
\ No newline at end of file
+Base = declarative_base()
@@ -0,0 +1,34 @@
+import hashlib
+from typing import Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from database import SQLALCHEMY_DATABASE_URL
+
+
+def make_etag(*parts) -> str:
+    # 计数器只在同一个数据库内有意义，带上数据库地址
+    raw = "|".join(str(part) for part in (SQLALCHEMY_DATABASE_URL,) + parts)
+    return '"%s"' % hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # 忽略弱校验前缀 W/
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def not_modified(request: Request, response: Response, scope: str, versions) -> Optional[Response]:
+    """列表接口的条件请求：ETag 由计数器和查询参数决定。
+
+    客户端的 If-None-Match 仍然有效时返回 304 响应；否则把 ETag 写到 response 上并返回 None。
+    """
+    etag = make_etag(scope, sorted(versions.items()), sorted(request.query_params.multi_items()))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,138 @@
+import codecs
+import csv
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+from starlette.background import BackgroundTask
+from starlette.responses import FileResponse, StreamingResponse
+
+from database import read_engine
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+EXPORT_FORMATS = ("xlsx", "csv")
+# 每次从游标取的行数
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+
+class Column:
+    __slots__ = ("title", "width")
+
+    def __init__(self, title: str, width: Optional[float] = None):
+        self.title = title
+        self.width = width
+
+
+def iter_query(statement) -> Iterator[Sequence[Any]]:
+    """在只读连接上分批读取查询结果，不把整个结果集放进内存"""
+    with read_engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_SIZE).execute(statement)
+        for partition in result.partitions():
+            yield from partition
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return value
+
+
+def write_xlsx(columns: List[Column], rows: Iterable[Sequence[Any]], sheet_name: str) -> str:
+    """用 openpyxl 只写模式把行写到临时 xlsx 文件，返回文件路径；内存占用与行数无关"""
+    # openpyxl 导入较慢，只在第一次生成 xlsx 时导入
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    for index, column in enumerate(columns, start=1):
+        if column.width:
+            worksheet.column_dimensions[get_column_letter(index)].width = column.width
+    worksheet.append([column.title for column in columns])
+    for row in rows:
+        worksheet.append([_cell(value) for value in row])
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def iter_csv(columns: List[Column], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """逐批生成 CSV 字节；带 BOM，Excel 直接打开中文不乱码"""
+    class Buffer(list):
+        def write(self, text):
+            self.append(text)
+
+    buffer = Buffer()
+    writer = csv.writer(buffer)
+    writer.writerow([column.title for column in columns])
+    yield codecs.BOM_UTF8 + "".join(buffer).encode("utf-8")
+    buffer.clear()
+    for row in rows:
+        writer.writerow(["" if value is None else _format_csv(value) for value in row])
+        if len(buffer) >= EXPORT_BATCH_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer.clear()
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _format_csv(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def write_file(columns: List[Column], rows: Iterable[Sequence[Any]], path: str,
+               export_format: str = "xlsx", sheet_name: str = "Sheet1"):
+    """把导出内容写到指定文件（模板缓存用）"""
+    if export_format == "csv":
+        with open(path, "wb") as f:
+            for chunk in iter_csv(columns, rows):
+                f.write(chunk)
+        return
+    if export_format != "xlsx":
+        raise ValueError("format 只能是 xlsx 或 csv")
+    tmp_path = write_xlsx(columns, rows, sheet_name)
+    # 临时目录可能与目标不在同一文件系统
+    shutil.move(tmp_path, path)
+
+
+def media_type(export_format: str) -> str:
+    return CSV_MEDIA_TYPE if export_format == "csv" else XLSX_MEDIA_TYPE
+
+
+def export_response(columns: List[Column], rows: Iterable[Sequence[Any]], filename: str,
+                    export_format: str = "xlsx", sheet_name: str = "Sheet1"):
+    """生成下载响应。xlsx 先写到临时文件（发送完删除），csv 边查询边发送。
+
+    xlsx 的生成是同步的，调用方需要在线程中执行（def 端点或 run_in_threadpool）。
+    """
+    if export_format == "csv":
+        return StreamingResponse(
+            iter_csv(columns, rows),
+            media_type=CSV_MEDIA_TYPE,
+            headers={"Content-Disposition": f"attachment; filename={filename}.csv"},
+        )
+    if export_format != "xlsx":
+        raise ValueError("format 只能是 xlsx 或 csv")
+    path = write_xlsx(columns, rows, sheet_name)
+    return FileResponse(
+        path,
+        media_type=XLSX_MEDIA_TYPE,
+        filename=f"{filename}.xlsx",
+        background=BackgroundTask(os.remove, path),
+    )
+
+
+def template_date(day: date) -> str:
+    # 导入时按 %Y/%m/%d 解析，月和日不补零（与原来 Windows 下 %#m/%#d 的输出一致）
+    return f"{day.year}/{day.month}/{day.day}"
@@ -0,0 +1,38 @@
+import json
+from datetime import date, datetime
+from typing import Any, Optional
+
+from starlette.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # 没装 orjson 时退回标准库，输出相同
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 直接序列化 dict/list/日期，不经过 FastAPI 的 jsonable_encoder。
+
+    端点要直接返回这个响应对象（而不是用 response_class），否则内容仍会先经过 jsonable_encoder。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    # 直接返回响应对象时 FastAPI 不再合并注入的 Response 上的头（ETag 等），这里带上
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
@@ -0,0 +1,86 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime
+from typing import Optional
+
+# 日志级别：DEBUG 输出原来 print 的全部诊断信息（每个商品的计算过程、每行导入数据）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text（默认）或 json（每行一个 JSON 对象，便于日志系统采集）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# DEBUG 日志的抽样比例，DEBUG 量很大时可以只保留一部分
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+# 可以按模块单独设置级别，如 LOG_LEVELS=main=DEBUG,write_queue=WARNING
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # logger.info("...", extra={...}) 传入的字段
+        entry.update({key: value for key, value in vars(record).items() if key not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """按比例丢弃 DEBUG 日志，INFO 及以上全部保留"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+def setup_logging():
+    """根 logger 只挂一个 QueueHandler：记录在调用线程中入队，格式化和写 stderr 在后台线程完成，不阻塞请求。
+
+    重复调用（uvicorn --reload、测试多次导入）不会重复添加处理器。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    # 文本格式只输出消息，extra 字段只在 json 格式中单独输出
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json"
+                        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    if LOG_DEBUG_SAMPLE_RATE < 1:
+        handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    for item in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """刷出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,27 +1,55 @@
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta, date
-import statistics
-from database import SessionLocal, engine
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional, Dict, Any, Literal
+from datetime import datetime, timedelta, date, timezone
+from functools import lru_cache
+import json
+import logging
+import os
+import re
+from database import SessionLocal, ReadSessionLocal, AsyncReadSessionLocal, engine, read_engine, async_read_engine
 import models
 import schemas
-from sqlalchemy.orm import joinedload
-import pandas as pd
-import io
-from fastapi.responses import FileResponse
-import tempfile
-from fastapi import Depends
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import Depends, BackgroundTasks, Query, Header, Request, Response
 from sqlalchemy.orm import Session
-from io import BytesIO
-from fastapi.responses import StreamingResponse
-import re
-from sqlalchemy import func, cast, Date
-import pytz
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, cast, Date, select, insert, update, delete, or_
+import uuid
+import time
+import asyncio
+from collections import OrderedDict
+from write_queue import write_queue
+from catalog import catalog
+from versions import bump_version, read_versions, version_mirror, PRODUCTS, SALES, STOCK, ARRIVALS
+from sales_store import sales_store, record_sales_changes
+from exports import Column, export_response, iter_query, template_date, write_file
+from template_cache import template_cache
+from etags import not_modified
+from fastjson import json_response
+import metrics
+import profiler
+from admission import AdmissionMiddleware, admission
+from logging_config import setup_logging
+from migrations import ensure_schema
+from workers import WORKER_LOCK_DIR, WORKERS, worker_slot
+from retention import (archive_sales, check_sales_date, run_periodic_archive, sales_history, sales_rollup,
+                       SALES_ARCHIVE_INTERVAL_HOURS)
+import analytics
+import changes
+import suggestions
+from changes import record_change
+from suggestions import MAX_REFERENCE_DAYS, mark_dirty
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# 按类别（导入、计算、读）限制并发，放在 CORS 之内，429 响应也带跨域头
+app.add_middleware(AdmissionMiddleware)
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -29,12 +57,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"] + profiler.RESPONSE_HEADERS,
 )
-
-# 创建数据库表
-models.Base.metadata.create_all(bind=engine)
-
-# 数据库依赖
+# 请求耗时、SQL 次数等指标，通过 /metrics 导出
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine, "write")
+metrics.instrument_engine(read_engine, "read")
+metrics.instrument_engine(async_read_engine.sync_engine, "async_read")
+# 按抽样率剖析请求的 SQL，发现 N+1
+app.add_middleware(profiler.ProfilerMiddleware)
+for profiled_engine in (engine, read_engine, async_read_engine.sync_engine):
+    profiler.instrument_engine(profiled_engine)
+
+# 数据库依赖（写连接）
 def get_db():
     db = SessionLocal()
     try:
@@ -42,48 +77,212 @@ def get_db():
     finally:
         db.close()
 
-@app.get("/api/download-sales-template")
-async def download_sales_template():
+# 只读数据库依赖
+def get_read_db():
+    db = ReadSessionLocal()
     try:
-        # 获取所有商品列表
-        db = SessionLocal()
-        products = db.query(models.Product).all()
+        yield db
+    finally:
         db.close()
 
-        # 创建示例数据 - 从今天开始，往后7天
-        dates = [(datetime.now() + timedelta(days=i)).strftime('%Y/%#m/%#d') for i in range(7)]
-        
-        # 创建DataFrame
-        df = pd.DataFrame(columns=['商品编码'] + dates)
-        
-        # 添加示例数据
-        for product in products[:5]:  # 只添加前5个商品作为示例
-            row = [product.code or '']
-            row.extend([0] * len(dates))  # 添加0作为示例销量
-            df.loc[len(df)] = row
-
-        # 保存为Excel文件
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='销量数据')
-            
-            # 获取工作表
-            worksheet = writer.sheets['销量数据']
-            
-            # 设置列宽
-            worksheet.column_dimensions['A'].width = 15  # 商品编码列
-            for i in range(len(dates)):
-                worksheet.column_dimensions[chr(66 + i)].width = 12  # 日期列
+# 异步只读数据库依赖，供 async 端点使用，避免同步查询阻塞事件循环
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
 
-        output.seek(0)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=sales_template.xlsx"
-            }
+def _pandas():
+    # pandas（及其读取 xlsx 用的 openpyxl）只在导入 Excel 时需要，按需导入以加快启动
+    import pandas as pd
+    return pd
+
+@lru_cache(maxsize=None)
+def _local_timezone():
+    import pytz
+    return pytz.timezone('Asia/Shanghai')
+
+def local_today() -> date:
+    return datetime.now(timezone.utc).astimezone(_local_timezone()).date()
+
+# 所有修改数据的操作都写成 apply_xxx(db, ...) 函数，提交到单写队列执行，
+# 由队列负责提交或回滚；函数内部不要调用 db.commit()
+
+# 定期归档旧销量、生成分析快照、压缩变更日志、重算采购建议的后台任务
+archive_task: Optional[asyncio.Task] = None
+snapshot_task: Optional[asyncio.Task] = None
+compaction_task: Optional[asyncio.Task] = None
+suggestions_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def prepare_schema():
+    # 表结构由 Alembic 迁移管理，必须在其他启动任务访问数据库之前完成
+    await run_in_threadpool(ensure_schema)
+
+@app.on_event("startup")
+def claim_worker_slot():
+    # 多进程部署时区分主进程（运行后台任务）和各进程自己的映射文件
+    sales_store.use_slot(worker_slot.claim())
+
+@app.on_event("startup")
+async def load_catalog():
+    # 启动时加载商品目录缓存和销量序列
+    await catalog.refresh_async()
+    await run_in_threadpool(sales_store.warm)
+
+@app.on_event("startup")
+async def start_sales_archive():
+    global archive_task
+    if SALES_ARCHIVE_INTERVAL_HOURS > 0 and worker_slot.is_leader:
+        archive_task = asyncio.create_task(run_periodic_archive())
+
+@app.on_event("startup")
+async def start_analytics_snapshot():
+    global snapshot_task
+    if analytics.ANALYTICS_SNAPSHOT_INTERVAL_MINUTES > 0 and analytics.pyarrow_available() and worker_slot.is_leader:
+        snapshot_task = asyncio.create_task(analytics.run_periodic_snapshot())
+
+@app.on_event("startup")
+async def start_change_log_compaction():
+    global compaction_task
+    if changes.CHANGE_LOG_COMPACT_INTERVAL_MINUTES > 0 and worker_slot.is_leader:
+        compaction_task = asyncio.create_task(changes.run_periodic_compaction())
+
+@app.on_event("startup")
+async def start_suggestions_refresh():
+    global suggestions_task
+    if suggestions.SUGGESTIONS_REFRESH_SECONDS > 0 and worker_slot.is_leader:
+        suggestions_task = asyncio.create_task(suggestions.run_periodic_refresh(local_today))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in (archive_task, snapshot_task, compaction_task, suggestions_task):
+        if task is not None:
+            task.cancel()
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    write_queue.stop(timeout=30)
+    sales_store.persist(force=True)
+    worker_slot.release()
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/profiler/reports")
+def get_profiler_reports(n_plus_one: bool = False, limit: int = Query(50, ge=1, le=500)):
+    # 最近的 SQL 剖析报告，n_plus_one=true 只返回疑似 N+1 的请求
+    return profiler.reports(n_plus_one, limit)
+
+@app.get("/api/profiler/reports/{report_id}")
+def get_profiler_report(report_id: str):
+    report = profiler.get_report(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="剖析报告不存在或已过期")
+    return report
+
+@app.get("/api/write-queue/stats")
+def get_write_queue_stats():
+    return write_queue.stats()
+
+@app.get("/api/catalog/stats")
+def get_catalog_stats():
+    return catalog.stats()
+
+@app.get("/api/sales-store/stats")
+def get_sales_store_stats():
+    return sales_store.stats()
+
+@app.get("/api/admission/stats")
+def get_admission_stats():
+    return admission.stats()
+
+@app.get("/api/workers/stats")
+def get_worker_stats():
+    # 处理本请求的进程；多进程部署时每次请求可能落到不同进程
+    return {**worker_slot.stats(), "version_mirror": version_mirror.stats()}
+
+@app.get("/api/suggestions/stats")
+def get_suggestions_stats():
+    # last_refresh 只在主进程（运行重算任务的进程）上有值
+    return suggestions.suggestion_stats()
+
+# SQLite 单条语句的参数个数有限，IN 列表按此大小分批
+SQL_IN_BATCH_SIZE = 500
+
+def sync_arrival_product_fields(db: Session, product_ids: Optional[List[int]] = None) -> int:
+    """用商品表的编码和名称刷新到货记录中的冗余字段（集合式 UPDATE），返回更新的行数。
+
+    product_ids 为空时同步整张到货表。调用方负责提交事务。
+    """
+    code_subquery = select(models.Product.code).where(
+        models.Product.id == models.Arrival.product_id
+    ).scalar_subquery()
+    name_subquery = select(models.Product.name).where(
+        models.Product.id == models.Arrival.product_id
+    ).scalar_subquery()
+    stale = (
+        models.Arrival.product_id.in_(select(models.Product.id)),
+        or_(
+            models.Arrival.product_code.is_distinct_from(code_subquery),
+            models.Arrival.product_name.is_distinct_from(name_subquery)
         )
+    )
+    stmt = update(models.Arrival).values(
+        product_code=code_subquery,
+        product_name=name_subquery
+    ).where(*stale).execution_options(synchronize_session=False)
+    # 变更日志需要受影响的到货记录ID，更新前用同样的条件查出
+    stale_ids = select(models.Arrival.id).where(*stale)
+
+    # 先把会话中未写入的商品修改刷到数据库，子查询才能读到新值
+    db.flush()
+    if product_ids is None:
+        arrival_ids = db.execute(stale_ids).scalars().all()
+        updated = db.execute(stmt).rowcount
+    else:
+        updated = 0
+        arrival_ids = []
+        product_ids = list(product_ids)
+        for i in range(0, len(product_ids), SQL_IN_BATCH_SIZE):
+            batch = product_ids[i:i + SQL_IN_BATCH_SIZE]
+            arrival_ids += db.execute(stale_ids.where(models.Arrival.product_id.in_(batch))).scalars().all()
+            updated += db.execute(stmt.where(models.Arrival.product_id.in_(batch))).rowcount
+    if updated:
+        bump_version(db, ARRIVALS)
+        # 在途记录按编码匹配，编码变化会影响采购建议
+        mark_dirty(db, product_ids)
+        record_change(db, changes.ARRIVAL, changes.UPSERT, arrival_ids)
+    return updated
+
+# 导出格式：xlsx（只写模式写临时文件）或 csv（边查询边发送）
+ExportFormat = Literal["xlsx", "csv"]
+
+def current_versions(*names: str) -> Dict[str, int]:
+    with read_engine.connect() as conn:
+        return read_versions(conn, names)
+
+@app.get("/api/template-cache/stats")
+def get_template_cache_stats():
+    return template_cache.stats()
+
+@app.get("/api/download-sales-template")
+def download_sales_template(format: ExportFormat = "xlsx", if_none_match: Optional[str] = Header(None)):
+    try:
+        # 示例数据：前5个商品，从今天开始往后7天，销量为0
+        today = datetime.now().date()
+        dates = [template_date(today + timedelta(days=i)) for i in range(7)]
+
+        def build(path):
+            columns = [Column('商品编码', 15)] + [Column(day, 12) for day in dates]
+            rows = (
+                [code or ''] + [0] * len(dates)
+                for (code,) in iter_query(select(models.Product.code).limit(5))
+            )
+            write_file(columns, rows, path, format, sheet_name='销量数据')
+
+        # 商品变化或日期变化时重新生成
+        key = (current_versions(PRODUCTS)[PRODUCTS], dates[0])
+        return template_cache.response("sales_template", format, key, build, "sales_template", if_none_match)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -91,7 +290,8 @@ class OrderItem(BaseModel):
     product_id: int
     current_stock: float
     in_transit_stock: float
-    reference_days: int
+    # 参考窗口不能超出日销量的保留期
+    reference_days: int = Field(ge=1, le=MAX_REFERENCE_DAYS)
 
 class OrderRequest(BaseModel):
     items: List[OrderItem]
@@ -105,710 +305,881 @@ class ProductCreate(BaseModel):
     specification: Optional[str] = None
     reference_days: Optional[int] = 5
 
+# 列表接口返回的商品字段
+PRODUCT_LIST_COLUMNS = ("id", "code", "name", "unit", "specification", "description",
+                        "reference_days", "current_stock")
+
 # 商品管理API
 @app.get("/api/products")
-async def get_products(code: Optional[str] = None, name: Optional[str] = None):
-    db = SessionLocal()
-    try:
-        query = db.query(models.Product)
+async def get_products(request: Request, response: Response, code: Optional[str] = None, name: Optional[str] = None,
+                       db: AsyncSession = Depends(get_async_read_db)):
+    # 商品和库存都没变化时直接返回 304，不查数据库
+    cached = not_modified(request, response, "products", await version_mirror.get_async([PRODUCTS, STOCK]))
+    if cached:
+        return cached
+
+    # 只查需要的列，按元组读取，不构造 ORM 对象
+    query = select(*(getattr(models.Product, column) for column in PRODUCT_LIST_COLUMNS))
+    
+    if code:
+        query = query.filter(models.Product.code.ilike(f"%{code}%"))
+    if name:
+        query = query.filter(models.Product.name.ilike(f"%{name}%"))
         
-        if code:
-            query = query.filter(models.Product.code.ilike(f"%{code}%"))
-        if name:
-            query = query.filter(models.Product.name.ilike(f"%{name}%"))
-            
-        products = query.all()
-        return products
-    finally:
-        db.close()
+    rows = (await db.execute(query)).all()
+    return json_response([dict(zip(PRODUCT_LIST_COLUMNS, row)) for row in rows], response)
+
+def apply_product_create(db: Session, product: ProductCreate):
+    db_product = models.Product(
+        code=product.code,
+        name=product.name,
+        unit=product.unit,
+        description=product.description,
+        specification=product.specification,
+        reference_days=product.reference_days
+    )
+    db.add(db_product)
+    db.flush()
+    bump_version(db, PRODUCTS)
+    mark_dirty(db, [db_product.id])
+    record_change(db, changes.PRODUCT, changes.UPSERT, [db_product.id])
+    return db_product
 
 @app.post("/api/products/")
-def create_product(product: ProductCreate):
-    db = SessionLocal()
+async def create_product(product: ProductCreate):
     try:
-        db_product = models.Product(
-            code=product.code,
-            name=product.name,
-            unit=product.unit,
-            description=product.description,
-            specification=product.specification,
-            reference_days=product.reference_days
-        )
-        db.add(db_product)
-        db.commit()
-        db.refresh(db_product)
-        return db_product
+        return await write_queue.run(apply_product_create, product)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
+
+def apply_product_update(db: Session, product_id: int, product: schemas.ProductCreate):
+    db_product = db.get(models.Product, product_id)
+    if not db_product:
+        raise HTTPException(status_code=404, detail="商品不存在")
+    
+    old_code, old_name = db_product.code, db_product.name
+    for key, value in product.model_dump().items():
+        setattr(db_product, key, value)
+
+    # 编码或名称变化时同步到货记录中的冗余字段
+    if (db_product.code, db_product.name) != (old_code, old_name):
+        sync_arrival_product_fields(db, [product_id])
+    bump_version(db, PRODUCTS)
+    mark_dirty(db, [product_id])
+    record_change(db, changes.PRODUCT, changes.UPSERT, [product_id])
+    return db_product
 
 @app.put("/api/products/{product_id}")
 async def update_product(product_id: int, product: schemas.ProductCreate):
-    db = SessionLocal()
-    try:
-        db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-        if not db_product:
-            raise HTTPException(status_code=404, detail="商品不存在")
-        
-        for key, value in product.model_dump().items():
-            setattr(db_product, key, value)
-            
-        db.commit()
-        db.refresh(db_product)
-        return db_product
-    finally:
-        db.close()
+    return await write_queue.run(apply_product_update, product_id, product)
 
 @app.delete("/api/products/{product_id}")
-async def delete_product(product_id: int):
-    db = SessionLocal()
-    try:
-        db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
-        if not db_product:
-            raise HTTPException(status_code=404, detail="商品不存在")
-        
-        db.delete(db_product)
-        db.commit()
-        return {"message": "商品已删除"}
-    finally:
-        db.close()
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    exists = (await db.execute(
+        select(models.Product.id).where(models.Product.id == product_id)
+    )).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="商品不存在")
+
+    # 不把商品的全部历史加载进会话，按批删除销量和到货记录（每批一个写队列任务，放到线程池等待）
+    await run_in_threadpool(delete_products_chunked, [product_id])
+    return {"message": "商品已删除"}
 
 @app.get("/api/download-product-template")
-def download_product_template():
-    df = pd.DataFrame(columns=['商品编码', '商品名称', '单位', '规格', '预估天数', '描述'])
-    df.loc[0] = ['G001', '示例商品1', '个', '规格1', 5, '商品1的详细描述']
-    df.loc[1] = ['G002', '示例商品2', '箱', '规格2', 7, '商品2的详细描述']
-    
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
-    
-    headers = {
-        'Content-Disposition': 'attachment; filename=product_template.xlsx',
-        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+def download_product_template(format: ExportFormat = "xlsx", if_none_match: Optional[str] = Header(None)):
+    def build(path):
+        columns = [Column(title) for title in ['商品编码', '商品名称', '单位', '规格', '预估天数', '描述']]
+        rows = [
+            ['G001', '示例商品1', '个', '规格1', 5, '商品1的详细描述'],
+            ['G002', '示例商品2', '箱', '规格2', 7, '商品2的详细描述'],
+        ]
+        write_file(columns, rows, path, format)
+
+    # 固定内容，只在模板定义修改时需要改版本号
+    return template_cache.response("product_template", format, 1, build, "product_template", if_none_match)
+
+def apply_products_import(db: Session, df):
+    pd = _pandas()
+    updated_count = 0
+    created_count = 0
+    renamed_product_ids = []
+
+    # 用目录缓存找出已存在的商品，按主键一次加载，不再逐行按编码查询
+    codes = [str(code).strip() for code in df['商品编码']]
+    products = catalog.for_session(db).preload(codes=codes)
+    existing_ids = [info.id for info in map(products.get_by_code, codes) if info is not None]
+    existing_products = {}
+    for i in range(0, len(existing_ids), SQL_IN_BATCH_SIZE):
+        for product in db.query(models.Product).filter(models.Product.id.in_(existing_ids[i:i + SQL_IN_BATCH_SIZE])):
+            existing_products[product.code] = product
+
+    debug = logger.isEnabledFor(logging.DEBUG)
+    for _, row in df.iterrows():
+        product_code = str(row['商品编码']).strip()
+        if pd.isna(product_code):
+            logger.debug("跳过空行")
+            continue
+
+        product_data = {
+            'code': product_code,
+            'name': str(row['商品名称']).strip(),
+            'unit': str(row['单位']).strip(),
+            'specification': str(row['规格']).strip() if '规格' in df.columns and pd.notna(row['规格']) else None,
+            'description': str(row['描述']).strip() if '描述' in df.columns and pd.notna(row['描述']) else None,
+            'reference_days': int(row['预估天数']) if '预估天数' in df.columns and pd.notna(row['预估天数']) else 5
+        }
+
+        existing_product = existing_products.get(product_code)
+        if existing_product:
+            if (existing_product.code, existing_product.name) != (product_data['code'], product_data['name']):
+                renamed_product_ids.append(existing_product.id)
+            if debug:
+                logger.debug("更新商品 %s (ID %s): %s", product_code, existing_product.id, ", ".join(
+                    f"{key}: {getattr(existing_product, key)} -> {value}" for key, value in product_data.items()
+                ))
+            for key, value in product_data.items():
+                setattr(existing_product, key, value)
+            updated_count += 1
+        else:
+            logger.debug("创建商品 %s: %s", product_code, product_data)
+            db_product = models.Product(**product_data)
+            db.add(db_product)
+            existing_products[product_code] = db_product
+            created_count += 1
+
+    # 整批导入只执行一次集合式更新，同步到货记录中的编码和名称
+    synced_arrival_count = sync_arrival_product_fields(db, renamed_product_ids) if renamed_product_ids else 0
+    if updated_count or created_count:
+        bump_version(db, PRODUCTS)
+        # 新商品 flush 后才有ID
+        db.flush()
+        mark_dirty(db, [product.id for product in existing_products.values()])
+        record_change(db, changes.PRODUCT, changes.UPSERT, [product.id for product in existing_products.values()])
+
+    logger.info("商品导入完成: 更新 %s, 新增 %s, 同步到货记录 %s", updated_count, created_count, synced_arrival_count)
+
+    return {
+        "message": "Products imported successfully",
+        "updated_count": updated_count,
+        "created_count": created_count,
+        "synced_arrival_count": synced_arrival_count
     }
-    return StreamingResponse(output, headers=headers)
 
 @app.post("/api/import-products")
 def import_products(file: UploadFile = File(...)):
+    pd = _pandas()
     if not file.filename.endswith('.xlsx'):
         raise HTTPException(status_code=400, detail="Only .xlsx files are allowed")
     
     try:
-        print("\n" + "="*50)
-        print("开始导入商品数据...")
-        
         df = pd.read_excel(file.file)
         required_columns = ['商品编码', '商品名称', '单位']
         if not all(col in df.columns for col in required_columns):
             raise HTTPException(status_code=400, detail="Missing required columns")
         
-        print("\n检测到的列:")
-        print(f"- 必需列: {required_columns}")
-        print(f"- 可选列: ['规格', '预估天数', '描述']")
-        print(f"- 实际列: {list(df.columns)}")
+        logger.debug("商品导入文件的列: %s（必需列 %s，可选列 规格、预估天数、描述）", list(df.columns), required_columns)
         
-        db = SessionLocal()
         try:
-            updated_count = 0
-            created_count = 0
-            
-            print("\n开始处理商品数据:")
-            for _, row in df.iterrows():
-                product_code = str(row['商品编码']).strip()
-                if pd.isna(product_code):
-                    print(f"跳过空行")
-                    continue
-                
-                print("\n" + "-"*30)
-                print(f"处理商品: {product_code}")
-                
-                product_data = {
-                    'code': product_code,
-                    'name': str(row['商品名称']).strip(),
-                    'unit': str(row['单位']).strip(),
-                    'specification': str(row['规格']).strip() if '规格' in df.columns and pd.notna(row['规格']) else None,
-                    'description': str(row['描述']).strip() if '描述' in df.columns and pd.notna(row['描述']) else None,
-                    'reference_days': int(row['预估天数']) if '预估天数' in df.columns and pd.notna(row['预估天数']) else 5
-                }
-                
-                print("商品信息:")
-                for key, value in product_data.items():
-                    print(f"- {key}: {value}")
-                
-                existing_product = db.query(models.Product).filter(models.Product.code == product_code).first()
-                if existing_product:
-                    print("\n更新已存在的商品:")
-                    print(f"- ID: {existing_product.id}")
-                    print("- 更新字段:")
-                    for key, value in product_data.items():
-                        old_value = getattr(existing_product, key)
-                        setattr(existing_product, key, value)
-                        print(f"  * {key}: {old_value} -> {value}")
-                    updated_count += 1
-                else:
-                    print("\n创建新商品")
-                    db_product = models.Product(**product_data)
-                    db.add(db_product)
-                    created_count += 1
-            
-            db.commit()
-            print("\n" + "="*50)
-            print("导入完成!")
-            print(f"- 更新商品数: {updated_count}")
-            print(f"- 新增商品数: {created_count}")
-            print("="*50)
-            
-            return {
-                "message": "Products imported successfully",
-                "updated_count": updated_count,
-                "created_count": created_count
-            }
+            with metrics.import_timer("products", len(df)):
+                return write_queue.call(apply_products_import, df, batchable=False)
         except Exception as e:
-            db.rollback()
-            print(f"\n导入出错: {str(e)}")
+            logger.warning("导入商品出错: %s", e)
             raise HTTPException(status_code=400, detail=str(e))
-        finally:
-            db.close()
     except Exception as e:
-        print(f"\n读取文件出错: {str(e)}")
+        logger.warning("读取商品导入文件出错: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
 # 销量管理API
 @app.get("/api/sales")
-def get_sales(db: Session = Depends(get_db)):
+def get_sales(request: Request, response: Response, db: Session = Depends(get_read_db)):
+    # 列表带商品名称和编码，所以商品变化也会让 ETag 失效
+    cached = not_modified(request, response, "sales", version_mirror.get([SALES, PRODUCTS]))
+    if cached:
+        return cached
     try:
-        query = db.query(models.Sales).options(joinedload(models.Sales.product))
-        sales = query.order_by(models.Sales.date.desc()).all()
-        return [
+        rows = db.execute(
+            select(models.Sales.id, models.Sales.product_id, models.Sales.date, models.Sales.quantity,
+                   models.Product.id, models.Product.name, models.Product.code)
+            .outerjoin(models.Product, models.Product.id == models.Sales.product_id)
+            .order_by(models.Sales.date.desc())
+        )
+        return json_response([
             {
-                "id": sale.id,
-                "product_id": sale.product_id,
-                "date": sale.date.strftime("%Y-%m-%d") if sale.date else None,
-                "quantity": sale.quantity,
+                "id": id,
+                "product_id": product_id,
+                "date": day,
+                "quantity": quantity,
                 "product": {
-                    "id": sale.product.id,
-                    "name": sale.product.name,
-                    "code": sale.product.code
-                } if sale.product is not None else None
+                    "id": product_key,
+                    "name": product_name,
+                    "code": product_code
+                } if product_key is not None else None
             }
-            for sale in sales
-        ]
+            for id, product_id, day, quantity, product_key, product_name, product_code in rows
+        ], response)
     except Exception as e:
-        print(f"获取销量数据时出错: {str(e)}")  # 添加错误日志
+        logger.exception("获取销量数据时出错")
         raise HTTPException(status_code=500, detail=str(e))
 
+def apply_sale_create(db: Session, sale: dict):
+    # 处理日期格式
+    if isinstance(sale["date"], str):
+        if "T" in sale["date"]:
+            date = datetime.fromisoformat(sale["date"].replace("Z", "+00:00")).date()
+        else:
+            date = datetime.strptime(sale["date"], "%Y-%m-%d").date()
+    else:
+        date = sale["date"].date()
+    check_sales_date(date)
+
+    # 检查是否存在相同的销量记录
+    existing_sale = db.query(models.Sales).filter(
+        models.Sales.product_id == sale["product_id"],
+        models.Sales.date == date
+    ).first()
+    if existing_sale:
+        # 如果存在，更新数量
+        logger.debug("更新销量记录: 商品ID=%s, 日期=%s, 新数量=%s", sale["product_id"], date, sale["quantity"])
+        existing_sale.quantity = sale["quantity"]  # 直接替换数量
+        record_sales_changes(db, upserts=[(existing_sale.product_id, date, existing_sale.quantity)])
+        record_change(db, changes.SALE, changes.UPSERT, [existing_sale.id])
+        return existing_sale
+    else:
+        # 如果不存在，创建新记录
+        logger.debug("新增销量记录: 商品ID=%s, 日期=%s, 数量=%s", sale["product_id"], date, sale["quantity"])
+        db_sale = models.Sales(
+            product_id=sale["product_id"],
+            date=date,
+            quantity=sale["quantity"]
+        )
+        db.add(db_sale)
+        db.flush()
+        record_sales_changes(db, upserts=[(db_sale.product_id, date, db_sale.quantity)])
+        record_change(db, changes.SALE, changes.UPSERT, [db_sale.id])
+        return db_sale
+
 @app.post("/api/sales")
-def create_sale(sale: dict, db: Session = Depends(get_db)):
+async def create_sale(sale: dict):
     try:
-        # 处理日期格式
-        if isinstance(sale["date"], str):
-            if "T" in sale["date"]:
-                date = datetime.fromisoformat(sale["date"].replace("Z", "+00:00")).date()
-            else:
-                date = datetime.strptime(sale["date"], "%Y-%m-%d").date()
-        else:
-            date = sale["date"].date()
-
-        # 检查是否存在相同的销量记录
-        existing_sale = db.query(models.Sales).filter(
-            models.Sales.product_id == sale["product_id"],
-            models.Sales.date == date
-        ).first()
-        print(f"对比记录1{models.Sales.product_id}")
-        print(f"对比记录1{sale["product_id"]}")
-        print(f"对比记录2{models.Sales.date}")
-        print(f"对比记录2{date}")
-        if existing_sale:
-            # 如果存在，更新数量
-            print(f"更新销量记录: 商品编码={sale["product_id"]}, 日期={date}, 新数量={sale["quantity"]}")
-            existing_sale.quantity = sale["quantity"]  # 直接替换数量
-            db.commit()
-            db.refresh(existing_sale)
-            return existing_sale
-        else:
-            # 如果不存在，创建新记录
-            print(f"新增销量记录: 商品编码={sale["product_id"]}, 日期={date}, 数量={sale["quantity"]}")
-            db_sale = models.Sales(
-                product_id=sale["product_id"],
-                date=date,
-                quantity=sale["quantity"]
-            )
-            db.add(db_sale)
-            db.commit()
-            db.refresh(db_sale)
-            return db_sale
+        return await write_queue.run(apply_sale_create, sale)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.put("/api/sales/{sale_id}")
-def update_sale(sale_id: int, sale: dict, db: Session = Depends(get_db)):
-    try:
-        db_sale = db.query(models.Sales).filter(models.Sales.id == sale_id).first()
-        if not db_sale:
-            raise HTTPException(status_code=404, detail="Sale not found")
-        
-        # 处理日期格式
-        if isinstance(sale["date"], str):
-            if "T" in sale["date"]:
-                # 处理 ISO 格式的日期时间字符串
-                date = datetime.fromisoformat(sale["date"].replace("Z", "+00:00")).date()
-            else:
-                # 处理 YYYY-MM-DD 格式的日期字符串
-                date = datetime.strptime(sale["date"], "%Y-%m-%d").date()
+def apply_sale_update(db: Session, sale_id: int, sale: dict):
+    db_sale = db.query(models.Sales).filter(models.Sales.id == sale_id).first()
+    if not db_sale:
+        raise HTTPException(status_code=404, detail="Sale not found")
+    
+    # 处理日期格式
+    if isinstance(sale["date"], str):
+        if "T" in sale["date"]:
+            # 处理 ISO 格式的日期时间字符串
+            date = datetime.fromisoformat(sale["date"].replace("Z", "+00:00")).date()
         else:
-            date = sale["date"].date()
+            # 处理 YYYY-MM-DD 格式的日期字符串
+            date = datetime.strptime(sale["date"], "%Y-%m-%d").date()
+    else:
+        date = sale["date"].date()
+    check_sales_date(db_sale.date)
+    check_sales_date(date)
+
+    old_key = (db_sale.product_id, db_sale.date)
+    db_sale.product_id = sale["product_id"]
+    db_sale.date = date
+    db_sale.quantity = sale["quantity"]
+    db.flush()
+    record_sales_changes(db, deletes=[old_key], upserts=[(db_sale.product_id, date, db_sale.quantity)])
+    record_change(db, changes.SALE, changes.UPSERT, [sale_id])
+    return db_sale
 
-        db_sale.product_id = sale["product_id"]
-        db_sale.date = date
-        db_sale.quantity = sale["quantity"]
-        
-        db.commit()
-        db.refresh(db_sale)
-        return db_sale
+@app.put("/api/sales/{sale_id}")
+async def update_sale(sale_id: int, sale: dict):
+    try:
+        return await write_queue.run(apply_sale_update, sale_id, sale)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+def apply_sales_delete(db: Session, sale_id: int):
+    db_sales = db.get(models.Sales, sale_id)
+    if not db_sales:
+        raise HTTPException(status_code=404, detail="销量记录不存在")
+    
+    db.delete(db_sales)
+    record_sales_changes(db, deletes=[(db_sales.product_id, db_sales.date)])
+    record_change(db, changes.SALE, changes.DELETE, [sale_id])
+    return {"message": "销量记录已删除"}
+
 @app.delete("/api/sales/{sale_id}")
 async def delete_sales(sale_id: int):
-    db = SessionLocal()
-    try:
-        db_sales = db.query(models.Sales).filter(models.Sales.id == sale_id).first()
-        if not db_sales:
-            raise HTTPException(status_code=404, detail="销量记录不存在")
-        
-        db.delete(db_sales)
-        db.commit()
-        return {"message": "销量记录已删除"}
-    finally:
-        db.close()
+    return await write_queue.run(apply_sales_delete, sale_id)
+
+# 批量写入销量时单次请求最多的条数
+SALES_BATCH_MAX_ITEMS = 50000
+
+def apply_sales_batch(db: Session, items: List[tuple]):
+    """批量写入销量：items 为 (序号, 商品ID, 商品编码, 日期, 销量)，已有的 商品+日期 更新数量，没有的新增。
+
+    已有记录按商品分批查询，更新和新增各用一条 executemany 语句，全部在同一个事务中。
+    返回 (新增数, 更新数, 错误列表)。
+    """
+    products = catalog.for_session(db).preload(
+        ids=[product_id for _, product_id, _, _, _ in items],
+        codes=[code.strip() for _, product_id, code, _, _ in items if product_id is None and code is not None]
+    )
+    errors = []
+    # (商品ID, 日期) -> 销量，同一商品同一天出现多次时以最后一条为准
+    entries: Dict[tuple, float] = {}
+    for index, product_id, code, day, quantity in items:
+        product = products.get(product_id) if product_id is not None else products.get_by_code(code.strip())
+        if product is None:
+            errors.append({"index": index, "error": f"商品不存在: {product_id if product_id is not None else code}"})
+            continue
+        entries[(product.id, day)] = quantity
+    if not entries:
+        return 0, 0, errors
+
+    first_day = min(day for _, day in entries)
+    last_day = max(day for _, day in entries)
+    existing: Dict[tuple, int] = {}
+    product_ids = sorted({product_id for product_id, _ in entries})
+    for i in range(0, len(product_ids), SQL_IN_BATCH_SIZE):
+        rows = db.execute(
+            select(models.Sales.id, models.Sales.product_id, models.Sales.date)
+            .where(models.Sales.product_id.in_(product_ids[i:i + SQL_IN_BATCH_SIZE]),
+                   models.Sales.date.between(first_day, last_day))
+        )
+        for sale_id, product_id, day in rows:
+            if (product_id, day) in entries:
+                existing.setdefault((product_id, day), sale_id)
+
+    updates = [{"id": existing[key], "quantity": quantity} for key, quantity in entries.items() if key in existing]
+    inserts = [{"product_id": product_id, "date": day, "quantity": quantity}
+               for (product_id, day), quantity in entries.items() if (product_id, day) not in existing]
+    sale_ids = [row["id"] for row in updates]
+    if updates:
+        db.execute(update(models.Sales), updates)
+    if inserts:
+        sale_ids += db.execute(insert(models.Sales).returning(models.Sales.id), inserts).scalars().all()
+
+    record_sales_changes(db, upserts=[(product_id, day, quantity) for (product_id, day), quantity in entries.items()])
+    record_change(db, changes.SALE, changes.UPSERT, sale_ids)
+    return len(inserts), len(updates), errors
+
+@app.post("/api/sales/batch", openapi_extra={"requestBody": {"required": True, "content": {"application/json": {
+    "schema": {"type": "array", "maxItems": SALES_BATCH_MAX_ITEMS, "items": schemas.SalesBatchItem.model_json_schema()},
+    "example": [
+        {"product_id": 1, "date": "2024-03-01", "quantity": 12},
+        {"code": "G001", "date": "2024-03-01", "quantity": 5}
+    ]
+}}}})
+async def create_sales_batch(items: List[Dict[str, Any]]):
+    """批量新增或更新销量（按 商品+日期），每条用 product_id 或 code 指定商品。
+
+    格式错误或商品不存在的条目跳过，在 errors 中按序号返回原因，其余条目在一个事务中写入。
+    所以请求体按 dict 接收、逐条校验（声明成 List[SalesBatchItem] 时一条出错整个请求就是 422），
+    文档中的请求体结构由 openapi_extra 给出。
+    """
+    if len(items) > SALES_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"单次最多写入 {SALES_BATCH_MAX_ITEMS} 条销量")
+
+    valid, errors = [], []
+    for index, raw in enumerate(items):
+        try:
+            item = schemas.SalesBatchItem.model_validate(raw)
+        except ValidationError as e:
+            errors.append({"index": index, "error": "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors()
+            )})
+            continue
+        try:
+            check_sales_date(item.date)
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        valid.append((index, item.product_id, item.code, item.date, item.quantity))
+
+    inserted = updated = 0
+    if valid:
+        try:
+            with metrics.import_timer("sales_batch", len(valid)):
+                inserted, updated, missing = await write_queue.run(apply_sales_batch, valid, batchable=False)
+        except Exception as e:
+            logger.exception("批量写入销量出错")
+            raise HTTPException(status_code=500, detail=str(e))
+        errors = sorted(errors + missing, key=lambda error: error["index"])
+
+    return {
+        "success": True,
+        "message": f"新增 {inserted} 条，更新 {updated} 条",
+        "inserted": inserted,
+        "updated": updated,
+        "errors": errors if errors else None
+    }
 
 @app.post("/api/calculate-order")
-async def calculate_order(request: OrderRequest):
-    db = SessionLocal()
+async def calculate_order(request: OrderRequest, db: AsyncSession = Depends(get_async_read_db)):
+    started = time.perf_counter()
     try:
         results = []
-        local_tz = pytz.timezone('Asia/Shanghai')
-        order_date_utc = request.order_date.replace(tzinfo=pytz.UTC)
+        local_tz = _local_timezone()
+        order_date_utc = request.order_date.replace(tzinfo=timezone.utc)
         order_date_local = order_date_utc.astimezone(local_tz)
         current_date = order_date_local.date()
         
-        print("\n开始计算订单...")
-        print(f"当前日期: {current_date}")
-        
+        await catalog.refresh_async()
+        if not await sales_store.is_current_async():
+            await run_in_threadpool(sales_store.refresh)
+
+        missing_count = no_history_count = to_order_count = 0
+        found = []
         for item in request.items:
-            print(f"\n处理商品ID: {item.product_id}")
-            
             # 获取商品信息
-            product = db.query(models.Product).filter(models.Product.id == item.product_id).first()
+            product = catalog.get(item.product_id)
             if not product:
-                print(f"未找到商品ID: {item.product_id}")
-                continue
-
-            print(f"商品信息: {product.code} - {product.name}")
-
-            # 获取在途记录详情
-            in_transit_records = db.query(models.Arrival).filter(
-                models.Arrival.product_id == item.product_id,  # 保留 product_id 匹配
-                models.Arrival.product_code == product.code,   # 同时匹配 product_code
-                models.Arrival.status == 'pending',
-                models.Arrival.order_date < current_date,  # 下单日期必须小于当天（不包含当天）
-                models.Arrival.expected_date >= current_date  # 到货日期大于等于当天
-            ).all()
-
-            print("\n在途记录:")
-            in_transit_stock = 0
-            for record in in_transit_records:
-                print(f"- ID: {record.id}")
-                print(f"  商品ID: {record.product_id}")
-                print(f"  商品编码: {record.product_code}")
-                print(f"  商品名称: {record.product_name}")
-                print(f"  下单日期: {record.order_date}")
-                print(f"  预计到货日期: {record.expected_date}")
-                print(f"  数量: {record.quantity}")
-                print(f"  状态: {record.status}")
-                in_transit_stock += record.quantity
-
-            print(f"\n计算得出的在途库存: {in_transit_stock}")
-
-            # 解析商品描述中的T+n
-            delivery_days = 3  # 默认3天
-            if product.description:
-                match = re.search(r'T\+(\d+)', product.description)
-                if match:
-                    delivery_days = int(match.group(1))
-                    print(f"\n送货天数: T+{delivery_days}")
-                else:
-                    print(f"\n送货天数: T+{delivery_days} (默认)")
-            
-            # 使用本地时间计算日期
-            local_date = order_date_local.date()
-            end_date = local_date - timedelta(days=1)  # 从昨天开始往前算
-            start_date = end_date - timedelta(days=item.reference_days - 1)
-            
-            print(f"\n日期范围:")
-            print(f"- 订单日期（本地）: {local_date}")
-            print(f"- 统计结束日期: {end_date}")
-            print(f"- 统计开始日期: {start_date}")
-            print(f"- 统计范围: 从 {start_date} 到 {end_date} (共{item.reference_days}天)")
-            
-            sales_data = db.query(models.Sales).filter(
-                models.Sales.product_id == item.product_id,
-                models.Sales.date >= start_date,
-                models.Sales.date <= end_date
-            ).order_by(models.Sales.date.desc()).all()
-            
-            if not sales_data:
-                print("\n没有找到历史销量数据")
-                results.append({
-                    "product_id": item.product_id,
-                    "product_name": product.name,
-                    "product_code": product.code,
-                    "product": {
-                        "specification": product.specification,
-                        "unit": product.unit,
-                        "description": product.description  # 确保包含描述
-                    },
-                    "message": "历史数据不足，请手动设置预估销量",
-                    "order_quantity": 0,
-                    "expected_date": local_date + timedelta(days=delivery_days)
-                })
+                logger.debug("未找到商品ID: %s", item.product_id)
+                missing_count += 1
                 continue
-            
-            print("\n历史销量数据:")
-            daily_sales = []
-            for sale in sales_data:
-                print(f"- {sale.date}: {sale.quantity}")
-                daily_sales.append(sale.quantity)
-
-            print("\n日均销量计算:")
-            print(f"- 销量列表: {daily_sales}")
-            median_sales = statistics.median(daily_sales)
-            print(f"- 中位数日均销量: {median_sales}")
-
-            print("\n预估销量计算:")
-            print(f"- 中位数日均销量 {median_sales} × 预估天数 {item.reference_days}")
-            estimated_sales = median_sales * item.reference_days
-            print(f"- 预估销量 = {estimated_sales}")
-
-            print("\n建议采购量计算:")
-            print(f"- 预估销量 {estimated_sales}")
-            print(f"- 减去 实时库存 ({item.current_stock}) + 在途库存 ({in_transit_stock})")
-            order_quantity = estimated_sales - (item.current_stock + in_transit_stock)
-            print(f"- 建议采购量 = {round(order_quantity, 2)}")
-            
-            if order_quantity <= 0:
-                print("\n结论: 无需补货")
-                results.append({
-                    "product_id": item.product_id,
-                    "product_name": product.name,
-                    "product_code": product.code,
-                    "product": {
-                        "specification": product.specification,
-                        "unit": product.unit,
-                        "description": product.description  # 确保包含描述
-                    },
-                    "message": "无需补货",
-                    "order_quantity": 0,
-                    "expected_date": local_date + timedelta(days=delivery_days),
-                    "estimated_sales": round(estimated_sales, 2),
-                    "median_daily_sales": round(median_sales, 2),
-                    "sales_data": [(sale.date.strftime('%Y-%m-%d'), sale.quantity) for sale in sales_data],
-                    "reference_days": item.reference_days,
-                    "current_stock": item.current_stock,
-                    "in_transit_stock": round(in_transit_stock, 2),
-                    "order_date": local_date.strftime('%Y-%m-%d')
-                })
-            else:
-                print(f"\n结论: 建议采购 {round(order_quantity, 2)} 个")
-                results.append({
-                    "product_id": item.product_id,
-                    "product_name": product.name,
-                    "product_code": product.code,
-                    "product": {
-                        "specification": product.specification,
-                        "unit": product.unit,
-                        "description": product.description  # 确保包含描述
-                    },
-                    "order_quantity": round(order_quantity, 2),
-                    "expected_date": local_date + timedelta(days=delivery_days),
-                    "estimated_sales": round(estimated_sales, 2),
-                    "median_daily_sales": round(median_sales, 2),
-                    "sales_data": [(sale.date.strftime('%Y-%m-%d'), sale.quantity) for sale in sales_data],
-                    "reference_days": item.reference_days,
-                    "current_stock": item.current_stock,
-                    "in_transit_stock": round(in_transit_stock, 2),
-                    "order_date": local_date.strftime('%Y-%m-%d')
-                })
-            
-            print("="*50)
+            found.append((item, product))
+
+        # 在途记录按批一次查出，不再逐个商品查询
+        in_transit = await suggestions.load_in_transit_async(db, [product for _, product in found], current_date)
+
+        for item, product in found:
+            result = suggestions.suggest(product, item.reference_days, item.current_stock,
+                                         in_transit.get(product.id, []), current_date, sales_store.window)
+            if "sales_data" not in result:
+                no_history_count += 1
+            elif result["order_quantity"] > 0:
+                to_order_count += 1
+            results.append(result)
         
+        elapsed = time.perf_counter() - started
+        metrics.observe_calculation(len(request.items), elapsed)
+        # 每个请求一行汇总，逐个商品的计算过程在 DEBUG 级别
+        logger.info(
+            "采购计算完成: %s 个商品，%s 个需要采购，%s 个无历史数据，%s 个商品不存在，耗时 %.1f ms",
+            len(request.items), to_order_count, no_history_count, missing_count, elapsed * 1000,
+            extra={"order_date": str(current_date), "items": len(request.items), "to_order": to_order_count,
+                   "no_history": no_history_count, "missing": missing_count, "duration_ms": round(elapsed * 1000, 1)},
+        )
         return results
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
+
+@app.post("/api/export/calculation")
+async def export_calculation(request: OrderRequest, format: ExportFormat = "xlsx",
+                             db: AsyncSession = Depends(get_async_read_db)):
+    # 导出采购计算结果
+    results = await calculate_order(request, db)
+    rows = (
+        (
+            result["product_code"], result["product_name"], result["product"]["specification"],
+            result["product"]["unit"], result["order_quantity"], result.get("estimated_sales"),
+            result.get("median_daily_sales"), result.get("current_stock"), result.get("in_transit_stock"),
+            result["expected_date"], result.get("message")
+        )
+        for result in results
+    )
+    columns = [Column('商品编码', 15), Column('商品名称', 20), Column('规格', 12), Column('单位', 8),
+               Column('建议采购量', 12), Column('预估销量', 12), Column('中位数日均销量', 14),
+               Column('实时库存', 10), Column('在途库存', 10), Column('预计到货日期', 14), Column('说明', 24)]
+    return await run_in_threadpool(export_response, columns, rows, "calculation", format, '采购计算')
+
+@app.get("/api/suggestions")
+def get_suggestions(order_date: Optional[date] = None, to_order_only: bool = False):
+    """后台预先计算的采购建议（按商品当前库存和预估天数），stale 表示数据已变化、等待重算"""
+    try:
+        return json_response(suggestions.load_suggestions(local_today(), order_date, to_order_only))
+    except Exception as e:
+        logger.exception("读取采购建议出错")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/sales/product/{product_id}")
-def get_product_sales(product_id: int):
-    db = SessionLocal()
+def get_product_sales(product_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    db = ReadSessionLocal()
     try:
-        # 获取指定商品的所有销量记录，按日期降序排序
-        sales = db.query(models.Sales).filter(models.Sales.product_id == product_id).order_by(models.Sales.date.desc()).all()
-        return sales
+        # 获取指定商品的销量记录，按日期降序排序；超出保留期的月份以月汇总返回
+        return json_response(sales_history(db, product_id, start_date, end_date))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         db.close()
 
-@app.post("/api/sales/import")
-def import_sales(file: UploadFile = File(...), db: Session = Depends(get_db)):
+@app.get("/api/sales/rollup")
+def get_sales_rollup(
+    product_id: List[int] = Query(...),
+    granularity: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    max_points: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_read_db)
+):
+    # 图表用：按日/周/月汇总一个或多个商品的销量，max_points 限制返回的点数
+    catalog.refresh()
     try:
-        # 读取Excel文件
-        df = pd.read_excel(file.file)
-        
-        # 验证文件格式
-        if len(df.columns) < 2:  # 至少需要商品编码列和一个日期列
-            raise HTTPException(status_code=400, detail="Excel文件格式不正确，至少需要商品编码列和一个日期列")
+        return sales_rollup(db, product_id, granularity, start_date, end_date, max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # 获取日期列（除第一列外的所有列）
-        dates = df.columns[1:].tolist()
-        print(f"dates:{dates}")
-        success_count = 0
-        error_records = []
-        
-        # 获取所有系统中的商品
-        all_products = db.query(models.Product).all()
-        
-        # 遍历每一行（每个商品）
-        for _, row in df.iterrows():
-            try:
-                print(f"row:{row}")
-                product_code = str(row.iloc[0]).strip()  # 第一列是商品编码
-                
-                # 查找商品
-                product = db.query(models.Product).filter(
-                    models.Product.code == product_code
-                ).first()
-                
-                if not product:
-                    error_records.append({
-                        "商品编码": product_code,
-                        "错误": "商品不存在"
-                    })
-                    continue
-                
-                # 遍历每个日期列
-                for date_str in dates:
+# 分析接口：只读 Parquet 快照，不访问生产数据库
+@app.post("/api/analytics/snapshot")
+async def create_analytics_snapshot(full: bool = False):
+    try:
+        return await run_in_threadpool(analytics.build_snapshot, full)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/api/analytics/snapshot")
+def get_analytics_snapshot():
+    status = analytics.snapshot_status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="尚未生成分析快照")
+    return status
+
+@app.get("/api/analytics/{table}")
+def get_analytics(
+    table: str,
+    group_by: str = "product",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product_id: Optional[List[int]] = Query(None)
+):
+    if table not in analytics.SOURCES:
+        raise HTTPException(status_code=404, detail="只支持 sales 和 arrivals")
+    try:
+        return analytics.aggregate(table, group_by, start_date, end_date, product_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.post("/api/maintenance/archive-sales")
+async def archive_old_sales(before: Optional[date] = None):
+    # 把保留期（或 before 所在月）之前的日销量汇总到月表
+    try:
+        return await run_in_threadpool(archive_sales, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/changes")
+async def get_changes(since: int = Query(0, ge=0),
+                      limit: int = Query(changes.CHANGES_PAGE_SIZE, ge=1, le=changes.CHANGES_PAGE_SIZE)):
+    """增量同步：返回序号大于 since 的变更（NDJSON），客户端保存最后一行的 last_seq 作为下次的 since"""
+    floor = await run_in_threadpool(changes.change_log_floor)
+    if since < floor:
+        raise HTTPException(status_code=410, detail=f"变更日志已压缩到序号 {floor}，请重新全量同步")
+    return StreamingResponse(changes.iter_changes(since, limit), media_type="application/x-ndjson")
+
+@app.post("/api/changes/compact")
+async def compact_changes():
+    return await write_queue.run(changes.compact_change_log, batchable=False)
+
+def apply_sales_import(db: Session, df):
+    pd = _pandas()
+    # 获取日期列（除第一列外的所有列）
+    dates = df.columns[1:].tolist()
+    logger.debug("销量导入日期列: %s", dates)
+    success_count = 0
+    error_records = []
+    # 写入的 (商品ID, 日期, 销量)，提交后同步到内存序列
+    upserts = []
+    # 写入的销量记录，flush 后记到变更日志
+    written_sales = []
+
+    # 日期不能写入的列（已归档的月份）整列跳过，每列记一条错误
+    for date_str in list(dates):
+        formatted_date_str = date_str.strftime('%Y/%m/%d') if isinstance(date_str, datetime) else date_str
+        try:
+            column_date = datetime.strptime(formatted_date_str, '%Y/%m/%d').date()
+        except (TypeError, ValueError):
+            # 格式错误的列仍在下面逐行报错
+            continue
+        try:
+            check_sales_date(column_date)
+        except ValueError as e:
+            dates.remove(date_str)
+            error_records.append({"商品编码": "", "错误": f"日期列 {formatted_date_str}: {e}"})
+
+    # 获取所有系统中的商品
+    products = catalog.for_session(db)
+    all_products = products.all()
+
+    # 遍历每一行（每个商品）
+    for _, row in df.iterrows():
+        try:
+            product_code = str(row.iloc[0]).strip()  # 第一列是商品编码
+
+            # 查找商品
+            product = products.get_by_code(product_code)
+
+            if not product:
+                error_records.append({
+                    "商品编码": product_code,
+                    "错误": "商品不存在"
+                })
+                continue
+
+            # 遍历每个日期列
+            for date_str in dates:
+                try:
+                    # 获取销量
+                    quantity = row[date_str]
+                    if pd.isna(quantity):
+                        continue
+                    # 确保销量是数字
                     try:
-                        # 获取销量
-                        quantity = row[date_str]
-                        if pd.isna(quantity):
-                            continue
-                        print(f"date_str:{date_str}  --- {quantity} ")
-                        # 确保销量是数字
-                        try:
-                            quantity = float(quantity)  # 这里可能会抛出异常
-                        except ValueError:
-                            error_records.append({
-                                "商品编码": product_code,
-                                "错误": f"处理销量数据错误: could not convert string to float: '{quantity}'"
-                            })
-                            continue
-
-                        # 处理日期格式
-                        formatted_date_str = date_str.strftime('%Y/%m/%d') if isinstance(date_str, datetime) else date_str
-                        print(f"格式化第一步{formatted_date_str}")
-                        formatted_date = datetime.strptime(formatted_date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
-                        # formatted_date_str = formatted_date.strftime('%Y-%m-%d')  # 转换为 YYYY-MM-DD 格式
-                        print(f"格式化第二步{formatted_date}")
-
-                        # 检查是否存在相同日期的记录
-                        existing_sale = db.query(models.Sales).filter(
-                            models.Sales.product_id == product.id,
-                            models.Sales.date == formatted_date 
-                        ).first()
-                        # print(f"对比记录1{models.Sales.product_id}")
-                        # print(f"对比记录1{product.id}")
-                        # print(f"对比记录2{models.Sales.date}")
-                        # print(f"对比记录2{formatted_date}")
-
-                        if existing_sale:
-                            print(f"更新销量记录: 商品编码={product_code}, 日期={formatted_date}, 新数量={quantity}")
-                            existing_sale.quantity = quantity  # 更新数量
-                            success_count += 1
-                            # db.commit()
-                            # db.refresh(existing_sale)
-                            # return existing_sale
-                        else:
-                            print(f"新增销量记录: 商品编码={product_code}, 日期={formatted_date}, 数量={quantity}")
-                            db_sale = models.Sales(
-                                product_id=product.id,
-                                date=formatted_date,
-                                quantity=quantity
-                            )
-                            db.add(db_sale)  # 新增记录
-                          
-                            success_count += 1
-                        
-                            
-                    except Exception as e:
+                        quantity = float(quantity)  # 这里可能会抛出异常
+                    except ValueError:
                         error_records.append({
                             "商品编码": product_code,
-                            "错误": f"处理销量数据错误: {str(e)}"
+                            "错误": f"处理销量数据错误: could not convert string to float: '{quantity}'"
                         })
+                        continue
 
-            except Exception as e:
-                error_records.append({
-                    "商品编码": str(row.iloc[0]),
-                    "错误": str(e)
-                })
+                    # 处理日期格式
+                    formatted_date_str = date_str.strftime('%Y/%m/%d') if isinstance(date_str, datetime) else date_str
+                    formatted_date = datetime.strptime(formatted_date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
+                    # formatted_date_str = formatted_date.strftime('%Y-%m-%d')  # 转换为 YYYY-MM-DD 格式
 
-        # 为每个日期，处理系统中存在但Excel中未出现的商品
-        excel_product_codes = set(str(row.iloc[0]).strip() for _, row in df.iterrows() if pd.notna(row.iloc[0]))
-        for date_str in dates:
-            formatted_date_str = date_str.strftime('%Y/%m/%d') if isinstance(date_str, datetime) else date_str
-            formatted_date = datetime.strptime(formatted_date_str, '%Y/%m/%d').date()
-            
-            for product in all_products:
-                print(f'product{product}')
-                print(f'all_products{all_products}')
-                if product.code not in excel_product_codes:
+                    # 检查是否存在相同日期的记录
                     existing_sale = db.query(models.Sales).filter(
-                        
                         models.Sales.product_id == product.id,
-                        models.Sales.date == formatted_date
+                        models.Sales.date == formatted_date 
                     ).first()
-                    print(f'existing_sale{existing_sale}')
-                    if not existing_sale:
+
+                    if existing_sale:
+                        logger.debug("更新销量记录: 商品编码=%s, 日期=%s, 新数量=%s", product_code, formatted_date, quantity)
+                        existing_sale.quantity = quantity  # 更新数量
+                        upserts.append((product.id, formatted_date, quantity))
+                        written_sales.append(existing_sale)
+                        success_count += 1
+                        # db.commit()
+                        # db.refresh(existing_sale)
+                        # return existing_sale
+                    else:
+                        logger.debug("新增销量记录: 商品编码=%s, 日期=%s, 数量=%s", product_code, formatted_date, quantity)
                         db_sale = models.Sales(
                             product_id=product.id,
                             date=formatted_date,
-                            quantity=0
+                            quantity=quantity
                         )
-                        db.add(db_sale)
+                        db.add(db_sale)  # 新增记录
+                        upserts.append((product.id, formatted_date, quantity))
+                        written_sales.append(db_sale)
+
                         success_count += 1
 
-        # 提交数据库会话
-        db.commit()  # 确保所有更改都被提交
-        
-        return {
-            "success": True,
-            "message": f"成功导入 {success_count} 条记录",
-            "errors": error_records if error_records else None
-        }
+
+                except Exception as e:
+                    error_records.append({
+                        "商品编码": product_code,
+                        "错误": f"处理销量数据错误: {str(e)}"
+                    })
+
+        except Exception as e:
+            error_records.append({
+                "商品编码": str(row.iloc[0]),
+                "错误": str(e)
+            })
+
+    # 为每个日期，处理系统中存在但Excel中未出现的商品
+    excel_product_codes = set(str(row.iloc[0]).strip() for _, row in df.iterrows() if pd.notna(row.iloc[0]))
+    for date_str in dates:
+        formatted_date_str = date_str.strftime('%Y/%m/%d') if isinstance(date_str, datetime) else date_str
+        formatted_date = datetime.strptime(formatted_date_str, '%Y/%m/%d').date()
+
+        for product in all_products:
+            if product.code not in excel_product_codes:
+                existing_sale = db.query(models.Sales).filter(
+
+                    models.Sales.product_id == product.id,
+                    models.Sales.date == formatted_date
+                ).first()
+                if not existing_sale:
+                    db_sale = models.Sales(
+                        product_id=product.id,
+                        date=formatted_date,
+                        quantity=0
+                    )
+                    db.add(db_sale)
+                    upserts.append((product.id, formatted_date, 0))
+                    written_sales.append(db_sale)
+                    success_count += 1
+
+    if upserts:
+        record_sales_changes(db, upserts=upserts)
+        db.flush()
+        record_change(db, changes.SALE, changes.UPSERT, [sale.id for sale in written_sales])
+    logger.info("销量导入完成: %s 个日期，成功 %s 条，错误 %s 条", len(dates), success_count, len(error_records))
+
+    return {
+        "success": True,
+        "message": f"成功导入 {success_count} 条记录",
+        "errors": error_records if error_records else None
+    }
+
+@app.post("/api/sales/import")
+def import_sales(file: UploadFile = File(...)):
+    pd = _pandas()
+    try:
+        # 读取Excel文件
+        df = pd.read_excel(file.file)
         
+        # 验证文件格式
+        if len(df.columns) < 2:  # 至少需要商品编码列和一个日期列
+            raise HTTPException(status_code=400, detail="Excel文件格式不正确，至少需要商品编码列和一个日期列")
+
+        with metrics.import_timer("sales", len(df)):
+            return write_queue.call(apply_sales_import, df, batchable=False)
+
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+def apply_sales_reset(db: Session):
+    # 只删除销量数据（包括归档的月汇总），保留商品数据
+    db.query(models.Sales).delete()
+    db.query(models.SalesMonthly).delete()
+    record_sales_changes(db, clear_all=True)
+    record_change(db, changes.SALE, changes.DELETE_WHERE, payload={})
+    return {"message": "销量数据已清空"}
+
 @app.post("/api/reset-database")
-def reset_database():
+async def reset_database():
     try:
-        db = SessionLocal()
-        # 只删除销量数据，保留商品数据
-        db.query(models.Sales).delete()
-        db.commit()
-        return {"message": "销量数据已清空"}
+        return await write_queue.run(apply_sales_reset, batchable=False)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.get("/api/download-stock-template")
-async def download_stock_template():
+def download_stock_template(format: ExportFormat = "xlsx", if_none_match: Optional[str] = Header(None)):
     try:
-        # 创建DataFrame
-        df = pd.DataFrame(columns=['商品编码', '实时库存'])
-        
-        # 获取所有商品
-        db = SessionLocal()
-        products = db.query(models.Product).all()
-        db.close()
-        
-        # 添加所有商品数据
-        for product in products:
-            df.loc[len(df)] = [product.code or '', product.current_stock or 0]
-
-        # 保存为Excel文件
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='实时库存')
-            
-            # 获取工作表
-            worksheet = writer.sheets['实时库存']
-            
-            # 设置列宽
-            worksheet.column_dimensions['A'].width = 15  # 商品编码列
-            worksheet.column_dimensions['B'].width = 12  # 实时库存列
+        def build(path):
+            # 所有商品的编码和实时库存，边读边写
+            rows = (
+                (code or '', current_stock or 0)
+                for code, current_stock in iter_query(select(models.Product.code, models.Product.current_stock))
+            )
+            columns = [Column('商品编码', 15), Column('实时库存', 12)]
+            write_file(columns, rows, path, format, sheet_name='实时库存')
 
-        output.seek(0)
-        
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": "attachment; filename=stock_template.xlsx"
-            }
-        )
+        # 商品增删改或库存导入后重新生成
+        versions = current_versions(PRODUCTS, STOCK)
+        key = (versions[PRODUCTS], versions[STOCK])
+        return template_cache.response("stock_template", format, key, build, "stock_template", if_none_match)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/export/sales")
+def export_sales(
+    format: ExportFormat = "xlsx",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    product_id: Optional[List[int]] = Query(None)
+):
+    # 全量导出销量记录，按日期、商品编码排序
+    query = (
+        select(models.Product.code, models.Product.name, models.Sales.date, models.Sales.quantity)
+        .join(models.Product, models.Sales.product_id == models.Product.id)
+        .order_by(models.Sales.date, models.Product.code)
+    )
+    if start_date:
+        query = query.where(models.Sales.date >= start_date)
+    if end_date:
+        query = query.where(models.Sales.date <= end_date)
+    if product_id:
+        query = query.where(models.Sales.product_id.in_(product_id))
+    columns = [Column('商品编码', 15), Column('商品名称', 20), Column('日期', 12), Column('销量', 10)]
+    return export_response(columns, iter_query(query), "sales", format, sheet_name='销量数据')
+
+@app.get("/api/export/arrivals")
+def export_arrivals(
+    format: ExportFormat = "xlsx",
+    status: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+):
+    # 全量导出到货记录，日期范围按下单日期过滤
+    query = select(
+        models.Arrival.product_code, models.Arrival.product_name, models.Arrival.order_date,
+        models.Arrival.expected_date, models.Arrival.quantity, models.Arrival.status
+    ).order_by(models.Arrival.order_date, models.Arrival.id)
+    if status:
+        query = query.where(models.Arrival.status == status)
+    if start_date:
+        query = query.where(models.Arrival.order_date >= start_date)
+    if end_date:
+        query = query.where(models.Arrival.order_date <= end_date)
+    columns = [Column('商品编码', 15), Column('商品名称', 20), Column('下单日期', 12),
+               Column('预计到货日期', 14), Column('数量', 10), Column('状态', 10)]
+    return export_response(columns, iter_query(query), "arrivals", format, sheet_name='到货记录')
+
+def apply_stock_import(db: Session, df):
+    pd = _pandas()
+    updated_count = 0
+    errors = []
+    stock_updates = {}
+    products = catalog.for_session(db).preload(codes=[str(code).strip() for code in df['商品编码']])
+    
+    for _, row in df.iterrows():
+        product_code = str(row['商品编码']).strip()
+        if pd.isna(product_code):
+            continue
+            
+        try:
+            current_stock = float(row['实时库存'])
+            product = products.get_by_code(product_code)
+            
+            if product:
+                stock_updates[product.id] = current_stock
+                updated_count += 1
+            else:
+                errors.append(f"商品编码 {product_code} 不存在")
+                
+        except ValueError:
+            errors.append(f"商品编码 {product_code} 的实时库存值格式错误")
+
+    # 按主键批量更新库存
+    if stock_updates:
+        db.execute(update(models.Product), [
+            {"id": product_id, "current_stock": current_stock}
+            for product_id, current_stock in stock_updates.items()
+        ])
+        bump_version(db, STOCK)
+        mark_dirty(db, stock_updates)
+        record_change(db, changes.PRODUCT, changes.UPSERT, stock_updates)
+    
+    if errors:
+        return {"message": "部分数据导入成功", "updated_count": updated_count, "errors": errors}
+    return {"message": "导入成功", "updated_count": updated_count}
+
 @app.post("/api/import-stock")
 async def import_stock(file: UploadFile = File(...)):
+    pd = _pandas()
     if not file.filename.endswith('.xlsx'):
         raise HTTPException(status_code=400, detail="只支持.xlsx文件")
     
     try:
-        df = pd.read_excel(file.file)
+        # 解析 Excel 是同步阻塞操作，放到线程池执行
+        df = await run_in_threadpool(pd.read_excel, file.file)
         required_columns = ['商品编码', '实时库存']
         if not all(col in df.columns for col in required_columns):
             raise HTTPException(status_code=400, detail="文件格式错误，请使用正确的模板")
         
-        db = SessionLocal()
-        updated_count = 0
-        errors = []
-        
-        for _, row in df.iterrows():
-            product_code = str(row['商品编码']).strip()
-            if pd.isna(product_code):
-                continue
-                
-            try:
-                current_stock = float(row['实时库存'])
-                product = db.query(models.Product).filter(models.Product.code == product_code).first()
-                
-                if product:
-                    product.current_stock = current_stock
-                    updated_count += 1
-                else:
-                    errors.append(f"商品编码 {product_code} 不存在")
-                    
-            except ValueError:
-                errors.append(f"商品编码 {product_code} 的实时库存值格式错误")
-        
-        db.commit()
-        db.close()
-        
-        if errors:
-            return {"message": "部分数据导入成功", "updated_count": updated_count, "errors": errors}
-        return {"message": "导入成功", "updated_count": updated_count}
+        with metrics.import_timer("stock", len(df)):
+            return await write_queue.run(apply_stock_import, df, batchable=False)
         
     except Exception as e:
-        if db:
-            db.rollback()
-            db.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 # 到货记录API
 @app.get("/api/arrivals")
 async def get_arrivals(
+    request: Request,
+    response: Response,
     product_code: Optional[str] = None,
     product_name: Optional[str] = None,
     status: Optional[str] = None,
@@ -816,10 +1187,18 @@ async def get_arrivals(
     end_date: Optional[date] = None,
     order_start_date: Optional[date] = None,
     order_end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
+    cached = not_modified(request, response, "arrivals", await version_mirror.get_async([ARRIVALS, PRODUCTS]))
+    if cached:
+        return cached
     try:
-        query = db.query(models.Arrival).options(joinedload(models.Arrival.product))
+        query = select(
+            models.Arrival.id, models.Arrival.product_id, models.Arrival.product_code, models.Arrival.product_name,
+            models.Arrival.order_date, models.Arrival.expected_date, models.Arrival.quantity, models.Arrival.status,
+            models.Product.id.label("product_key"), models.Product.code, models.Product.name,
+            models.Product.specification, models.Product.unit
+        ).outerjoin(models.Product, models.Product.id == models.Arrival.product_id)
         
         if product_code:
             query = query.filter(models.Arrival.product_code.ilike(f"%{product_code}%"))
@@ -836,153 +1215,329 @@ async def get_arrivals(
         if order_end_date:
             query = query.filter(models.Arrival.order_date <= order_end_date)
             
-        arrivals = query.order_by(models.Arrival.expected_date.desc()).all()
+        rows = (await db.execute(query.order_by(models.Arrival.expected_date.desc()))).all()
         
-        return [{
-            "id": arrival.id,
-            "product_id": arrival.product_id,
-            "product_code": arrival.product_code,
-            "product_name": arrival.product_name,
-            "order_date": arrival.order_date.strftime("%Y-%m-%d") if arrival.order_date else None,
-            "expected_date": arrival.expected_date.strftime("%Y-%m-%d") if arrival.expected_date else None,
-            "quantity": arrival.quantity,
-            "status": arrival.status,
+        return json_response([{
+            "id": row.id,
+            "product_id": row.product_id,
+            "product_code": row.product_code,
+            "product_name": row.product_name,
+            "order_date": row.order_date,
+            "expected_date": row.expected_date,
+            "quantity": row.quantity,
+            "status": row.status,
             "product": {
-                "id": arrival.product.id,
-                "code": arrival.product.code,
-                "name": arrival.product.name,
-                "specification": arrival.product.specification,
-                "unit": arrival.product.unit
-            } if arrival.product else None
-        } for arrival in arrivals]
+                "id": row.product_key,
+                "code": row.code,
+                "name": row.name,
+                "specification": row.specification,
+                "unit": row.unit
+            } if row.product_key is not None else None
+        } for row in rows], response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def apply_arrival_create(db: Session, arrival: schemas.ArrivalCreate):
+    # 获取商品信息
+    product = catalog.for_session(db).get(arrival.product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="商品不存在")
+
+    # 检查是否存在相同记录
+    existing_arrival = db.query(models.Arrival).filter(
+        models.Arrival.product_id == arrival.product_id,
+        models.Arrival.order_date == arrival.order_date
+    ).first()
+
+    if existing_arrival:
+        # 如果存在，更新数量
+        existing_arrival.quantity = arrival.quantity
+        existing_arrival.expected_date = arrival.expected_date
+        existing_arrival.status = arrival.status
+        existing_arrival.product_code = product.code
+        existing_arrival.product_name = product.name
+        bump_version(db, ARRIVALS)
+        mark_dirty(db, [arrival.product_id])
+        record_change(db, changes.ARRIVAL, changes.UPSERT, [existing_arrival.id])
+        return existing_arrival
+    else:
+        # 如果不存在，创建新记录
+        db_arrival = models.Arrival(
+            product_id=arrival.product_id,
+            product_code=product.code,
+            product_name=product.name,
+            order_date=arrival.order_date,
+            expected_date=arrival.expected_date,
+            quantity=arrival.quantity,
+            status=arrival.status
+        )
+        db.add(db_arrival)
+        db.flush()
+        bump_version(db, ARRIVALS)
+        mark_dirty(db, [arrival.product_id])
+        record_change(db, changes.ARRIVAL, changes.UPSERT, [db_arrival.id])
+        return db_arrival
+
 @app.post("/api/arrivals")
-async def create_arrival(arrival: schemas.ArrivalCreate, db: Session = Depends(get_db)):
+async def create_arrival(arrival: schemas.ArrivalCreate):
     try:
-        # 获取商品信息
-        product = db.query(models.Product).filter(models.Product.id == arrival.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail="商品不存在")
-
-        # 检查是否存在相同记录
-        existing_arrival = db.query(models.Arrival).filter(
-            models.Arrival.product_id == arrival.product_id,
-            models.Arrival.order_date == arrival.order_date
-        ).first()
-
-        if existing_arrival:
-            # 如果存在，更新数量
-            existing_arrival.quantity = arrival.quantity
-            existing_arrival.expected_date = arrival.expected_date
-            existing_arrival.status = arrival.status
-            existing_arrival.product_code = product.code
-            existing_arrival.product_name = product.name
-            db.commit()
-            db.refresh(existing_arrival)
-            return existing_arrival
-        else:
-            # 如果不存在，创建新记录
-            db_arrival = models.Arrival(
-                product_id=arrival.product_id,
-                product_code=product.code,
-                product_name=product.name,
-                order_date=arrival.order_date,
-                expected_date=arrival.expected_date,
-                quantity=arrival.quantity,
-                status=arrival.status
-            )
-            db.add(db_arrival)
-            db.commit()
-            db.refresh(db_arrival)
-            return db_arrival
+        return await write_queue.run(apply_arrival_create, arrival)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
+
+def apply_arrival_update(db: Session, arrival_id: int, arrival: schemas.ArrivalUpdate):
+    db_arrival = db.get(models.Arrival, arrival_id)
+    if not db_arrival:
+        raise HTTPException(status_code=404, detail="到货记录不存在")
+    
+    # 获取商品信息
+    product = catalog.for_session(db).get(db_arrival.product_id)
+    if product:
+        # 更新商品相关信息
+        db_arrival.product_code = product.code
+        db_arrival.product_name = product.name
+    
+    # 更新其他字段
+    for key, value in arrival.model_dump(exclude_unset=True).items():
+        setattr(db_arrival, key, value)
+    db.flush()
+    bump_version(db, ARRIVALS)
+    mark_dirty(db, [db_arrival.product_id])
+    record_change(db, changes.ARRIVAL, changes.UPSERT, [arrival_id])
+    return db_arrival
 
 @app.put("/api/arrivals/{arrival_id}")
-async def update_arrival(arrival_id: int, arrival: schemas.ArrivalUpdate, db: Session = Depends(get_db)):
-    try:
-        db_arrival = db.query(models.Arrival).filter(models.Arrival.id == arrival_id).first()
-        if not db_arrival:
-            raise HTTPException(status_code=404, detail="到货记录不存在")
-        
-        # 获取商品信息
-        product = db.query(models.Product).filter(models.Product.id == db_arrival.product_id).first()
-        if product:
-            # 更新商品相关信息
-            db_arrival.product_code = product.code
-            db_arrival.product_name = product.name
-        
-        # 更新其他字段
-        for key, value in arrival.model_dump(exclude_unset=True).items():
-            setattr(db_arrival, key, value)
-        
-        db.commit()
-        db.refresh(db_arrival)
-        return db_arrival
-    finally:
-        db.close()
+async def update_arrival(arrival_id: int, arrival: schemas.ArrivalUpdate):
+    return await write_queue.run(apply_arrival_update, arrival_id, arrival)
+
+def apply_arrival_delete(db: Session, arrival_id: int):
+    db_arrival = db.get(models.Arrival, arrival_id)
+    if not db_arrival:
+        raise HTTPException(status_code=404, detail="到货记录不存在")
+    
+    db.delete(db_arrival)
+    bump_version(db, ARRIVALS)
+    mark_dirty(db, [db_arrival.product_id])
+    record_change(db, changes.ARRIVAL, changes.DELETE, [arrival_id])
+    return {"message": "到货记录已删除"}
 
 @app.delete("/api/arrivals/{arrival_id}")
 async def delete_arrival(arrival_id: int):
-    db = SessionLocal()
-    try:
-        db_arrival = db.query(models.Arrival).filter(models.Arrival.id == arrival_id).first()
-        if not db_arrival:
-            raise HTTPException(status_code=404, detail="到货记录不存在")
-        
-        db.delete(db_arrival)
-        db.commit()
-        return {"message": "到货记录已删除"}
-    finally:
-        db.close()
+    return await write_queue.run(apply_arrival_delete, arrival_id)
 
 class DeleteArrivalsRequest(BaseModel):
     arrival_ids: List[int]
 
+def apply_arrivals_batch_delete(db: Session, arrival_ids: List[int]):
+    # 删除前查出涉及的商品，用于标记采购建议
+    product_ids = db.execute(
+        select(models.Arrival.product_id).where(models.Arrival.id.in_(arrival_ids)).distinct()
+    ).scalars().all()
+    # 删除指定的到货记录
+    deleted_count = db.query(models.Arrival).filter(
+        models.Arrival.id.in_(arrival_ids)
+    ).delete(synchronize_session=False)
+    if deleted_count:
+        bump_version(db, ARRIVALS)
+        mark_dirty(db, product_ids)
+        record_change(db, changes.ARRIVAL, changes.DELETE, arrival_ids)
+    
+    return {
+        "success": True,
+        "message": f"成功删除 {deleted_count} 条记录"
+    }
+
 @app.post("/api/arrivals/batch-delete")
-def batch_delete_arrivals(request: DeleteArrivalsRequest, db: Session = Depends(get_db)):
+async def batch_delete_arrivals(request: DeleteArrivalsRequest):
     try:
-        # 删除指定的到货记录
-        deleted_count = db.query(models.Arrival).filter(
-            models.Arrival.id.in_(request.arrival_ids)
-        ).delete(synchronize_session=False)
-        
-        db.commit()
-        return {
-            "success": True,
-            "message": f"成功删除 {deleted_count} 条记录"
-        }
+        return await write_queue.run(apply_arrivals_batch_delete, request.arrival_ids, batchable=False)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 class DeleteProductsRequest(BaseModel):
     product_ids: List[int]
+    background: bool = False  # 为 True 时后台执行，通过任务ID查询进度
+
+# 级联删除时每批删除的销量/到货记录数，每批单独提交，避免长时间占用 SQLite 写锁
+DELETE_CHUNK_SIZE = 5000
+# 最多保留的删除任务记录数
+MAX_DELETE_JOBS = 100
+
+delete_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# 任务状态同时写到共享目录，多进程部署时轮询请求落到其他进程也能查到
+DELETE_JOBS_DIR = os.path.join(WORKER_LOCK_DIR, "delete-jobs")
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+def delete_job_path(job_id: str) -> str:
+    return os.path.join(DELETE_JOBS_DIR, f"{job_id}.json")
+
+def save_delete_job(job: Dict[str, Any]):
+    try:
+        os.makedirs(DELETE_JOBS_DIR, exist_ok=True)
+        path = delete_job_path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # 时间与接口返回的格式一致（ISO 8601）
+            json.dump(job, f, ensure_ascii=False, default=lambda value: value.isoformat())
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.warning("删除任务 %s 的状态写入 %s 失败", job["job_id"], DELETE_JOBS_DIR, exc_info=True)
+
+def load_delete_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = delete_jobs.get(job_id)
+    if job is not None or not JOB_ID_PATTERN.fullmatch(job_id):
+        return job
+    try:
+        with open(delete_job_path(job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def new_delete_job(product_ids: List[int]) -> Dict[str, Any]:
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "pending",
+        "product_count": len(product_ids),
+        "deleted": {"sales": 0, "archived_sales": 0, "arrivals": 0, "products": 0},
+        "started_at": None,
+        "finished_at": None,
+        "error": None
+    }
+
+def create_delete_job(product_ids: List[int]) -> Dict[str, Any]:
+    # 登记任务并写状态文件，可以通过 /api/products/delete-jobs/{job_id} 查询
+    job = new_delete_job(product_ids)
+    delete_jobs[job["job_id"]] = job
+    save_delete_job(job)
+    while len(delete_jobs) > MAX_DELETE_JOBS:
+        old_job_id, _ = delete_jobs.popitem(last=False)
+        try:
+            os.remove(delete_job_path(old_job_id))
+        except OSError:
+            pass
+    return job
+
+def delete_chunk(db: Session, model, product_ids: List[int], chunk_size: int) -> int:
+    chunk_ids = select(model.id).where(model.product_id.in_(product_ids)).limit(chunk_size)
+    deleted = db.execute(
+        delete(model).where(model.id.in_(chunk_ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    if model is models.Sales and deleted:
+        # 这些商品正在被删除，第一批删除后内存序列就整行清空
+        record_sales_changes(db, cleared_products=product_ids)
+        record_change(db, changes.SALE, changes.DELETE_WHERE, payload={"product_id": product_ids})
+    elif model is models.Arrival and deleted:
+        bump_version(db, ARRIVALS)
+        mark_dirty(db, product_ids)
+        record_change(db, changes.ARRIVAL, changes.DELETE_WHERE, payload={"product_id": product_ids})
+    return deleted
+
+def delete_product_rows(db: Session, product_ids: List[int]) -> int:
+    # 预先计算的采购建议是派生数据，随商品一起删除
+    db.execute(
+        delete(models.Suggestion).where(models.Suggestion.product_id.in_(product_ids))
+        .execution_options(synchronize_session=False)
+    )
+    deleted = db.execute(
+        delete(models.Product).where(models.Product.id.in_(product_ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    bump_version(db, PRODUCTS)
+    record_change(db, changes.PRODUCT, changes.DELETE, product_ids)
+    return deleted
+
+def delete_products_chunked(product_ids: List[int], job: Optional[Dict[str, Any]] = None,
+                            chunk_size: int = DELETE_CHUNK_SIZE) -> Dict[str, int]:
+    """按商品ID删除商品及其销量、到货记录。
+
+    依赖记录按 chunk_size 分批集合式删除，每批是一个独立的写队列任务，
+    其他写操作可以插在批次之间执行；商品行最后删除，中途失败时重新执行即可继续。
+    进度写入 job["deleted"]。需在线程中调用（会阻塞等待写队列）。
+    不传 job 时（删除单个商品）进度只记在内存中，不登记任务、不写状态文件。
+    """
+    registered = job is not None
+    if job is None:
+        job = new_delete_job(product_ids)
+
+    def save_progress():
+        if registered:
+            save_delete_job(job)
+
+    job["status"] = "running"
+    job["started_at"] = datetime.now()
+    save_progress()
+    deleted = job["deleted"]
+
+    try:
+        product_ids = list(dict.fromkeys(product_ids))
+        for i in range(0, len(product_ids), SQL_IN_BATCH_SIZE):
+            batch = product_ids[i:i + SQL_IN_BATCH_SIZE]
+            for model, key in ((models.Sales, "sales"), (models.SalesMonthly, "archived_sales"),
+                               (models.Arrival, "arrivals")):
+                while True:
+                    count = write_queue.call(delete_chunk, model, batch, chunk_size, batchable=False)
+                    deleted[key] += count
+                    save_progress()
+                    if count < chunk_size:
+                        break
+            deleted["products"] += write_queue.call(delete_product_rows, batch, batchable=False)
+
+        job["status"] = "completed"
+        return dict(deleted)
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        raise
+    finally:
+        job["finished_at"] = datetime.now()
+        save_progress()
+
+def run_delete_job(product_ids: List[int], job: Dict[str, Any]):
+    try:
+        delete_products_chunked(product_ids, job)
+    except Exception:
+        logger.exception("后台删除商品出错")
 
 @app.post("/api/products/batch-delete")
-async def batch_delete_products(request: DeleteProductsRequest):
-    db = SessionLocal()
+async def batch_delete_products(request: DeleteProductsRequest, background_tasks: BackgroundTasks):
+    job = create_delete_job(request.product_ids)
+    if request.background:
+        background_tasks.add_task(run_delete_job, request.product_ids, job)
+        return {
+            "success": True,
+            "message": "删除任务已提交",
+            "job_id": job["job_id"]
+        }
+
     try:
-        # 删除指定的商品
-        deleted_count = db.query(models.Product).filter(
-            models.Product.id.in_(request.product_ids)
-        ).delete(synchronize_session=False)
-        
-        db.commit()
+        deleted = await run_in_threadpool(delete_products_chunked, request.product_ids, job)
         return {
             "success": True,
-            "message": f"成功删除 {deleted_count} 个商品"
+            "message": f"成功删除 {deleted['products']} 个商品",
+            "job_id": job["job_id"],
+            "deleted": deleted
         }
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
+
+@app.get("/api/products/delete-jobs/{job_id}")
+def get_delete_job(job_id: str):
+    job = load_delete_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="删除任务不存在")
+    return job
+
+def apply_arrivals_resync(db: Session) -> int:
+    return sync_arrival_product_fields(db)
+
+# 维护接口：按商品表重新同步全部到货记录的编码和名称
+@app.post("/api/arrivals/resync-products")
+async def resync_arrival_products():
+    try:
+        updated_count = await write_queue.run(apply_arrivals_resync, batchable=False)
+    except Exception as e:
+        logger.exception("同步到货记录的商品信息出错")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": True, "message": f"已同步 {updated_count} 条到货记录", "updated_count": updated_count}
 
 # 检查到货记录是否存在
 @app.get("/api/arrivals/check")
@@ -990,18 +1545,22 @@ async def check_arrival(
     product_code: str,
     product_name: str,
     order_date: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     try:
         # 将order_date字符串转换为日期对象
         order_date_obj = datetime.strptime(order_date, '%Y-%m-%d').date()
         
-        # 查询是否存在相同记录
-        existing_arrival = db.query(models.Arrival).filter(
+        # 查询是否存在相同记录；编码能在目录中找到时再按 product_id 过滤，走索引
+        query = select(models.Arrival).filter(
             models.Arrival.product_code == product_code,
             models.Arrival.product_name == product_name,
             models.Arrival.order_date == order_date_obj
-        ).first()
+        )
+        product = (await catalog.refresh_async()).get_by_code(product_code)
+        if product:
+            query = query.filter(models.Arrival.product_id == product.id)
+        existing_arrival = (await db.execute(query)).scalars().first()
         
         if existing_arrival:
             return {
@@ -1018,113 +1577,129 @@ async def check_arrival(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/arrivals/import")
-def import_arrivals(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    try:
-        # 读取Excel文件
-        df = pd.read_excel(file.file)
+def apply_arrivals_import(db: Session, df):
+    pd = _pandas()
+    # 获取日期列（除第一列外的所有列）
+    dates = df.columns[1:].tolist()
+    success_count = 0
+    error_records = []
+    # 写入的到货记录，flush 后记到变更日志
+    written_arrivals = []
+    products = catalog.for_session(db).preload(codes=[str(code).strip() for code in df.iloc[:, 0]])
+
+    # 遍历每一行（每个商品）
+    for _, row in df.iterrows():
+        try:
+            product_code = str(row.iloc[0]).strip()  # 第一列是商品编码
 
-        # 验证文件格式
-        if len(df.columns) < 2:  # 至少需要商品编码列和一个日期列
-            raise HTTPException(status_code=400, detail="Excel文件格式不正确，至少需要商品编码列和一个日期列")
+            # 查找商品
+            product = products.get_by_code(product_code)
 
-        # 获取日期列（除第一列外的所有列）
-        dates = df.columns[1:].tolist()
-        success_count = 0
-        error_records = []
+            if not product:
+                error_records.append({
+                    "商品编码": product_code,
+                    "错误": "商品不存在"
+                })
+                continue
 
-        # 遍历每一行（每个商品）
-        for _, row in df.iterrows():
-            try:
-                product_code = str(row.iloc[0]).strip()  # 第一列是商品编码
+            # 描述中的 T+n，没有时为 0
+            delivery_days = product.lead_days or 0
+
+            # 遍历每个日期列
+            for date_str in dates:
+                try:
+                    quantity = row[date_str]
+                    if pd.isna(quantity):
+                        continue
+
+                    # 确保数量是数字
+                    quantity = float(quantity)
+
+                    # # 处理预计到货日期
+                    # arrival_date = datetime.strptime(date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
+
+
+                    if isinstance(date_str, str):
+                        arrival_date = datetime.strptime(date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
+                    else:
+                        arrival_date = date_str.date()  # 如果已经是 datetime 对象，直接使用
+                    # 计算下单日期
+                    order_date = arrival_date - timedelta(days=delivery_days)
+                    # 检查是否存在相同日期的记录
+                    existing_arrival = db.query(models.Arrival).filter(
+                        models.Arrival.product_id == product.id,
+                        models.Arrival.order_date == order_date
+                    ).first()
 
-                # 查找商品
-                product = db.query(models.Product).filter(
-                    models.Product.code == product_code
-                ).first()
+                    if existing_arrival:
+                        logger.debug("更新到货记录: 商品编码=%s, 下单日期=%s, 预计到货日期=%s, 新增数量=%s",
+                                     product_code, order_date, arrival_date, quantity)
+                        existing_arrival.quantity += quantity  # 更新数量
+                        written_arrivals.append(existing_arrival)
+                    else:
+                        logger.debug("新增到货记录: 商品编码=%s, 下单日期=%s, 预计到货日期=%s, 数量=%s",
+                                     product_code, order_date, arrival_date, quantity)
+                        db_arrival = models.Arrival(
+                            product_id=product.id,
+                            product_code=product_code,
+                            order_date=order_date,
+                            expected_date=arrival_date,
+                            quantity=quantity,
+                            status='pending'  # 默认状态
+                        )
+                        db.add(db_arrival)  # 新增记录
+                        written_arrivals.append(db_arrival)
+
+                    success_count += 1
 
-                if not product:
+                except Exception as e:
                     error_records.append({
                         "商品编码": product_code,
-                        "错误": "商品不存在"
+                        "错误": f"处理到货数据错误: {str(e)}"
                     })
-                    continue
 
-                # 提取描述中的 T+n
-                description = product.description or ""
-                delivery_days = 0
-                match = re.search(r'T\+(\d+)', description)
-                if match:
-                    delivery_days = int(match.group(1))
-
-                # 遍历每个日期列
-                for date_str in dates:
-                    try:
-                        quantity = row[date_str]
-                        if pd.isna(quantity):
-                            continue
-
-                        # 确保数量是数字
-                        quantity = float(quantity)
-
-                        # # 处理预计到货日期
-                        # arrival_date = datetime.strptime(date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
-                        
-
-                        if isinstance(date_str, str):
-                            arrival_date = datetime.strptime(date_str, '%Y/%m/%d').date()  # 假设原始格式为 YYYY/MM/DD
-                        else:
-                            arrival_date = date_str.date()  # 如果已经是 datetime 对象，直接使用
-                        # 计算下单日期
-                        order_date = arrival_date - timedelta(days=delivery_days)
-                        # 检查是否存在相同日期的记录
-                        existing_arrival = db.query(models.Arrival).filter(
-                            models.Arrival.product_id == product.id,
-                            models.Arrival.order_date == order_date
-                        ).first()
-
-                        if existing_arrival:
-                            print(f"更新到货记录: 商品编码={product_code}, 下单日期={order_date}, 预计到货日期={arrival_date}, 新数量={quantity}")
-                            existing_arrival.quantity += quantity  # 更新数量
-                        else:
-                            print(f"新增到货记录: 商品编码={product_code}, 下单日期={order_date}, 预计到货日期={arrival_date}, 数量={quantity}")
-                            db_arrival = models.Arrival(
-                                product_id=product.id,
-                                product_code=product_code,
-                                order_date=order_date,
-                                expected_date=arrival_date,
-                                quantity=quantity,
-                                status='pending'  # 默认状态
-                            )
-                            db.add(db_arrival)  # 新增记录
-
-                        success_count += 1
-
-                    except Exception as e:
-                        error_records.append({
-                            "商品编码": product_code,
-                            "错误": f"处理到货数据错误: {str(e)}"
-                        })
+        except Exception as e:
+            error_records.append({
+                "商品编码": str(row.iloc[0]),
+                "错误": str(e)
+            })
+
+    if success_count:
+        bump_version(db, ARRIVALS)
+        db.flush()
+        mark_dirty(db, [arrival.product_id for arrival in written_arrivals])
+        record_change(db, changes.ARRIVAL, changes.UPSERT, [arrival.id for arrival in written_arrivals])
+    logger.info("到货导入完成: 成功 %s 条，错误 %s 条", success_count, len(error_records))
+
+    return {
+        "success": True,
+        "message": f"成功导入 {success_count} 条记录",
+        "errors": error_records if error_records else None
+    }
 
-            except Exception as e:
-                error_records.append({
-                    "商品编码": str(row.iloc[0]),
-                    "错误": str(e)
-                })
+@app.post("/api/arrivals/import")
+def import_arrivals(file: UploadFile = File(...)):
+    pd = _pandas()
+    try:
+        # 读取Excel文件
+        df = pd.read_excel(file.file)
 
-        # 提交数据库会话
-        db.commit()  # 确保所有更改都被提交
+        # 验证文件格式
+        if len(df.columns) < 2:  # 至少需要商品编码列和一个日期列
+            raise HTTPException(status_code=400, detail="Excel文件格式不正确，至少需要商品编码列和一个日期列")
 
-        return {
-            "success": True,
-            "message": f"成功导入 {success_count} 条记录",
-            "errors": error_records if error_records else None
-        }
+        with metrics.import_timer("arrivals", len(df)):
+            return write_queue.call(apply_arrivals_import, df, batchable=False)
 
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    port = int(os.getenv("PORT", "8000"))
+    if WORKERS > 1:
+        # 先在父进程中完成迁移，工作进程启动时不再同时升级表结构
+        ensure_schema()
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
@@ -0,0 +1,225 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Prometheus 文本格式（/metrics），不依赖外部库；所有指标都在进程内存中累计
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [各桶计数（非累计，最后一个是 +Inf）, 总和, 次数]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((labels, ([*state[0]], state[1], state[2])) for labels, state in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(float(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}"
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP 请求耗时（到响应体发送完）", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "正在处理的 HTTP 请求数", ("method",))
+REQUEST_DB_STATEMENTS = Histogram("http_request_db_statements", "每个请求执行的 SQL 语句数", ("method", "route"),
+                                  buckets=COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "每个请求执行 SQL 的总耗时", ("method", "route"))
+DB_STATEMENTS = Counter("db_statements_total", "执行的 SQL 语句数", ("engine",))
+DB_SECONDS = Counter("db_statement_seconds_total", "执行 SQL 的总耗时", ("engine",))
+IMPORT_ROWS = Counter("import_rows_total", "导入处理的行数", ("kind",))
+IMPORT_SECONDS = Histogram("import_duration_seconds", "导入写入耗时", ("kind",))
+CALCULATION_ITEMS = Counter("calculate_order_items_total", "采购计算处理的商品数")
+CALCULATION_SECONDS = Histogram("calculate_order_duration_seconds", "采购计算耗时")
+CALCULATION_RATE = Gauge("calculate_order_items_per_second", "最近一次采购计算每秒处理的商品数")
+ADMISSION_ACTIVE = Gauge("admission_active_requests", "准入控制：各类别正在执行的请求数", ("lane",))
+ADMISSION_QUEUED = Gauge("admission_queued_requests", "准入控制：各类别排队等待的请求数", ("lane",))
+ADMISSION_WAIT = Histogram("admission_wait_seconds", "准入控制：请求排队等待的时间", ("lane",))
+ADMISSION_REJECTED = Counter("admission_rejected_total", "准入控制：返回 429 的请求数", ("lane", "reason"))
+
+
+class QueryStats:
+    """一个请求内执行的 SQL 统计，通过 contextvar 传到线程池和写队列线程"""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+current_query_stats: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def instrument_engine(sync_engine, name: str):
+    """在引擎上挂事件统计 SQL 语句数和耗时；异步引擎传 async_engine.sync_engine"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_STATEMENTS.inc(name)
+        DB_SECONDS.inc(name, amount=elapsed)
+        stats = current_query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+class MetricsMiddleware:
+    """纯 ASGI 中间件：记录每个路由的耗时、状态码、在途请求数和 SQL 统计。
+
+    路由按模板（如 /api/sales/{sale_id}）而不是实际路径聚合，未匹配的请求记为 unmatched。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+        HTTP_IN_FLIGHT.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec(method)
+            current_query_stats.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(method, route, status[0])
+            HTTP_LATENCY.observe(elapsed, method, route)
+            REQUEST_DB_STATEMENTS.observe(stats.count, method, route)
+            REQUEST_DB_SECONDS.observe(stats.seconds, method, route)
+
+
+@contextmanager
+def import_timer(kind: str, rows: int):
+    """记录一次导入的行数和写入耗时（只统计成功的导入），吞吐量 = import_rows_total / import_duration_seconds_sum"""
+    start = time.perf_counter()
+    yield
+    IMPORT_SECONDS.observe(time.perf_counter() - start, kind)
+    IMPORT_ROWS.inc(kind, amount=rows)
+
+
+def observe_calculation(items: int, seconds: float):
+    CALCULATION_ITEMS.inc(amount=items)
+    CALCULATION_SECONDS.observe(seconds)
+    if seconds > 0:
+        CALCULATION_RATE.set(value=items / seconds)
@@ -0,0 +1,116 @@
+import ast
+import logging
+import os
+from typing import List, Set
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# 启动时的表结构处理：upgrade（默认，自动执行未应用的迁移）、check（不是最新版本就拒绝启动，
+# 适合由部署流程单独执行 alembic upgrade head 的环境）、off（不检查）
+DB_SCHEMA_MODE = os.getenv("DB_SCHEMA_MODE", "upgrade")
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic")
+
+
+def _alembic_config(connection: Connection):
+    # 不读取 alembic.ini：其中的日志配置会覆盖应用的日志设置
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    config.attributes["connection"] = connection
+    return config
+
+
+def _current_revisions(connection: Connection) -> Set[str]:
+    if "alembic_version" not in inspect(connection).get_table_names():
+        return set()
+    return {row[0] for row in connection.execute(text("SELECT version_num FROM alembic_version"))}
+
+
+def _script_heads() -> Set[str]:
+    """不导入 alembic，直接从迁移文件中的 revision / down_revision 算出最新版本。
+
+    启动时绝大多数情况下数据库已是最新，这样可以省掉导入 alembic 的时间。
+    """
+    revisions, parents = set(), set()
+    versions_dir = os.path.join(ALEMBIC_DIR, "versions")
+    for file_name in os.listdir(versions_dir):
+        if not file_name.endswith(".py"):
+            continue
+        with open(os.path.join(versions_dir, file_name), encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        values = {}
+        for node in tree.body:
+            if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name) and node.value is not None:
+                values[node.target.id] = node.value
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                values[node.targets[0].id] = node.value
+        if "revision" not in values:
+            continue
+        revisions.add(ast.literal_eval(values["revision"]))
+        down_revision = ast.literal_eval(values["down_revision"]) if "down_revision" in values else None
+        if isinstance(down_revision, str):
+            parents.add(down_revision)
+        elif down_revision:
+            parents.update(down_revision)
+    return revisions - parents
+
+
+def _legacy_revisions(connection: Connection) -> List[str]:
+    """以前的版本在导入时用 create_all 建表，没有 alembic_version。
+
+    按已有的表和列推断对应的迁移版本；之后的迁移在表已存在时会跳过建表，可以直接升级。
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    if "products" not in tables:
+        return []
+    product_columns = {column["name"] for column in inspector.get_columns("products")}
+    revisions = ["9aaa774f1353" if "current_stock" in product_columns else "a41d9f3b6f86"]
+    if "arrivals" in tables:
+        arrival_columns = {column["name"] for column in inspector.get_columns("arrivals")}
+        revisions.append("add_product_fields_arrivals" if "product_code" in arrival_columns else "01808a83b111")
+    return revisions
+
+
+def ensure_schema(mode: str = None):
+    """启动时把数据库升级到最新迁移版本（或按 DB_SCHEMA_MODE 只做检查）。
+
+    整个过程在一个写事务中完成：多个进程同时启动时，后拿到写锁的进程看到的已经是最新版本。
+    """
+    mode = mode or DB_SCHEMA_MODE
+    if mode == "off":
+        return
+
+    with engine.begin() as connection:
+        current = _current_revisions(connection)
+        if current == _script_heads():
+            return
+
+        from alembic import command
+        from alembic.script import ScriptDirectory
+
+        config = _alembic_config(connection)
+        heads = set(ScriptDirectory.from_config(config).get_heads())
+        if current == heads:
+            return
+        if mode == "check":
+            raise RuntimeError(
+                f"数据库结构版本 {sorted(current) or '（无）'} 不是最新的 {sorted(heads)}，"
+                f"请先在 backend 目录执行 alembic upgrade head"
+            )
+
+        if not current:
+            legacy = _legacy_revisions(connection)
+            if legacy:
+                logger.info("已有数据库没有迁移记录，按现有表结构标记为 %s", legacy)
+                command.stamp(config, legacy)
+                current = set(legacy)
+        logger.info("数据库结构从 %s 升级到 %s", sorted(current) or "（空）", sorted(heads))
+        command.upgrade(config, "heads")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, DateTime, Index, UniqueConstraint, Text
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -26,6 +26,21 @@ class Sales(Base):
     quantity = Column(Float)
     product = relationship("Product", back_populates="sales") 
 
+    # 采购计算和历史查询都按 商品 + 日期范围 查
+    __table_args__ = (Index("ix_sales_product_date", "product_id", "date"),)
+
+class SalesMonthly(Base):
+    """超出保留期的销量按 商品 + 月 汇总后存放在这里，原始日记录从 sales 表删除"""
+    __tablename__ = "sales_monthly"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    month = Column(Date, nullable=False)  # 当月第一天
+    quantity = Column(Float, nullable=False, default=0)  # 当月销量合计
+    days = Column(Integer, nullable=False, default=0)  # 汇总的日记录数
+
+    __table_args__ = (UniqueConstraint("product_id", "month", name="uq_sales_monthly_product_month"),)
+
 class Arrival(Base):
     __tablename__ = "arrivals"
 
@@ -40,4 +55,60 @@ class Arrival(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    product = relationship("Product", back_populates="arrivals") 
\ No newline at end of file
+    product = relationship("Product", back_populates="arrivals") 
+
+class ChangeVersion(Base):
+    __tablename__ = "change_versions"
+
+    name = Column(String, primary_key=True)  # 计数器名称，如 products
+    version = Column(Integer, nullable=False, default=0)  # 每次相关写操作提交时加一
+
+class ChangeLog(Base):
+    """变更日志，供客户端按序号增量同步"""
+    __tablename__ = "change_log"
+
+    seq = Column(Integer, primary_key=True)  # 单调递增的序号（AUTOINCREMENT，删除后也不会复用）
+    entity = Column(String, nullable=False)  # product / sale / arrival
+    entity_id = Column(Integer, nullable=True)  # 批量操作时为空
+    op = Column(String, nullable=False)  # upsert / delete / delete_where
+    payload = Column(Text, nullable=True)  # delete_where 的条件（JSON）
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_change_log_entity", "entity", "entity_id"),
+        Index("ix_change_log_created_at", "created_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+class Suggestion(Base):
+    """预先计算的采购建议，每个商品每天一行；由后台任务只重算被标记的商品"""
+    __tablename__ = "suggestions"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    order_date = Column(Date, nullable=False)  # 计算所用的当天（本地日期）
+    order_quantity = Column(Float, nullable=False, default=0)
+    expected_date = Column(Date, nullable=False)
+    estimated_sales = Column(Float, nullable=True)  # 没有历史销量时为空
+    median_daily_sales = Column(Float, nullable=True)
+    reference_days = Column(Integer, nullable=False)
+    current_stock = Column(Float, nullable=False, default=0)
+    in_transit_stock = Column(Float, nullable=False, default=0)
+    message = Column(String, nullable=True)
+    sales_data = Column(Text, nullable=True)  # 参与计算的 [日期, 销量]（JSON）
+    computed_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("product_id", "order_date", name="uq_suggestions_product_date"),
+        Index("ix_suggestions_order_date", "order_date"),
+    )
+
+class SuggestionDirty(Base):
+    """需要重算建议的商品，由销量、到货、库存写操作在同一事务中写入；product_id 为空表示全部商品"""
+    __tablename__ = "suggestion_dirty"
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=True)
+    marked_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_suggestion_dirty_product_id", "product_id"), {"sqlite_autoincrement": True})
@@ -0,0 +1,206 @@
+import contextvars
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# 被剖析的请求比例：开发环境设为 1 记录每个请求，生产环境用小比例抽样，0 为关闭
+SQL_PROFILE_SAMPLE_RATE = float(os.getenv("SQL_PROFILE_SAMPLE_RATE", "0"))
+# 同一语句形状在一个请求内执行超过这么多次即视为 N+1
+SQL_PROFILE_N1_THRESHOLD = int(os.getenv("SQL_PROFILE_N1_THRESHOLD", "10"))
+# 为 1 时允许客户端用请求头 X-SQL-Profile: 1 强制剖析该请求，并在响应头中返回统计
+SQL_PROFILE_HEADER = os.getenv("SQL_PROFILE_HEADER", "0") == "1"
+# 内存中保留的最近报告数
+SQL_PROFILE_KEEP = int(os.getenv("SQL_PROFILE_KEEP", "200"))
+
+RESPONSE_HEADERS = ["X-SQL-Profile-Id", "X-SQL-Statements", "X-SQL-Time-Ms", "X-SQL-N-Plus-One"]
+
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\(\?\))(?:\s*,\s*\(\?\))+", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+_fingerprints: Dict[str, tuple] = {}
+_FINGERPRINT_CACHE_SIZE = 4096
+
+
+def normalize(statement: str) -> str:
+    """把语句归一成形状：字面量和参数都换成 ?，IN (?, ?, ...) 和多行 VALUES 合并成一个"""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = shape.replace("%s", "?")
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    shape = _VALUES_LIST.sub(r"\1", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+def fingerprint(statement: str) -> tuple:
+    """返回 (指纹, 归一化的语句)，按原始语句缓存"""
+    cached = _fingerprints.get(statement)
+    if cached is None:
+        shape = normalize(statement)
+        cached = (hashlib.sha1(shape.encode("utf-8")).hexdigest()[:12], shape)
+        if len(_fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+            _fingerprints.clear()
+        _fingerprints[statement] = cached
+    return cached
+
+
+class RequestProfile:
+    __slots__ = ("id", "shapes", "statements", "seconds", "started_at")
+
+    def __init__(self):
+        self.id = os.urandom(6).hex()
+        # {指纹: [语句形状, 次数, 耗时]}
+        self.shapes: Dict[str, list] = {}
+        self.statements = 0
+        self.seconds = 0.0
+        self.started_at = datetime.now()
+
+    def record(self, statement: str, elapsed: float):
+        key, shape = fingerprint(statement)
+        entry = self.shapes.get(key)
+        if entry is None:
+            self.shapes[key] = [shape, 1, elapsed]
+        else:
+            entry[1] += 1
+            entry[2] += elapsed
+        self.statements += 1
+        self.seconds += elapsed
+
+    def n_plus_one(self, threshold: int = None) -> List[str]:
+        threshold = SQL_PROFILE_N1_THRESHOLD if threshold is None else threshold
+        return [key for key, (_, count, _) in self.shapes.items() if count > threshold]
+
+    def report(self, method: str, path: str, route: str, status: int, elapsed: float) -> Dict[str, Any]:
+        flagged = set(self.n_plus_one())
+        return {
+            "id": self.id,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "statements": self.statements,
+            "sql_ms": round(self.seconds * 1000, 2),
+            "n_plus_one": sorted(flagged),
+            "shapes": [
+                {"fingerprint": key, "statement": shape, "count": count, "sql_ms": round(seconds * 1000, 2),
+                 "n_plus_one": key in flagged}
+                for key, (shape, count, seconds) in sorted(
+                    self.shapes.items(), key=lambda item: (-item[1][1], -item[1][2])
+                )
+            ],
+        }
+
+
+current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+_reports: "deque[Dict[str, Any]]" = deque(maxlen=SQL_PROFILE_KEEP)
+_reports_lock = threading.Lock()
+
+
+def instrument_engine(sync_engine):
+    """没有在剖析的请求里只多一次 contextvar 读取"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        if profile is not None:
+            started = conn.info.get("profile_started")
+            if started:
+                profile.record(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("profile_started") and current_profile.get() is not None:
+            connection.info["profile_started"].pop()
+
+
+def reports(n_plus_one_only: bool = False, limit: int = 50) -> List[Dict[str, Any]]:
+    with _reports_lock:
+        items = list(_reports)
+    if n_plus_one_only:
+        items = [report for report in items if report["n_plus_one"]]
+    return items[::-1][:limit]
+
+
+def get_report(report_id: str) -> Optional[Dict[str, Any]]:
+    with _reports_lock:
+        return next((report for report in _reports if report["id"] == report_id), None)
+
+
+class ProfilerMiddleware:
+    """按抽样率（或请求头）剖析请求执行的 SQL，把报告保存在内存里，N+1 写警告日志。
+
+    响应头在发送响应头时写入，只包含到那时为止的语句；流式响应在发送响应体期间执行的语句只出现在报告中。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _should_profile(self, scope) -> bool:
+        if SQL_PROFILE_HEADER:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-sql-profile":
+                    return value not in (b"0", b"")
+        return SQL_PROFILE_SAMPLE_RATE > 0 and random.random() < SQL_PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if SQL_PROFILE_HEADER:
+                    headers = list(message.get("headers", []))
+                    headers += [
+                        (b"x-sql-profile-id", profile.id.encode()),
+                        (b"x-sql-statements", str(profile.statements).encode()),
+                        (b"x-sql-time-ms", f"{profile.seconds * 1000:.2f}".encode()),
+                        (b"x-sql-n-plus-one", ",".join(profile.n_plus_one()).encode()),
+                    ]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            report = profile.report(scope["method"], scope["path"], route, status[0], time.perf_counter() - start)
+            with _reports_lock:
+                _reports.append(report)
+            if report["n_plus_one"]:
+                worst = next(shape for shape in report["shapes"] if shape["n_plus_one"])
+                logger.warning(
+                    "疑似 N+1: %s %s 执行了 %s 条 SQL，其中同一语句 %s 次（报告 %s）: %s",
+                    scope["method"], route, report["statements"], worst["count"], report["id"],
+                    worst["statement"][:300],
+                )
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import math
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import models
+import changes
+from catalog import catalog
+from database import read_engine
+from sales_store import record_sales_changes
+from suggestions import MAX_REFERENCE_DAYS
+from write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+# 日销量保留的天数，更早的按月汇总进 sales_monthly；必须大于最大参考天数，
+# 否则参考窗口的前一部分已经归档，计算会静默地少算天数
+SALES_HOT_DAYS = int(os.getenv("SALES_HOT_DAYS", "400"))
+if SALES_HOT_DAYS <= MAX_REFERENCE_DAYS:
+    logger.warning("SALES_HOT_DAYS=%s 不大于最大参考天数 %s，按 %s 处理",
+                   SALES_HOT_DAYS, MAX_REFERENCE_DAYS, MAX_REFERENCE_DAYS + 1)
+    SALES_HOT_DAYS = MAX_REFERENCE_DAYS + 1
+# 自动归档的间隔小时数，0 表示只通过维护接口手动归档
+SALES_ARCHIVE_INTERVAL_HOURS = float(os.getenv("SALES_ARCHIVE_INTERVAL_HOURS", "24"))
+
+# 销量日期最多可以比今天晚多少天，超出的写入被拒绝（内存销量序列按这个范围分配）
+SALES_MAX_FUTURE_DAYS = int(os.getenv("SALES_MAX_FUTURE_DAYS", "366"))
+
+ROLLUP_GRANULARITIES = ("day", "week", "month")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def hot_cutoff(today: Optional[date] = None) -> date:
+    """热数据起点：保留期起点所在月的第一天，之前的日记录会被归档（只归档整月）"""
+    return month_start((today or date.today()) - timedelta(days=SALES_HOT_DAYS))
+
+
+def latest_sales_date(today: Optional[date] = None) -> date:
+    return (today or date.today()) + timedelta(days=SALES_MAX_FUTURE_DAYS)
+
+
+def check_sales_date(day: date, today: Optional[date] = None):
+    """写入日销量前检查日期。
+
+    热数据起点之前的月份已经（或即将）汇总进 sales_monthly，再写进 sales 的日记录
+    会在下次归档时被重复累加，所以不接受；太远的未来日期也不接受。日期不合法时抛出 ValueError。
+    """
+    cutoff = hot_cutoff(today)
+    if day < cutoff:
+        raise ValueError(f"日期 {day} 早于热数据起点 {cutoff}，该月销量已按月归档，不能再按日写入")
+    latest = latest_sales_date(today)
+    if day > latest:
+        raise ValueError(f"日期 {day} 晚于允许的最晚日期 {latest}")
+
+
+def archive_month(db: Session, month: date) -> Dict[str, Any]:
+    """把一个月的日销量按商品汇总进 sales_monthly，并删除这些日记录。
+
+    该月已有汇总时（归档后又导入了更早的数据）把新记录累加进去。
+    """
+    end = next_month(month)
+    in_month = (models.Sales.date >= month, models.Sales.date < end)
+    totals = db.execute(
+        select(models.Sales.product_id, func.sum(models.Sales.quantity), func.count(models.Sales.id))
+        .where(*in_month, models.Sales.product_id.isnot(None))
+        .group_by(models.Sales.product_id)
+    ).all()
+    if not totals:
+        return {"month": month, "products": 0, "rows": 0}
+
+    existing = {
+        row.product_id: row
+        for row in db.query(models.SalesMonthly).filter(models.SalesMonthly.month == month)
+    }
+    for product_id, quantity, days in totals:
+        archived = existing.get(product_id)
+        if archived is None:
+            db.add(models.SalesMonthly(product_id=product_id, month=month, quantity=quantity or 0, days=days))
+        else:
+            archived.quantity += quantity or 0
+            archived.days += days
+    db.flush()
+
+    deleted = db.execute(
+        delete(models.Sales).where(*in_month).execution_options(synchronize_session=False)
+    ).rowcount
+    record_sales_changes(db, cleared_before=end)
+    changes.record_change(db, changes.SALE, changes.DELETE_WHERE, payload={"before": end})
+    return {"month": month, "products": len(totals), "rows": deleted}
+
+
+def archive_sales(before: Optional[date] = None) -> Dict[str, Any]:
+    """归档 before（默认热数据起点）所在月之前的全部日销量。
+
+    每个月是一个独立的写队列任务，其他写操作可以插在月份之间执行。需在线程中调用。
+    before 不能晚于热数据起点，否则采购计算还要用到的日销量会被归档。
+    """
+    cutoff = month_start(before) if before else hot_cutoff()
+    if cutoff > hot_cutoff():
+        raise ValueError(f"只能归档热数据起点 {hot_cutoff()} 之前的销量")
+    with read_engine.connect() as conn:
+        oldest = conn.execute(
+            select(func.min(models.Sales.date)).where(models.Sales.date < cutoff)
+        ).scalar()
+
+    months: List[Dict[str, Any]] = []
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        result = write_queue.call(archive_month, month, batchable=False)
+        if result["rows"]:
+            months.append(result)
+        month = next_month(month)
+
+    archived_rows = sum(result["rows"] for result in months)
+    if archived_rows:
+        logger.info("已归档 %s 之前的 %s 条日销量", cutoff, archived_rows)
+    return {"cutoff": cutoff, "archived_rows": archived_rows, "months": months}
+
+
+async def run_periodic_archive():
+    """启动后立即归档一次，之后按间隔重复"""
+    while True:
+        try:
+            await run_in_threadpool(archive_sales)
+        except Exception:
+            logger.exception("自动归档销量出错")
+        await asyncio.sleep(SALES_ARCHIVE_INTERVAL_HOURS * 3600)
+
+
+def sales_history(db: Session, product_id: int, start_date: Optional[date] = None,
+                  end_date: Optional[date] = None) -> List[Dict[str, Any]]:
+    """查询商品的销量历史，日记录和月汇总合并后按日期降序返回。
+
+    日记录 granularity 为 day；已归档的月份以当月第一天为日期、granularity 为 month 返回一条合计。
+    """
+    daily = select(models.Sales.id, models.Sales.date, models.Sales.quantity).where(
+        models.Sales.product_id == product_id
+    )
+    monthly = select(models.SalesMonthly.month, models.SalesMonthly.quantity, models.SalesMonthly.days).where(
+        models.SalesMonthly.product_id == product_id
+    )
+    if start_date:
+        daily = daily.where(models.Sales.date >= start_date)
+        monthly = monthly.where(models.SalesMonthly.month >= month_start(start_date))
+    if end_date:
+        daily = daily.where(models.Sales.date <= end_date)
+        monthly = monthly.where(models.SalesMonthly.month <= end_date)
+
+    history = [
+        {"id": id, "product_id": product_id, "date": day, "quantity": quantity, "granularity": "day"}
+        for id, day, quantity in db.execute(daily.order_by(models.Sales.date.desc()))
+    ]
+    archived = [
+        {"id": None, "product_id": product_id, "date": month, "quantity": quantity, "granularity": "month",
+         "days": days}
+        for month, quantity, days in db.execute(monthly.order_by(models.SalesMonthly.month.desc()))
+    ]
+    if archived:
+        history = sorted(history + archived, key=lambda record: record["date"] or date.min, reverse=True)
+    return history
+
+
+def _bucket(column, granularity):
+    """把日期列截断到所在的日/周（周一）/月的第一天"""
+    if granularity == "day":
+        return column
+    if read_engine.dialect.name == "sqlite":
+        if granularity == "week":
+            return func.date(column, "-6 days", "weekday 1")
+        return func.date(column, "start of month")
+    return func.date(func.date_trunc(granularity, column))
+
+
+def _bucket_ordinal(day: date, granularity: str) -> int:
+    if granularity == "day":
+        return day.toordinal()
+    if granularity == "week":
+        # 公元 1 年 1 月 1 日是周一
+        return (day.toordinal() - 1) // 7
+    return day.year * 12 + day.month - 1
+
+
+def _bucket_date(ordinal: int, granularity: str) -> date:
+    if granularity == "day":
+        return date.fromordinal(ordinal)
+    if granularity == "week":
+        return date.fromordinal(ordinal * 7 + 1)
+    return date(ordinal // 12, ordinal % 12 + 1, 1)
+
+
+def sales_rollup(db: Session, product_ids: List[int], granularity: str = "day",
+                 start_date: Optional[date] = None, end_date: Optional[date] = None,
+                 max_points: Optional[int] = None) -> Dict[str, Any]:
+    """按日/周/月汇总多个商品的销量，用 SQL GROUP BY 计算，并入已归档的月汇总。
+
+    归档月份无法拆成日或周，按日/周汇总时以当月第一天的一个点返回（archived 为 true）。
+    max_points 限制每个商品的点数（归档点也计入）：桶数超出时把相邻 bucket_size 个桶合并成一个点，
+    销量相加，包含归档月份的点 archived 为 true。
+    """
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise ValueError("granularity 只能是 day、week 或 month")
+    product_ids = list(dict.fromkeys(product_ids))
+    # {商品ID: {桶序号: [销量, 记录数]}}
+    buckets: Dict[int, Dict[int, list]] = {product_id: {} for product_id in product_ids}
+    # 按日/周汇总时的归档月份单独保存，不和当月 1 日所在的桶混在一起：{商品ID: {月份: [销量, 天数]}}
+    archived_buckets: Dict[int, Dict[date, list]] = {product_id: {} for product_id in product_ids}
+
+    period = _bucket(models.Sales.date, granularity).label("period")
+    daily = (
+        select(models.Sales.product_id, period, func.sum(models.Sales.quantity), func.count(models.Sales.id))
+        .where(models.Sales.product_id.in_(product_ids), models.Sales.date.isnot(None))
+        .group_by(models.Sales.product_id, period)
+    )
+    monthly = select(models.SalesMonthly.product_id, models.SalesMonthly.month,
+                     models.SalesMonthly.quantity, models.SalesMonthly.days).where(
+        models.SalesMonthly.product_id.in_(product_ids)
+    )
+    if start_date:
+        daily = daily.where(models.Sales.date >= start_date)
+        monthly = monthly.where(models.SalesMonthly.month >= month_start(start_date))
+    if end_date:
+        daily = daily.where(models.Sales.date <= end_date)
+        monthly = monthly.where(models.SalesMonthly.month <= end_date)
+
+    for product_id, day, quantity, records in db.execute(daily):
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        buckets[product_id][_bucket_ordinal(day, granularity)] = [quantity or 0, records]
+    for product_id, month, quantity, days in db.execute(monthly):
+        if granularity == "month":
+            bucket = buckets[product_id].setdefault(_bucket_ordinal(month, granularity), [0, 0])
+        else:
+            bucket = archived_buckets[product_id].setdefault(month, [0, 0])
+        bucket[0] += quantity
+        bucket[1] += days
+
+    # 所有商品用同一个合并粒度，点的日期可以对齐；归档月份按当月 1 日所在的桶计入点数
+    ordinals = [ordinal for product_buckets in buckets.values() for ordinal in product_buckets]
+    ordinals += [_bucket_ordinal(month, granularity)
+                 for product_archived in archived_buckets.values() for month in product_archived]
+    bucket_size = 1
+    if max_points and ordinals:
+        bucket_size = max(1, math.ceil((max(ordinals) - min(ordinals) + 1) / max_points))
+        # 不合并时归档点和同一天（周）的桶各占一个点，可能超出 max_points，这时至少两两合并
+        if bucket_size == 1 and any(len(buckets[product_id]) + len(archived_buckets[product_id]) > max_points
+                                    for product_id in product_ids):
+            bucket_size = 2
+    first = min(ordinals) if ordinals else 0
+
+    products = []
+    for product_id, product_buckets in buckets.items():
+        points: Dict[Any, Dict[str, Any]] = {}
+        # 归档点在前，日期相同时排在当天的日记录之前
+        entries = [(month, quantity, days, True)
+                   for month, (quantity, days) in archived_buckets[product_id].items()]
+        entries += [(ordinal, quantity, records, False)
+                    for ordinal, (quantity, records) in product_buckets.items()]
+        for ordinal, quantity, records, archived in entries:
+            if archived and bucket_size == 1:
+                # 不合并时归档月份是独立的点，日期为当月第一天
+                key = ("archived", ordinal)
+                period_date = ordinal
+            else:
+                if archived:
+                    ordinal = _bucket_ordinal(ordinal, granularity)
+                key = first + (ordinal - first) // bucket_size * bucket_size
+                period_date = _bucket_date(key, granularity)
+            point = points.setdefault(key, {"period": period_date, "quantity": 0, "records": 0})
+            point["quantity"] += quantity
+            point["records"] += records
+            if archived:
+                point["archived"] = True
+        product = catalog.get(product_id)
+        products.append({
+            "product_id": product_id,
+            "product_code": product.code if product else None,
+            "product_name": product.name if product else None,
+            "points": sorted(points.values(), key=lambda point: point["period"]),
+        })
+    return {
+        "granularity": granularity,
+        "start_date": start_date,
+        "end_date": end_date,
+        "bucket_size": bucket_size,
+        "products": products,
+    }
@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+import models
+from database import IS_SQLITE, read_engine, async_read_engine
+from suggestions import mark_dirty
+from versions import SALES, bump_version, read_versions, read_versions_async
+from write_queue import after_commit
+
+logger = logging.getLogger(__name__)
+
+# 内存映射文件位置，重启时版本一致则直接映射，不必从数据库全量加载
+SALES_STORE_PATH = os.getenv("SALES_STORE_PATH", "./sales_store.npy")
+# 两次持久化元数据之间的最短秒数
+SALES_STORE_PERSIST_INTERVAL = float(os.getenv("SALES_STORE_PERSIST_INTERVAL", "30"))
+# 预留的天数（允许写入的最晚日期随时间后移）和扩容时预留的商品行数
+DAY_HEADROOM = 62
+ROW_HEADROOM = 64
+
+
+def store_range() -> Tuple[date, date]:
+    """矩阵覆盖的日期范围：热数据起点到允许写入的最晚日期，范围外的日期直接查数据库"""
+    # retention 导入了本模块，在这里导入避免循环导入
+    from retention import hot_cutoff, latest_sales_date
+    return hot_cutoff(), latest_sales_date()
+
+
+class ProductSeries:
+    """一个商品的日销量序列：矩阵中一行连续内存的视图，下标为相对 epoch 的天数，NaN 表示当天无记录"""
+    __slots__ = ("product_id", "values")
+
+    def __init__(self, product_id, values):
+        self.product_id = product_id
+        self.values = values
+
+
+class SalesStore:
+    """常驻内存的销量时间序列。
+
+    所有商品的日销量放在一个 (商品行, 天) 的 float64 矩阵中，矩阵保存在内存映射文件里。
+    矩阵只覆盖热数据起点到允许写入的最晚日期（大小有上限），热数据起点前移后下次读取时重建。
+    change_versions 中的 sales 计数器由每个销量写操作在事务中加一，写队列提交后
+    按顺序把改动应用到矩阵；发现计数器不连续（其他进程写入）时从数据库重建。
+    """
+
+    def __init__(self, path=SALES_STORE_PATH):
+        self._base_path = os.path.abspath(path)
+        self._path = self._base_path
+        self._meta_path = self._path + ".json"
+        self._lock = threading.RLock()
+        self._values = None
+        self._file = None
+        self._generation = 0
+        self._epoch = None
+        self._rows: Dict[int, int] = {}
+        self._series: Dict[int, ProductSeries] = {}
+        self._version = None
+        self._persisted_at = 0.0
+        self.rebuilds = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def use_slot(self, slot: int):
+        """多进程时每个进程映射自己的文件（按工作进程槽位命名，槽位 0 沿用原文件名），需在 warm 之前调用"""
+        base, ext = os.path.splitext(self._base_path)
+        self._path = f"{base}.w{slot}{ext}" if slot else self._base_path
+        self._meta_path = self._path + ".json"
+
+    # ---- 加载 ----
+
+    def warm(self):
+        """启动时调用：映射文件与数据库版本一致时直接使用，否则从数据库重建"""
+        with read_engine.connect() as conn:
+            version = read_versions(conn, [SALES])[SALES]
+        if not self._open_persisted(version):
+            self.rebuild()
+        return self
+
+    def refresh(self):
+        with read_engine.connect() as conn:
+            version = read_versions(conn, [SALES])[SALES]
+        if version != self._version or self._outdated():
+            self.rebuild()
+        return self
+
+    def _outdated(self):
+        # 热数据起点已经前移（跨月），矩阵前面的列不再需要
+        return self._epoch is not None and self._epoch < store_range()[0]
+
+    async def is_current_async(self):
+        async with async_read_engine.connect() as conn:
+            version = (await read_versions_async(conn, [SALES]))[SALES]
+        return version == self._version and not self._outdated()
+
+    def _open_persisted(self, version):
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["version"] != version or date.fromisoformat(meta["epoch"]) != store_range()[0]:
+                return False
+            values = np.load(os.path.join(os.path.dirname(self._path), meta["file"]), mmap_mode="r+")
+        except (OSError, ValueError, KeyError):
+            return False
+        epoch, latest = store_range()
+        if values.shape[1] <= (latest - epoch).days:
+            # 允许的最晚日期调大了，文件的列数不够
+            return False
+        with self._lock:
+            self._install(values, meta["file"], meta["generation"], date.fromisoformat(meta["epoch"]),
+                          {int(pid): row for pid, row in meta["rows"].items()}, version)
+        logger.info("销量存储已从 %s 映射，版本 %s", meta["file"], version)
+        return True
+
+    def rebuild(self):
+        """从数据库全量重建矩阵（同一个读快照内读取版本和数据）"""
+        started = time.perf_counter()
+        epoch, latest = store_range()
+        days = (latest - epoch).days + 1 + DAY_HEADROOM
+        with read_engine.connect() as conn:
+            if IS_SQLITE:
+                conn.exec_driver_sql("BEGIN")
+            version = read_versions(conn, [SALES])[SALES]
+            product_ids = conn.execute(select(models.Product.id)).scalars().all()
+            records = conn.execute(
+                select(models.Sales.product_id, models.Sales.date, models.Sales.quantity)
+                .where(models.Sales.date >= epoch, models.Sales.date < epoch + timedelta(days=days),
+                       models.Sales.product_id.isnot(None))
+            ).all()
+
+        product_ids = sorted(set(product_ids) | {pid for pid, _, _ in records})
+        rows = {pid: row for row, pid in enumerate(product_ids)}
+        ordinals = np.fromiter((d.toordinal() for _, d, _ in records), dtype=np.int64, count=len(records))
+
+        with self._lock:
+            generation = self._generation + 1
+            file_name, values = self._allocate(generation, len(rows) + ROW_HEADROOM, days)
+            if records:
+                row_index = np.fromiter((rows[pid] for pid, _, _ in records), dtype=np.int64, count=len(records))
+                quantities = np.fromiter((np.nan if q is None else q for _, _, q in records), dtype=np.float64, count=len(records))
+                values[row_index, ordinals - epoch.toordinal()] = quantities
+            self._install(values, file_name, generation, epoch, rows, version)
+            self.rebuilds += 1
+            self.persist(force=True)
+        logger.info("销量存储重建完成：%s 条记录，%s 个商品，耗时 %.2fs",
+                    len(records), len(rows), time.perf_counter() - started)
+
+    def _allocate(self, generation, n_rows, n_days):
+        base, ext = os.path.splitext(self._path)
+        file_name = f"{os.path.basename(base)}.{generation}{ext or '.npy'}"
+        values = np.lib.format.open_memmap(
+            os.path.join(os.path.dirname(self._path), file_name), mode="w+", dtype=np.float64, shape=(n_rows, n_days)
+        )
+        values.fill(np.nan)
+        return file_name, values
+
+    def _install(self, values, file_name, generation, epoch, rows, version):
+        old_file = self._file
+        self._values = values
+        self._file = file_name
+        self._generation = generation
+        self._epoch = epoch
+        self._rows = rows
+        self._series = {pid: ProductSeries(pid, values[row]) for pid, row in rows.items()}
+        self._version = version
+        if old_file and old_file != file_name:
+            try:
+                os.remove(os.path.join(os.path.dirname(self._path), old_file))
+            except OSError:
+                # Windows 下仍被映射的旧文件删不掉，下次重建时再清理
+                pass
+
+    def persist(self, force=False):
+        """刷新映射文件并写入元数据（版本、epoch、商品行号）"""
+        with self._lock:
+            if self._values is None:
+                return
+            now = time.time()
+            if not force and now - self._persisted_at < SALES_STORE_PERSIST_INTERVAL:
+                return
+            self._values.flush()
+            meta = {
+                "version": self._version,
+                "file": self._file,
+                "generation": self._generation,
+                "epoch": self._epoch.isoformat(),
+                "rows": {str(pid): row for pid, row in self._rows.items()},
+            }
+            tmp_path = self._meta_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._meta_path)
+            self._persisted_at = now
+
+    # ---- 读取 ----
+
+    def window(self, product_id, start: date, end: date) -> List[Tuple[date, float]]:
+        """返回 [start, end] 内有记录的 (日期, 销量)，按日期降序；切片是 O(1) 的视图。
+
+        超出矩阵范围的部分（热数据起点之前尚未归档的日记录等）从数据库查询。
+        """
+        with self._lock:
+            if self._epoch is None:
+                return []
+            epoch = self._epoch
+            n_days = self._values.shape[1]
+            series = self._series.get(product_id)
+            first = max((start - epoch).days, 0)
+            last = min((end - epoch).days + 1, n_days)
+            window = np.array(series.values[first:last]) if series is not None and first < last else None
+        result = []
+        if end >= epoch + timedelta(days=n_days):
+            result += self._query(product_id, max(start, epoch + timedelta(days=n_days)), end)
+        if window is not None:
+            offsets = np.flatnonzero(~np.isnan(window))[::-1]
+            result += [(epoch + timedelta(days=first + int(o)), float(window[o])) for o in offsets]
+        if start < epoch:
+            result += self._query(product_id, start, min(end, epoch - timedelta(days=1)))
+        return result
+
+    def _query(self, product_id, start: date, end: date) -> List[Tuple[date, float]]:
+        if start > end:
+            return []
+        with read_engine.connect() as conn:
+            return [(day, float(quantity)) for day, quantity in conn.execute(
+                select(models.Sales.date, models.Sales.quantity)
+                .where(models.Sales.product_id == product_id, models.Sales.date.between(start, end),
+                       models.Sales.quantity.isnot(None))
+                .order_by(models.Sales.date.desc())
+            )]
+
+    def stats(self):
+        with self._lock:
+            shape = self._values.shape if self._values is not None else (0, 0)
+            return {
+                "version": self._version,
+                "products": len(self._series),
+                "shape": list(shape),
+                "epoch": self._epoch.isoformat() if self._epoch else None,
+                "last_day": (self._epoch + timedelta(days=self._values.shape[1] - 1)).isoformat()
+                if self._epoch else None,
+                "bytes": int(self._values.nbytes) if self._values is not None else 0,
+                "file": self._file,
+                "rebuilds": self.rebuilds,
+            }
+
+    # ---- 写入（写队列提交后调用）----
+
+    def apply(self, version, upserts: Iterable[Tuple[int, date, float]] = (),
+              deletes: Iterable[Tuple[int, date]] = (), cleared_products: Iterable[int] = (),
+              clear_all=False, cleared_before: Optional[date] = None):
+        """应用一个已提交事务的改动。version 为该事务把 sales 计数器加一后的值"""
+        with self._lock:
+            if self._values is None or self._version is None:
+                return
+            if version <= self._version:
+                # 重建时已经读到了这次提交
+                return
+            if version != self._version + 1:
+                # 中间有其他进程的写入，下次读取时重建
+                logger.info("销量存储版本不连续（%s -> %s），等待重建", self._version, version)
+                self._version = None
+                return
+            if clear_all:
+                self._values.fill(np.nan)
+            if cleared_before is not None:
+                # 归档后早于 cleared_before 的日记录已不在 sales 表中
+                offset = min(max((cleared_before - self._epoch).days, 0), self._values.shape[1])
+                self._values[:, :offset] = np.nan
+            for product_id in cleared_products:
+                series = self._series.get(product_id)
+                if series is not None:
+                    series.values.fill(np.nan)
+            for product_id, day in deletes:
+                series = self._series.get(product_id)
+                if series is not None:
+                    offset = (day - self._epoch).days
+                    if 0 <= offset < series.values.shape[0]:
+                        series.values[offset] = np.nan
+            # 矩阵范围外的日期不保存，读取时从数据库查询
+            upserts = [(product_id, day, quantity) for product_id, day, quantity in upserts
+                       if 0 <= (day - self._epoch).days < self._values.shape[1]]
+            if upserts:
+                self._ensure_rows(upserts)
+                for product_id, day, quantity in upserts:
+                    self._series[product_id].values[(day - self._epoch).days] = np.nan if quantity is None else quantity
+            self._version = version
+        self.persist()
+
+    def _ensure_rows(self, upserts):
+        new_products = {pid for pid, _, _ in upserts if pid not in self._rows}
+        if not new_products:
+            return
+        n_rows, n_days = self._values.shape
+        needed_rows = len(self._rows) + len(new_products)
+        if needed_rows > n_rows:
+            # 扩容：分配新一代映射文件并拷贝旧数据（只增加商品行，日期范围不变）
+            generation = self._generation + 1
+            file_name, values = self._allocate(generation, needed_rows + ROW_HEADROOM, n_days)
+            values[:n_rows] = self._values
+            self._install(values, file_name, generation, self._epoch, dict(self._rows), self._version)
+        for product_id in new_products:
+            self._rows[product_id] = len(self._rows)
+            self._series[product_id] = ProductSeries(product_id, self._values[self._rows[product_id]])
+
+
+sales_store = SalesStore()
+
+
+def record_sales_changes(db, upserts=(), deletes=(), cleared_products=(), clear_all=False, cleared_before=None):
+    """销量写操作调用：在当前事务中给 sales 计数器加一，提交后把改动同步到内存序列"""
+    upserts, deletes, cleared_products = list(upserts), list(deletes), list(cleared_products)
+    version = bump_version(db, SALES)[SALES]
+    # 受影响商品的采购建议需要重算；归档（cleared_before）只移走保留期以外的旧销量，不影响建议
+    if clear_all:
+        mark_dirty(db)
+    else:
+        mark_dirty(db, [product_id for product_id, _, _ in upserts] + [product_id for product_id, _ in deletes]
+                   + cleared_products)
+    after_commit(db, sales_store.apply, version, upserts=upserts, deletes=deletes,
+                 cleared_products=cleared_products, clear_all=clear_all, cleared_before=cleared_before)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime, date
 from typing import Optional, List
 
@@ -28,6 +28,19 @@ class SalesBase(BaseModel):
 class SalesCreate(SalesBase):
     pass
 
+class SalesBatchItem(BaseModel):
+    # 商品用 ID 或编码指定，两者都给时以 ID 为准
+    product_id: Optional[int] = None
+    code: Optional[str] = None
+    date: date
+    quantity: float
+
+    @model_validator(mode="after")
+    def check_product(self):
+        if self.product_id is None and not (self.code and self.code.strip()):
+            raise ValueError("必须指定 product_id 或 code")
+        return self
+
 class Sales(SalesBase):
     id: int
     product: Product
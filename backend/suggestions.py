@@ -0,0 +1,372 @@
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from catalog import ProductInfo, catalog
+from database import read_engine
+from write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+# 后台重算采购建议的间隔秒数（0 表示关闭，只在主进程运行）
+SUGGESTIONS_REFRESH_SECONDS = float(os.getenv("SUGGESTIONS_REFRESH_SECONDS", "10"))
+# 保留最近多少天的建议
+SUGGESTIONS_RETENTION_DAYS = int(os.getenv("SUGGESTIONS_RETENTION_DAYS", "30"))
+# 每个写事务保存的商品数，也是在途记录查询中 IN 条件的参数个数
+SUGGESTIONS_BATCH_SIZE = 500
+
+# 商品描述中没有 T+n 时的到货天数
+DEFAULT_DELIVERY_DAYS = 3
+DEFAULT_REFERENCE_DAYS = 5
+# 采购计算允许的最大参考天数，日销量保留期（SALES_HOT_DAYS）必须比它长
+MAX_REFERENCE_DAYS = 365
+NO_HISTORY_MESSAGE = "历史数据不足，请手动设置预估销量"
+NO_ORDER_MESSAGE = "无需补货"
+
+# 本进程最近一次刷新的统计
+last_refresh: Dict[str, Any] = {}
+
+
+def mark_dirty(db: Session, product_ids: Optional[Iterable[int]] = None):
+    """在当前写事务中把商品标记为需要重算建议；product_ids 为 None 表示全部商品。
+
+    每个商品只保留最新的一条标记（先删旧的再插入，新标记的 id 大于进行中的重算读到的 max_id，
+    不会被那一轮清除），全部商品的标记取代之前所有的标记。后台重算关闭时不标记。
+    """
+    if SUGGESTIONS_REFRESH_SECONDS <= 0:
+        return
+    now = datetime.utcnow()
+    if product_ids is None:
+        db.execute(delete(models.SuggestionDirty).execution_options(synchronize_session=False))
+        db.execute(insert(models.SuggestionDirty), [{"product_id": None, "marked_at": now}])
+        return
+    ids = [product_id for product_id in dict.fromkeys(product_ids) if product_id is not None]
+    for i in range(0, len(ids), SUGGESTIONS_BATCH_SIZE):
+        db.execute(
+            delete(models.SuggestionDirty)
+            .where(models.SuggestionDirty.product_id.in_(ids[i:i + SUGGESTIONS_BATCH_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+    if ids:
+        db.execute(insert(models.SuggestionDirty), [{"product_id": product_id, "marked_at": now} for product_id in ids])
+
+
+def in_transit_statement(product_ids: List[int], current_date: date):
+    """在途记录：待到货、下单日期早于当天（不含当天）、预计到货日期不早于当天"""
+    arrival = models.Arrival
+    return select(arrival.id, arrival.product_id, arrival.product_code, arrival.order_date,
+                  arrival.expected_date, arrival.quantity).where(
+        arrival.product_id.in_(product_ids),
+        arrival.status == "pending",
+        arrival.order_date < current_date,
+        arrival.expected_date >= current_date,
+    )
+
+
+def _group_in_transit(rows, products: Dict[int, ProductInfo], grouped: Dict[int, list]):
+    # 到货记录中的编码必须与商品当前的编码一致
+    for row in rows:
+        product = products.get(row.product_id)
+        if product is not None and product.code is not None and row.product_code == product.code:
+            grouped[row.product_id].append(row)
+
+
+def load_in_transit(conn, products: List[ProductInfo], current_date: date) -> Dict[int, list]:
+    """按批查出这些商品的在途记录，{商品ID: [记录]}"""
+    by_id = {product.id: product for product in products}
+    ids = list(by_id)
+    grouped = defaultdict(list)
+    for i in range(0, len(ids), SUGGESTIONS_BATCH_SIZE):
+        _group_in_transit(conn.execute(in_transit_statement(ids[i:i + SUGGESTIONS_BATCH_SIZE], current_date)),
+                          by_id, grouped)
+    return grouped
+
+
+async def load_in_transit_async(db: AsyncSession, products: List[ProductInfo], current_date: date) -> Dict[int, list]:
+    by_id = {product.id: product for product in products}
+    ids = list(by_id)
+    grouped = defaultdict(list)
+    for i in range(0, len(ids), SUGGESTIONS_BATCH_SIZE):
+        _group_in_transit(await db.execute(in_transit_statement(ids[i:i + SUGGESTIONS_BATCH_SIZE], current_date)),
+                          by_id, grouped)
+    return grouped
+
+
+def suggest(product: ProductInfo, reference_days: int, current_stock: float, in_transit: List,
+            local_date: date, window: Callable) -> Dict[str, Any]:
+    """一个商品的采购建议，采购计算接口和后台预计算共用。
+
+    最近 reference_days 天（不含当天）有记录的日销量取中位数 × reference_days 作为预估销量，
+    减去当前库存和在途数量即建议采购量。window(商品ID, 开始, 结束) 返回 (日期, 销量) 降序列表。
+    """
+    debug = logger.isEnabledFor(logging.DEBUG)
+    in_transit_stock = 0
+    for record in in_transit:
+        in_transit_stock += record.quantity
+    if debug and in_transit:
+        logger.debug("商品 %s 在途记录: %s", product.code, "; ".join(
+            f"ID {record.id} 下单 {record.order_date} 预计到货 {record.expected_date} 数量 {record.quantity}"
+            for record in in_transit
+        ))
+
+    # 解析商品描述中的T+n
+    delivery_days = DEFAULT_DELIVERY_DAYS
+    if product.description and product.lead_days is not None:
+        delivery_days = product.lead_days
+
+    end_date = local_date - timedelta(days=1)  # 从昨天开始往前算
+    start_date = end_date - timedelta(days=reference_days - 1)
+    # (日期, 销量)，按日期降序
+    sales_data = window(product.id, start_date, end_date)
+
+    result = {
+        "product_id": product.id,
+        "product_name": product.name,
+        "product_code": product.code,
+        "product": {
+            "specification": product.specification,
+            "unit": product.unit,
+            "description": product.description  # 确保包含描述
+        },
+    }
+    if not sales_data:
+        logger.debug("商品 %s 在 %s ~ %s 没有历史销量数据", product.code, start_date, end_date)
+        result["message"] = NO_HISTORY_MESSAGE
+        result["order_quantity"] = 0
+        result["expected_date"] = local_date + timedelta(days=delivery_days)
+        return result
+
+    daily_sales = [quantity for _, quantity in sales_data]
+    median_sales = statistics.median(daily_sales)
+    estimated_sales = median_sales * reference_days
+    order_quantity = estimated_sales - (current_stock + in_transit_stock)
+    if debug:
+        logger.debug(
+            "商品 %s: %s ~ %s 销量 %s，中位数 %s × %s 天 = 预估 %s，减去库存 %s + 在途 %s = 建议采购 %s（T+%s）",
+            product.code, start_date, end_date, daily_sales, median_sales, reference_days,
+            estimated_sales, current_stock, in_transit_stock, round(order_quantity, 2), delivery_days
+        )
+
+    if order_quantity <= 0:
+        result["message"] = NO_ORDER_MESSAGE
+        result["order_quantity"] = 0
+    else:
+        result["order_quantity"] = round(order_quantity, 2)
+    result.update({
+        "expected_date": local_date + timedelta(days=delivery_days),
+        "estimated_sales": round(estimated_sales, 2),
+        "median_daily_sales": round(median_sales, 2),
+        "sales_data": [(sale_date.strftime('%Y-%m-%d'), quantity) for sale_date, quantity in sales_data],
+        "reference_days": reference_days,
+        "current_stock": current_stock,
+        "in_transit_stock": round(in_transit_stock, 2),
+        "order_date": local_date.strftime('%Y-%m-%d')
+    })
+    return result
+
+
+def _dirty_products(conn, max_id: Optional[int] = None):
+    """已标记的商品ID集合（包含 None 表示全部商品）"""
+    query = select(models.SuggestionDirty.product_id).distinct()
+    if max_id is not None:
+        query = query.where(models.SuggestionDirty.id <= max_id)
+    return set(conn.execute(query).scalars())
+
+
+def save_suggestions(db: Session, order_date: date, rows: List[Dict[str, Any]]):
+    """写队列任务：替换这些商品当天的建议"""
+    db.execute(
+        delete(models.Suggestion).where(
+            models.Suggestion.order_date == order_date,
+            models.Suggestion.product_id.in_([row["product_id"] for row in rows]),
+        ).execution_options(synchronize_session=False)
+    )
+    db.execute(insert(models.Suggestion), rows)
+
+
+def finish_refresh(db: Session, max_id: Optional[int], removed: List[int], expire_before: Optional[date]):
+    """写队列任务：清除已处理的标记（之后新加的标记留到下一轮），删除已删除商品和过期的建议"""
+    if max_id is not None:
+        db.execute(delete(models.SuggestionDirty).where(models.SuggestionDirty.id <= max_id))
+    for i in range(0, len(removed), SUGGESTIONS_BATCH_SIZE):
+        db.execute(delete(models.Suggestion).where(
+            models.Suggestion.product_id.in_(removed[i:i + SUGGESTIONS_BATCH_SIZE])
+        ))
+    if expire_before is not None:
+        db.execute(delete(models.Suggestion).where(
+            (models.Suggestion.order_date < expire_before)
+            | models.Suggestion.product_id.not_in(select(models.Product.id))
+        ))
+
+
+def refresh_suggestions(today: date) -> Optional[Dict[str, Any]]:
+    """重算被标记的商品；当天还没有建议（首次运行或跨天）时重算全部商品。
+
+    标记和数据在同一事务中提交，读到标记时一定能读到对应的数据；只清除本轮开始前的标记，
+    计算过程中新加的标记留到下一轮。需在线程中调用（会阻塞等待写队列）。没有要重算的商品时返回 None。
+    """
+    # sales_store 写入销量时调用本模块的 mark_dirty，在这里导入避免循环导入
+    from sales_store import sales_store
+
+    started = time.perf_counter()
+    with read_engine.connect() as conn:
+        max_id = conn.execute(select(func.max(models.SuggestionDirty.id))).scalar()
+        marked = _dirty_products(conn, max_id) if max_id is not None else set()
+        full = None in marked or conn.execute(
+            select(models.Suggestion.id).where(models.Suggestion.order_date == today).limit(1)
+        ).first() is None
+    if not full and not marked:
+        return None
+
+    products = {product.id: product for product in catalog.refresh().all()}
+    sales_store.refresh()
+    if full:
+        targets = list(products.values())
+        removed = []
+    else:
+        targets = [products[product_id] for product_id in sorted(marked) if product_id in products]
+        removed = [product_id for product_id in marked if product_id not in products]
+
+    computed_at = datetime.utcnow()
+    for i in range(0, len(targets), SUGGESTIONS_BATCH_SIZE):
+        batch = targets[i:i + SUGGESTIONS_BATCH_SIZE]
+        ids = [product.id for product in batch]
+        with read_engine.connect() as conn:
+            stock = dict(conn.execute(
+                select(models.Product.id, models.Product.current_stock).where(models.Product.id.in_(ids))
+            ).all())
+            in_transit = load_in_transit(conn, batch, today)
+        rows = []
+        for product in batch:
+            # 商品上保存的预估天数同样不能超出日销量的保留期
+            reference_days = min(product.reference_days or DEFAULT_REFERENCE_DAYS, MAX_REFERENCE_DAYS)
+            current_stock = stock.get(product.id) or 0
+            records = in_transit.get(product.id, [])
+            result = suggest(product, reference_days, current_stock, records, today, sales_store.window)
+            rows.append({
+                "product_id": product.id,
+                "order_date": today,
+                "order_quantity": result["order_quantity"],
+                "expected_date": result["expected_date"],
+                "estimated_sales": result.get("estimated_sales"),
+                "median_daily_sales": result.get("median_daily_sales"),
+                "reference_days": reference_days,
+                "current_stock": current_stock,
+                "in_transit_stock": round(sum(record.quantity for record in records), 2),
+                "message": result.get("message"),
+                "sales_data": json.dumps(result["sales_data"]) if "sales_data" in result else None,
+                "computed_at": computed_at,
+            })
+        if rows:
+            write_queue.call(save_suggestions, today, rows, batchable=False)
+
+    expire_before = today - timedelta(days=SUGGESTIONS_RETENTION_DAYS) if full else None
+    write_queue.call(finish_refresh, max_id, removed, expire_before, batchable=False)
+
+    last_refresh.update({
+        "order_date": today.isoformat(),
+        "full": full,
+        "products": len(targets),
+        "removed": len(removed),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "finished_at": datetime.utcnow().isoformat(timespec="seconds"),
+    })
+    return dict(last_refresh)
+
+
+async def run_periodic_refresh(today: Callable[[], date]):
+    """启动后立即刷新一次，之后按间隔只重算被标记的商品"""
+    while True:
+        try:
+            result = await run_in_threadpool(refresh_suggestions, today())
+            if result:
+                logger.info("采购建议已更新: %s", result)
+        except Exception:
+            logger.exception("更新采购建议出错")
+        await asyncio.sleep(SUGGESTIONS_REFRESH_SECONDS)
+
+
+def _item(row, product: ProductInfo, stale: bool) -> Dict[str, Any]:
+    # 和采购计算接口返回的结构一致，另加计算时间和是否过期
+    item = {
+        "product_id": product.id,
+        "product_name": product.name,
+        "product_code": product.code,
+        "product": {
+            "specification": product.specification,
+            "unit": product.unit,
+            "description": product.description
+        },
+    }
+    if row.message:
+        item["message"] = row.message
+    item["order_quantity"] = row.order_quantity
+    item["expected_date"] = row.expected_date
+    if row.sales_data is not None:
+        item.update({
+            "estimated_sales": row.estimated_sales,
+            "median_daily_sales": row.median_daily_sales,
+            "sales_data": json.loads(row.sales_data),
+            "reference_days": row.reference_days,
+            "current_stock": row.current_stock,
+            "in_transit_stock": row.in_transit_stock,
+            "order_date": row.order_date.strftime('%Y-%m-%d')
+        })
+    item["computed_at"] = row.computed_at
+    item["stale"] = stale
+    return item
+
+
+def load_suggestions(today: date, order_date: Optional[date] = None, to_order_only: bool = False) -> Dict[str, Any]:
+    """读取预先计算的建议。order_date（默认当天）还没有建议时返回之前最近一天的。
+
+    当天的建议在商品被标记后、重算完成前标为 stale；返回的不是当天的建议时全部为 stale。
+    """
+    requested = order_date or today
+    with read_engine.connect() as conn:
+        latest = conn.execute(
+            select(func.max(models.Suggestion.order_date)).where(models.Suggestion.order_date <= requested)
+        ).scalar()
+        query = select(models.Suggestion).where(models.Suggestion.order_date == latest)
+        if to_order_only:
+            query = query.where(models.Suggestion.order_quantity > 0)
+        rows = conn.execute(query.order_by(models.Suggestion.product_id)).all() if latest else []
+        marked = _dirty_products(conn) if requested == today else set()
+
+    catalog.refresh()
+    all_dirty = None in marked or latest != requested
+    items = []
+    for row in rows:
+        product = catalog.get(row.product_id)
+        if product is not None:
+            items.append(_item(row, product, all_dirty or row.product_id in marked))
+    computed = [row.computed_at for row in rows]
+    return {
+        "order_date": latest,
+        "requested_date": requested,
+        "stale": all_dirty or bool(marked),
+        # 等待重算的商品数，None 表示全部商品都要重算
+        "pending_products": None if None in marked else len(marked),
+        "computed_at": max(computed) if computed else None,
+        "oldest_computed_at": min(computed) if computed else None,
+        "items": items,
+    }
+
+
+def suggestion_stats() -> Dict[str, Any]:
+    with read_engine.connect() as conn:
+        pending = conn.execute(select(func.count()).select_from(models.SuggestionDirty)).scalar()
+    return {"pending_marks": pending, "last_refresh": dict(last_refresh) or None,
+            "refresh_seconds": SUGGESTIONS_REFRESH_SECONDS}
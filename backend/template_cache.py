@@ -0,0 +1,94 @@
+import glob
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+
+from starlette.responses import FileResponse, Response
+
+from etags import etag_matches, make_etag
+from exports import media_type
+
+# 生成好的导入模板缓存在磁盘上，文件名由模板名和版本键的哈希决定，重启后仍可复用
+TEMPLATE_CACHE_DIR = os.path.abspath(os.getenv("TEMPLATE_CACHE_DIR", "./template_cache"))
+
+
+class TemplateCache:
+    """按 (模板名, 格式, 版本键) 缓存生成的模板文件。
+
+    版本键由调用方给出（商品/库存计数器、模板日期等），键变化时重新生成，
+    同一模板只保留当前和上一个版本的文件（上一个可能还在发送中）。
+    """
+
+    def __init__(self, directory=TEMPLATE_CACHE_DIR):
+        self._dir = directory
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "evicted": 0}
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    @staticmethod
+    def etag(name: str, export_format: str, key) -> str:
+        return make_etag(name, export_format, key)
+
+    def get(self, name: str, export_format: str, key, build: Callable[[str], None]):
+        """返回 (etag, 文件路径)，缓存中没有时调用 build(path) 生成"""
+        etag = self.etag(name, export_format, key)
+        digest = etag.strip('"')
+        path = os.path.join(self._dir, f"{name}-{digest}.{export_format}")
+        if os.path.exists(path):
+            self._count("hits")
+            return etag, path
+
+        with self._locks[f"{name}.{export_format}"]:
+            if os.path.exists(path):
+                self._count("hits")
+                return etag, path
+            self._count("misses")
+            os.makedirs(self._dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                build(tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._evict(name, export_format, keep=path)
+        return etag, path
+
+    def _evict(self, name, export_format, keep):
+        files = sorted(
+            (p for p in glob.glob(os.path.join(self._dir, f"{name}-*.{export_format}")) if p != keep),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for old in files[1:]:
+            try:
+                os.remove(old)
+                self._count("evicted")
+            except OSError:
+                pass
+
+    def response(self, name: str, export_format: str, key, build: Callable[[str], None],
+                 filename: str, if_none_match: Optional[str] = None) -> Response:
+        """生成下载响应：客户端的 If-None-Match 与当前 ETag 一致时直接返回 304，不读文件"""
+        etag = self.etag(name, export_format, key)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            self._count("not_modified")
+            return Response(status_code=304, headers=headers)
+        etag, path = self.get(name, export_format, key, build)
+        return FileResponse(path, media_type=media_type(export_format),
+                            filename=f"{filename}.{export_format}", headers=headers)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["directory"] = self._dir
+        return stats
+
+
+template_cache = TemplateCache()
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pytest_configure(config):
+    # 数据库、销量序列和任务文件都是相对路径，在收集用例（导入应用模块）之前切换到临时目录
+    workdir = tempfile.mkdtemp(prefix="po-tests-")
+    os.chdir(workdir)
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/test.db")
+    # 后台归档、分析快照、日志压缩和建议重算与用例无关，关闭
+    for name in ("SALES_ARCHIVE_INTERVAL_HOURS", "ANALYTICS_SNAPSHOT_INTERVAL_MINUTES",
+                 "CHANGE_LOG_COMPACT_INTERVAL_MINUTES", "SUGGESTIONS_REFRESH_SECONDS"):
+        os.environ.setdefault(name, "0")
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as client:
+        yield client
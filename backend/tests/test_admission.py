@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from admission import CALCULATION, IMPORT, READ, AdmissionController, Lane, Rejected, admission
+
+
+def test_deletes_by_id_use_the_import_lane():
+    for path in ("/api/products/12", "/api/arrivals/3", "/api/sales/7"):
+        assert admission.classify("DELETE", path).name == IMPORT
+    assert admission.classify("DELETE", "/api/products/batch") is None
+    assert admission.classify("POST", "/api/products/batch-delete").name == IMPORT
+    assert admission.classify("GET", "/api/products/12").name == READ
+    assert admission.classify("GET", "/api/admission/stats") is None
+
+
+def test_full_lane_returns_429_with_retry_after(client, monkeypatch):
+    product_id = client.post("/api/products/", json={"code": "AD1", "name": "准入", "unit": "个"}).json()["id"]
+    lane = admission.lanes[IMPORT]
+    rejected = lane.rejected
+    # 名额已占满且不允许排队
+    monkeypatch.setattr(lane, "active", lane.limit)
+    monkeypatch.setattr(lane, "queue_size", 0)
+
+    r = client.delete(f"/api/products/{product_id}")
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    assert r.json()["class"] == IMPORT and r.json()["reason"] == "queue_full"
+    assert lane.rejected == rejected + 1
+    # 其他类别不受影响，商品没有被删除
+    assert [product["id"] for product in client.get("/api/products", params={"code": "AD1"}).json()] == [product_id]
+
+    monkeypatch.undo()
+    assert client.delete(f"/api/products/{product_id}").status_code == 200
+
+
+def test_queued_request_times_out():
+    async def scenario():
+        controller = AdmissionController([Lane(IMPORT, 0, 1, 4)], queue_timeout=0.05)
+        lane = controller.lanes[IMPORT]
+        await controller.acquire(lane)
+        with pytest.raises(Rejected) as rejected:
+            await controller.acquire(lane)
+        assert rejected.value.reason == "timeout"
+        assert (lane.active, len(lane.waiters)) == (1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_queued_reads_go_before_calculations():
+    async def scenario():
+        controller = AdmissionController([Lane(READ, 0, 1, 4), Lane(CALCULATION, 1, 1, 4)], queue_timeout=5)
+        read, calculation = controller.lanes[READ], controller.lanes[CALCULATION]
+        await controller.acquire(read)
+        waiting_read = asyncio.ensure_future(controller.acquire(read))
+        await asyncio.sleep(0)
+        # 计算类别有空闲名额，但读请求在排队，不开始新的计算
+        waiting_calculation = asyncio.ensure_future(controller.acquire(calculation))
+        await asyncio.sleep(0)
+        assert (calculation.active, len(calculation.waiters)) == (0, 1)
+
+        controller.release(read, 0.1)
+        await waiting_read
+        await asyncio.sleep(0)
+        assert read.active == 1 and calculation.active == 1
+        await waiting_calculation
+
+    asyncio.run(scenario())
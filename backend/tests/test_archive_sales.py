@@ -0,0 +1,54 @@
+import io
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import insert, select
+
+import models
+from retention import hot_cutoff, next_month
+
+
+def test_archive_rejects_before_after_hot_cutoff(client):
+    r = client.post("/api/maintenance/archive-sales", params={"before": str(next_month(hot_cutoff()))})
+    assert r.status_code == 400, r.text
+
+    r = client.post("/api/maintenance/archive-sales", params={"before": str(hot_cutoff())})
+    assert r.status_code == 200, r.text
+    assert r.json()["cutoff"] == str(hot_cutoff())
+
+    r = client.post("/api/maintenance/archive-sales", params={"before": str(date(2000, 1, 15))})
+    assert r.status_code == 200, r.text
+    assert r.json()["cutoff"] == "2000-01-01"
+
+
+def test_archived_day_cannot_be_written_again(app_module, client):
+    r = client.post("/api/products/", json={"code": "AR1", "name": "归档", "unit": "个"})
+    product_id = r.json()["id"]
+    day = date(2023, 3, 10)
+    # 归档之前写入的旧日记录
+    with app_module.engine.begin() as conn:
+        conn.execute(insert(models.Sales).values(product_id=product_id, date=day, quantity=10))
+    r = client.post("/api/maintenance/archive-sales")
+    assert r.status_code == 200, r.text
+
+    # 同一天再次写入：单条、批量、导入都拒绝
+    r = client.post("/api/sales", json={"product_id": product_id, "date": str(day), "quantity": 12})
+    assert r.status_code == 400, r.text
+    r = client.post("/api/sales/batch", json=[{"product_id": product_id, "date": str(day), "quantity": 12}])
+    assert r.json()["inserted"] == 0 and r.json()["errors"][0]["index"] == 0
+    buf = io.BytesIO()
+    pd.DataFrame({"商品编码": ["AR1"], day.strftime("%Y/%m/%d"): [12]}).to_excel(buf, index=False)
+    buf.seek(0)
+    r = client.post("/api/sales/import", files={"file": ("s.xlsx", buf, "application/octet-stream")})
+    assert r.status_code == 200 and r.json()["errors"], r.text
+
+    r = client.post("/api/maintenance/archive-sales")
+    assert r.status_code == 200, r.text
+    with app_module.engine.connect() as conn:
+        archived = conn.execute(
+            select(models.SalesMonthly.quantity, models.SalesMonthly.days)
+            .where(models.SalesMonthly.product_id == product_id)
+        ).all()
+    assert archived == [(10, 1)]
+    history = client.get(f"/api/sales/product/{product_id}").json()
+    assert [(record["granularity"], record["quantity"]) for record in history] == [("month", 10)]
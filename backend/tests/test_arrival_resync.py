@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+
+def test_resync_updates_renamed_products(app_module, client):
+    import models
+
+    r = client.post("/api/products/", json={"code": "RS1", "name": "同步前", "unit": "个"})
+    assert r.status_code == 200, r.text
+    product_id = r.json()["id"]
+    r = client.post("/api/arrivals", json={
+        "product_id": product_id,
+        "order_date": str(date.today()),
+        "expected_date": str(date.today() + timedelta(days=2)),
+        "quantity": 5
+    })
+    assert r.status_code == 200, r.text
+    arrival_id = r.json()["id"]
+
+    # 绕过 ORM 直接改商品表，到货记录里的冗余字段不会跟着变
+    with app_module.engine.begin() as conn:
+        conn.execute(text("UPDATE products SET code = 'RS1X', name = '同步后' WHERE id = :id"), {"id": product_id})
+
+    r = client.post("/api/arrivals/resync-products")
+    assert r.status_code == 200, r.text
+    assert r.json()["updated_count"] == 1
+
+    with app_module.SessionLocal() as db:
+        arrival = db.get(models.Arrival, arrival_id)
+        assert (arrival.product_code, arrival.product_name) == ("RS1X", "同步后")
+
+    # 已经一致时不再更新
+    r = client.post("/api/arrivals/resync-products")
+    assert r.json()["updated_count"] == 0
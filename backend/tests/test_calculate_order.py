@@ -0,0 +1,24 @@
+from datetime import date, datetime, timedelta
+
+import retention
+from suggestions import MAX_REFERENCE_DAYS
+
+
+def calculate(client, product_id, reference_days):
+    return client.post("/api/calculate-order", json={
+        "order_date": datetime.utcnow().isoformat(),
+        "items": [{"product_id": product_id, "current_stock": 0, "in_transit_stock": 0,
+                   "reference_days": reference_days}],
+    })
+
+
+def test_reference_days_stay_inside_the_hot_window(client):
+    # 最长的参考窗口也不早于热数据起点，不会有一部分已经归档
+    assert date.today() - timedelta(days=MAX_REFERENCE_DAYS + 1) >= retention.hot_cutoff()
+
+    r = client.post("/api/products/", json={"code": "CO1", "name": "计算", "unit": "个"})
+    product_id = r.json()["id"]
+    client.post("/api/sales", json={"product_id": product_id, "date": str(retention.hot_cutoff()), "quantity": 1})
+    assert calculate(client, product_id, MAX_REFERENCE_DAYS).status_code == 200
+    for reference_days in (0, MAX_REFERENCE_DAYS + 1):
+        assert calculate(client, product_id, reference_days).status_code == 422
@@ -0,0 +1,64 @@
+import json
+from datetime import date
+
+import changes
+from write_queue import write_queue
+
+
+def read_changes(client, since, **params):
+    r = client.get("/api/changes", params={"since": since, **params})
+    assert r.status_code == 200, r.text
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    return lines[:-1], lines[-1]
+
+
+def test_changes_are_returned_in_order(client):
+    _, tail = read_changes(client, 0)
+    since = tail["last_seq"]
+
+    product = client.post("/api/products/", json={"code": "CF1", "name": "变更", "unit": "个"}).json()
+    sale = client.post("/api/sales", json={"product_id": product["id"], "date": str(date.today()),
+                                           "quantity": 3}).json()
+    client.put(f"/api/products/{product['id']}", json={"code": "CF1", "name": "变更后", "unit": "个"})
+    client.delete(f"/api/sales/{sale['id']}")
+
+    rows, tail = read_changes(client, since)
+    assert [(row["entity"], row["op"], row["id"]) for row in rows] == [
+        ("product", "upsert", product["id"]),
+        # 记录已被删除的 upsert 输出为 delete
+        ("sale", "delete", sale["id"]),
+        ("product", "upsert", product["id"]),
+        ("sale", "delete", sale["id"]),
+    ]
+    seqs = [row["seq"] for row in rows]
+    assert seqs == sorted(seqs) and seqs[0] > since
+    # upsert 带的是记录的当前数据
+    assert rows[0]["data"]["name"] == "变更后"
+    assert tail == {"last_seq": seqs[-1], "has_more": False}
+
+    # 分页：按 limit 截断，从 last_seq 接着读
+    first, tail = read_changes(client, since, limit=2)
+    assert [row["seq"] for row in first] == seqs[:2] and tail["has_more"] is True
+    rest, tail = read_changes(client, tail["last_seq"])
+    assert [row["seq"] for row in rest] == seqs[2:]
+
+
+def test_changes_below_the_compaction_floor_are_gone(client):
+    client.post("/api/products/", json={"code": "CF2", "name": "压缩", "unit": "个"})
+    _, tail = read_changes(client, 0)
+    last_seq = tail["last_seq"]
+
+    # 保留期设为负数，现有日志全部过期
+    result = write_queue.call(changes.compact_change_log, retention_days=-1, batchable=False)
+    assert result["remaining"] == 0
+    assert changes.change_log_floor() == last_seq
+
+    r = client.get("/api/changes", params={"since": last_seq - 1})
+    assert r.status_code == 410
+    rows, tail = read_changes(client, last_seq)
+    assert rows == [] and tail["last_seq"] == last_seq
+
+    # 之后的变更照常从截断位置之后返回
+    product = client.post("/api/products/", json={"code": "CF3", "name": "压缩后", "unit": "个"}).json()
+    rows, _ = read_changes(client, last_seq)
+    assert [(row["entity"], row["id"]) for row in rows] == [("product", product["id"])]
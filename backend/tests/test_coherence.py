@@ -0,0 +1,30 @@
+import os
+
+from benchmarks.coherence import Checker, free_port, run_checks, start_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 2
+
+
+def test_workers_serve_each_others_writes(tmp_path, monkeypatch):
+    # 子进程使用自己临时目录里的数据库，不能继承其他用例的 DATABASE_URL
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    port = free_port()
+    log_path = os.path.join(tmp_path, "server.log")
+    server = start_server(BACKEND_DIR, WORKERS, port, True, log_path)
+    try:
+        checker = Checker(f"http://127.0.0.1:{port}", reads=20)
+        workers = checker.wait_for_workers(WORKERS, 60)
+        with open(log_path) as log:
+            assert len(workers) == WORKERS, log.read()[-2000:]
+        run_checks(checker)
+        seen = checker.wait_for_workers(WORKERS, 10)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    # 写入经由某一个进程，读请求分散到两个进程，都不能返回旧的 ETag、商品目录或销量
+    stale = {name: result for name, result in checker.results.items() if result["stale"]}
+    assert not stale
+    assert [stats["leader"] for stats in seen.values()].count(True) == 1
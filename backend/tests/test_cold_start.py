@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, text
+
+import migrations
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_heavy_modules(tmp_path):
+    # pandas、openpyxl 只在导入/导出时加载，alembic 只在需要迁移时加载
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import main; "
+        "print(','.join(m for m in ('pandas', 'openpyxl', 'alembic', 'pyarrow') if m in sys.modules))"
+    )
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path}/cold.db")
+    result = subprocess.run([sys.executable, "-c", code, BACKEND_DIR], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_schema_is_upgraded_to_the_script_heads(app_module, client):
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config()
+    config.set_main_option("script_location", migrations.ALEMBIC_DIR)
+    heads = set(ScriptDirectory.from_config(config).get_heads())
+    # 启动时不导入 alembic 算出的最新版本与 alembic 一致
+    assert migrations._script_heads() == heads
+    with app_module.engine.connect() as conn:
+        assert migrations._current_revisions(conn) == heads
+
+
+def test_legacy_database_is_stamped_and_upgraded(tmp_path, monkeypatch):
+    # 以前用 create_all 建的库没有 alembic_version，按现有表结构标记后升级
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE products (id INTEGER PRIMARY KEY, code VARCHAR UNIQUE, name VARCHAR, unit VARCHAR, "
+            "description VARCHAR, specification VARCHAR, reference_days INTEGER, current_stock FLOAT)"
+        ))
+        conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, product_id INTEGER, date DATE, quantity FLOAT)"))
+        conn.execute(text("INSERT INTO products (code, name, unit) VALUES ('L1', '旧库', '个')"))
+        assert migrations._legacy_revisions(conn) == ["9aaa774f1353"]
+
+    monkeypatch.setattr(migrations, "engine", legacy)
+    migrations.ensure_schema("upgrade")
+    with legacy.connect() as conn:
+        assert migrations._current_revisions(conn) == migrations._script_heads()
+        assert conn.execute(text("SELECT code FROM products")).scalars().all() == ["L1"]
+        assert conn.execute(text("SELECT count(*) FROM change_log")).scalar() == 0
+    legacy.dispose()
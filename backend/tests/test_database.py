@@ -0,0 +1,14 @@
+import pytest
+
+from database import _async_url
+
+
+def test_async_url_uses_the_matching_async_driver():
+    assert str(_async_url("sqlite:///./sql_app.db")) == "sqlite+aiosqlite:///./sql_app.db"
+    assert str(_async_url("postgresql://user@db/po")) == "postgresql+asyncpg://user@db/po"
+    assert str(_async_url("postgresql+psycopg2://user@db/po")) == "postgresql+asyncpg://user@db/po"
+
+
+def test_async_url_rejects_backends_without_an_async_driver():
+    with pytest.raises(ValueError, match="ASYNC_DATABASE_URL"):
+        _async_url("mysql+pymysql://user@db/po")
@@ -0,0 +1,29 @@
+import os
+from datetime import date
+
+
+def job_files(app_module):
+    if not os.path.isdir(app_module.DELETE_JOBS_DIR):
+        return set()
+    return set(os.listdir(app_module.DELETE_JOBS_DIR))
+
+
+def test_single_delete_leaves_no_job_record(app_module, client):
+    r = client.post("/api/products/", json={"code": "DP1", "name": "删除", "unit": "个"})
+    product_id = r.json()["id"]
+    client.post("/api/sales", json={"product_id": product_id, "date": str(date.today()), "quantity": 1})
+    files, jobs = job_files(app_module), set(app_module.delete_jobs)
+
+    r = client.delete(f"/api/products/{product_id}")
+    assert r.status_code == 200, r.text
+    assert client.get(f"/api/sales/product/{product_id}").json() == []
+    assert job_files(app_module) == files
+    assert set(app_module.delete_jobs) == jobs
+
+
+def test_batch_delete_keeps_job_record(app_module, client):
+    r = client.post("/api/products/", json={"code": "DP2", "name": "批量删除", "unit": "个"})
+    r = client.post("/api/products/batch-delete", json={"product_ids": [r.json()["id"]]})
+    assert r.status_code == 200, r.text
+    job = client.get(f"/api/products/delete-jobs/{r.json()['job_id']}").json()
+    assert job["status"] == "completed" and job["deleted"]["products"] == 1
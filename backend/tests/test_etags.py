@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+
+
+def test_list_etags_return_304_until_a_write(client):
+    r = client.post("/api/products/", json={"code": "ET1", "name": "条件请求", "unit": "个"})
+    product_id = r.json()["id"]
+    today = date.today()
+
+    for path in ("/api/products", "/api/sales", "/api/arrivals"):
+        r = client.get(path)
+        assert r.status_code == 200, r.text
+        etag = r.headers["ETag"]
+        r = client.get(path, headers={"If-None-Match": etag})
+        assert r.status_code == 304 and r.content == b""
+        assert r.headers["ETag"] == etag
+        # 查询参数不同，ETag 也不同
+        assert client.get(path, params={"code": "ET1"}).headers["ETag"] != etag
+
+    products_etag = client.get("/api/products").headers["ETag"]
+    sales_etag = client.get("/api/sales").headers["ETag"]
+    arrivals_etag = client.get("/api/arrivals").headers["ETag"]
+
+    # 写销量只让销量列表失效
+    client.post("/api/sales", json={"product_id": product_id, "date": str(today), "quantity": 2})
+    assert client.get("/api/sales", headers={"If-None-Match": sales_etag}).status_code == 200
+    assert client.get("/api/products", headers={"If-None-Match": products_etag}).status_code == 304
+    assert client.get("/api/arrivals", headers={"If-None-Match": arrivals_etag}).status_code == 304
+
+    r = client.post("/api/arrivals", json={"product_id": product_id, "order_date": str(today),
+                                           "expected_date": str(today + timedelta(days=3)), "quantity": 5})
+    assert r.status_code == 200, r.text
+    assert client.get("/api/arrivals", headers={"If-None-Match": arrivals_etag}).status_code == 200
+
+    # 商品改名后三个列表都要重新返回（销量和到货列表带商品名称）
+    sales_etag = client.get("/api/sales").headers["ETag"]
+    arrivals_etag = client.get("/api/arrivals").headers["ETag"]
+    client.put(f"/api/products/{product_id}", json={"code": "ET1", "name": "改名", "unit": "个"})
+    for path, etag in (("/api/products", products_etag), ("/api/sales", sales_etag),
+                       ("/api/arrivals", arrivals_etag)):
+        r = client.get(path, headers={"If-None-Match": etag})
+        assert r.status_code == 200, path
+        assert r.headers["ETag"] != etag
+
+
+def test_if_none_match_accepts_lists_and_weak_tags(client):
+    etag = client.get("/api/products").headers["ETag"]
+    assert client.get("/api/products", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/api/products", headers={"If-None-Match": '"other"'}).status_code == 200
@@ -0,0 +1,56 @@
+import codecs
+import csv
+import io
+from datetime import date, timedelta
+
+import pandas as pd
+
+import exports
+
+
+def test_sales_csv_export_format(client, monkeypatch):
+    today = date.today()
+    product = client.post("/api/products/", json={"code": "EX1", "name": '逗号,和"引号"', "unit": "个"}).json()
+    client.post("/api/sales", json={"product_id": product["id"], "date": str(today), "quantity": 2.5})
+    client.post("/api/sales", json={"product_id": product["id"], "date": str(today - timedelta(days=1)),
+                                    "quantity": 4})
+    # 每行单独输出一块，检查分块后内容不变
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 1)
+
+    r = client.get("/api/export/sales", params={"format": "csv", "product_id": product["id"]})
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "text/csv; charset=utf-8"
+    assert r.headers["content-disposition"] == "attachment; filename=sales.csv"
+    # 带 BOM，Excel 直接打开中文不乱码
+    assert r.content.startswith(codecs.BOM_UTF8)
+    rows = list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+    assert rows == [
+        ["商品编码", "商品名称", "日期", "销量"],
+        ["EX1", '逗号,和"引号"', str(today - timedelta(days=1)), "4.0"],
+        ["EX1", '逗号,和"引号"', str(today), "2.5"],
+    ]
+
+    # xlsx 的内容与 csv 一致
+    r = client.get("/api/export/sales", params={"product_id": product["id"]})
+    assert r.status_code == 200
+    df = pd.read_excel(io.BytesIO(r.content), dtype=str)
+    assert df.columns.tolist() == rows[0]
+    assert df["销量"].astype(float).tolist() == [4.0, 2.5]
+
+
+def test_arrivals_csv_export_leaves_missing_values_empty(client):
+    today = date.today()
+    product = client.post("/api/products/", json={"code": "EX2", "name": "到货导出", "unit": "个"}).json()
+    client.post("/api/arrivals", json={"product_id": product["id"], "order_date": str(today),
+                                       "expected_date": str(today + timedelta(days=2)), "quantity": 6})
+
+    r = client.get("/api/export/arrivals", params={"format": "csv", "start_date": str(today)})
+    assert r.status_code == 200, r.text
+    rows = list(csv.reader(io.StringIO(r.content.decode("utf-8-sig"))))
+    assert rows[0] == ["商品编码", "商品名称", "下单日期", "预计到货日期", "数量", "状态"]
+    row = next(row for row in rows[1:] if row[0] == "EX2")
+    assert row[:5] == ["EX2", "到货导出", str(today), str(today + timedelta(days=2)), "6.0"]
+
+
+def test_unknown_export_format_is_rejected(client):
+    assert client.get("/api/export/sales", params={"format": "xls"}).status_code == 422
@@ -0,0 +1,35 @@
+import json
+import logging
+import logging.handlers
+
+import logging_config
+from logging_config import DebugSampler, JsonFormatter
+
+
+def test_setup_logging_installs_one_queue_handler(app_module):
+    # main 导入时已经调用过，再次调用不会重复添加处理器
+    logging_config.setup_logging()
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if isinstance(handler, logging.handlers.QueueHandler)]
+    assert len(handlers) == 1
+    # 默认 INFO：DEBUG 诊断信息在调用处就被过滤掉，不会格式化参数
+    assert root.level == logging.getLevelName(logging_config.LOG_LEVEL)
+    assert not logging.getLogger("main").isEnabledFor(logging.DEBUG)
+
+
+def test_json_formatter_outputs_extra_fields():
+    record = logging.makeLogRecord({"name": "main", "levelno": logging.INFO, "levelname": "INFO",
+                                    "msg": "导入 %s 行", "args": (3,), "rows": 3})
+    entry = json.loads(JsonFormatter().format(record))
+    assert (entry["level"], entry["logger"], entry["msg"], entry["rows"]) == ("INFO", "main", "导入 3 行", 3)
+    assert "args" not in entry and "exc" not in entry
+
+
+def test_debug_sampler_only_drops_debug():
+    def record(level):
+        return logging.makeLogRecord({"levelno": level})
+
+    sampler = DebugSampler(0)
+    assert not sampler.filter(record(logging.DEBUG))
+    assert sampler.filter(record(logging.INFO)) and sampler.filter(record(logging.WARNING))
+    assert DebugSampler(1).filter(record(logging.DEBUG))
@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+
+
+def test_batch_reports_errors_per_item(client):
+    day = date.today() - timedelta(days=10)
+    r = client.post("/api/products/", json={"code": "SB1", "name": "批量", "unit": "个"})
+    product_id = r.json()["id"]
+    r = client.post("/api/sales/batch", json=[
+        {"product_id": product_id, "date": str(day), "quantity": 3},
+        {"code": "SB1", "date": str(day + timedelta(days=1)), "quantity": 4},
+        {"date": str(day + timedelta(days=2)), "quantity": 1},
+        {"code": "不存在", "date": str(day + timedelta(days=2)), "quantity": 1},
+    ])
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert (body["inserted"], body["updated"]) == (2, 0)
+    assert [error["index"] for error in body["errors"]] == [2, 3]
+
+
+def test_batch_request_schema_is_published(client):
+    body = client.get("/openapi.json").json()["paths"]["/api/sales/batch"]["post"]["requestBody"]
+    schema = body["content"]["application/json"]["schema"]
+    assert schema["type"] == "array"
+    assert set(schema["items"]["properties"]) == {"product_id", "code", "date", "quantity"}
+    assert schema["items"]["required"] == ["date", "quantity"]
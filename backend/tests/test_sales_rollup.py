@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def rollup_product(app_module, client):
+    import models
+
+    r = client.post("/api/products/", json={"code": "RU1", "name": "汇总", "unit": "个"})
+    assert r.status_code == 200, r.text
+    product_id = r.json()["id"]
+    # 2024-01、2024-02 已归档；2024-02-01 之后又导入了日记录，3 月整月是日记录
+    with app_module.engine.begin() as conn:
+        conn.execute(models.SalesMonthly.__table__.insert(), [
+            {"product_id": product_id, "month": date(2024, 1, 1), "quantity": 31, "days": 31},
+            {"product_id": product_id, "month": date(2024, 2, 1), "quantity": 29, "days": 29},
+        ])
+        conn.execute(models.Sales.__table__.insert(), [
+            {"product_id": product_id, "date": date(2024, 2, 1), "quantity": 5},
+        ] + [
+            {"product_id": product_id, "date": date(2024, 3, 1) + timedelta(days=i), "quantity": 1}
+            for i in range(31)
+        ])
+    return product_id
+
+
+def rollup(client, product_id, **params):
+    r = client.get("/api/sales/rollup", params={"product_id": product_id, **params})
+    assert r.status_code == 200, r.text
+    return r.json()["products"][0]["points"]
+
+
+def test_archived_month_does_not_share_daily_bucket(client, rollup_product):
+    points = rollup(client, rollup_product, granularity="day", start_date="2024-02-01", end_date="2024-02-29")
+    assert points == [
+        {"period": "2024-02-01", "quantity": 29, "records": 29, "archived": True},
+        {"period": "2024-02-01", "quantity": 5, "records": 1},
+    ]
+
+
+@pytest.mark.parametrize("granularity", ["day", "week"])
+@pytest.mark.parametrize("max_points", [1, 2, 5, 14, 20, 40, 91, 92])
+def test_max_points_counts_archived_months(client, rollup_product, granularity, max_points):
+    points = rollup(client, rollup_product, granularity=granularity, max_points=max_points)
+    assert len(points) <= max_points
+    assert sum(point["quantity"] for point in points) == 31 + 29 + 5 + 31
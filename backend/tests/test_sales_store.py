@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+from sqlalchemy import insert, select, text
+
+import models
+from retention import hot_cutoff
+from sales_store import sales_store
+
+
+def sql_window(engine, product_id, start, end):
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(models.Sales.date, models.Sales.quantity)
+            .where(models.Sales.product_id == product_id, models.Sales.date.between(start, end))
+            .order_by(models.Sales.date.desc())
+        ).all()
+    return [(day, float(quantity)) for day, quantity in rows]
+
+
+def assert_matches_sql(main, product_ids, start, end):
+    for product_id in product_ids:
+        assert sales_store.window(product_id, start, end) == sql_window(main.engine, product_id, start, end)
+
+
+def test_window_matches_sql_after_writes(app_module, client):
+    # 每次写入后由提交回调增量更新，不重建，结果始终与 sales 表一致
+    main = app_module
+    today = date.today()
+    start, end = hot_cutoff() - timedelta(days=10), today + timedelta(days=5)
+    product_ids = [
+        client.post("/api/products/", json={"code": f"SS{i}", "name": f"一致性{i}", "unit": "个"}).json()["id"]
+        for i in range(3)
+    ]
+    a, b, c = product_ids
+    with main.engine.begin() as conn:
+        # 保留期之前尚未归档的日记录
+        conn.execute(insert(models.Sales).values(product_id=a, date=hot_cutoff() - timedelta(days=2), quantity=7))
+    sales_store.refresh()
+    rebuilds = sales_store.rebuilds
+
+    sale = client.post("/api/sales", json={"product_id": a, "date": str(today), "quantity": 3}).json()
+    client.post("/api/sales", json={"product_id": b, "date": str(today - timedelta(days=1)), "quantity": 5})
+    assert_matches_sql(main, product_ids, start, end)
+
+    # 修改数量并改到另一天
+    r = client.put(f"/api/sales/{sale['id']}", json={"product_id": a, "date": str(today - timedelta(days=3)),
+                                                     "quantity": 8})
+    assert r.status_code == 200, r.text
+    assert_matches_sql(main, product_ids, start, end)
+
+    r = client.post("/api/sales/batch", json=[
+        {"product_id": a, "date": str(today - timedelta(days=3)), "quantity": 9},
+        {"product_id": c, "date": str(today), "quantity": 1},
+        {"code": "SS2", "date": str(today - timedelta(days=2)), "quantity": 2},
+    ])
+    assert r.json()["errors"] is None, r.text
+    assert_matches_sql(main, product_ids, start, end)
+
+    r = client.delete(f"/api/sales/{sale['id']}")
+    assert r.status_code == 200, r.text
+    assert_matches_sql(main, product_ids, start, end)
+
+    r = client.delete(f"/api/products/{b}")
+    assert r.status_code == 200, r.text
+    assert sales_store.window(b, start, end) == []
+    assert_matches_sql(main, product_ids, start, end)
+
+    # 归档移走保留期之前的日记录
+    r = client.post("/api/maintenance/archive-sales")
+    assert r.status_code == 200, r.text
+    assert_matches_sql(main, product_ids, start, end)
+
+    assert sales_store.rebuilds == rebuilds
+    with main.engine.connect() as conn:
+        version = conn.execute(text("SELECT version FROM change_versions WHERE name = 'sales'")).scalar()
+    assert sales_store.version == version
+
+    r = client.post("/api/reset-database")
+    assert r.status_code == 200, r.text
+    assert_matches_sql(main, product_ids, start, end)
+    assert sales_store.window(a, start, end) == []
+    assert sales_store.rebuilds == rebuilds
+
+
+def test_window_matches_sql_after_version_gap(app_module, client):
+    # 其他进程的写入（这里直接改库并加计数器）使版本不连续，下次读取前重建
+    main = app_module
+    today = date.today()
+    product_id = client.post("/api/products/", json={"code": "SSG", "name": "版本跳跃", "unit": "个"}).json()["id"]
+    client.post("/api/sales", json={"product_id": product_id, "date": str(today), "quantity": 1})
+    sales_store.refresh()
+    rebuilds = sales_store.rebuilds
+
+    with main.engine.begin() as conn:
+        conn.execute(insert(models.Sales).values(product_id=product_id, date=today - timedelta(days=1), quantity=6))
+        conn.execute(text("UPDATE change_versions SET version = version + 1 WHERE name = 'sales'"))
+    # 本进程随后的写入看到版本跳过了一个，不再增量更新
+    client.post("/api/sales", json={"product_id": product_id, "date": str(today - timedelta(days=2)), "quantity": 4})
+    assert sales_store.version is None
+
+    sales_store.refresh()
+    assert sales_store.rebuilds == rebuilds + 1
+    start, end = today - timedelta(days=30), today
+    assert sales_store.window(product_id, start, end) == sql_window(main.engine, product_id, start, end)
+    assert [quantity for _, quantity in sales_store.window(product_id, start, end)] == [1.0, 6.0, 4.0]
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+import models
+import retention
+from retention import hot_cutoff, latest_sales_date
+from sales_store import DAY_HEADROOM, sales_store
+
+
+def test_extreme_dates_are_rejected(client):
+    r = client.post("/api/products/", json={"code": "SR1", "name": "范围", "unit": "个"})
+    product_id = r.json()["id"]
+    for day in ("0001-01-01", "9999-12-31"):
+        r = client.post("/api/sales", json={"product_id": product_id, "date": day, "quantity": 1})
+        assert r.status_code == 400, r.text
+    r = client.post("/api/sales/batch", json=[{"product_id": product_id, "date": "9999-12-31", "quantity": 1}])
+    assert r.json()["inserted"] == 0 and len(r.json()["errors"]) == 1
+
+    r = client.post("/api/sales", json={"product_id": product_id, "date": str(latest_sales_date()), "quantity": 1})
+    assert r.status_code == 200, r.text
+    # 矩阵的列数只由热数据范围决定
+    stats = client.get("/api/sales-store/stats").json()
+    assert stats["epoch"] == str(hot_cutoff())
+    assert stats["shape"][1] == (latest_sales_date() - hot_cutoff()).days + 1 + DAY_HEADROOM
+    assert sales_store.window(product_id, latest_sales_date(), latest_sales_date()) == [(latest_sales_date(), 1.0)]
+
+
+def test_window_reads_dates_before_the_store_from_sql(app_module, client):
+    r = client.post("/api/products/", json={"code": "SR2", "name": "旧数据", "unit": "个"})
+    product_id = r.json()["id"]
+    old = hot_cutoff() - timedelta(days=3)
+    recent = date.today() - timedelta(days=1)
+    # 尚未归档的旧日记录（例如关闭了自动归档）
+    with app_module.engine.begin() as conn:
+        conn.execute(insert(models.Sales).values(product_id=product_id, date=old, quantity=4))
+    client.post("/api/sales", json={"product_id": product_id, "date": str(recent), "quantity": 2})
+
+    sales_store.refresh()
+    assert sales_store.window(product_id, old, recent) == [(recent, 2.0), (old, 4.0)]
+
+
+def test_store_moves_with_the_hot_start(client):
+    sales_store.refresh()
+    rebuilds = sales_store.rebuilds
+    hot_days = retention.SALES_HOT_DAYS
+    retention.SALES_HOT_DAYS = hot_days - 62
+    try:
+        # 热数据起点前移（跨月）后，下次使用前重建，矩阵从新的起点开始
+        assert client.get("/api/sales-store/stats").json()["epoch"] != str(hot_cutoff())
+        sales_store.refresh()
+        assert sales_store.rebuilds == rebuilds + 1
+        assert sales_store.stats()["epoch"] == str(hot_cutoff())
+    finally:
+        retention.SALES_HOT_DAYS = hot_days
+        sales_store.rebuild()
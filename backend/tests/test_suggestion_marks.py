@@ -0,0 +1,48 @@
+from sqlalchemy import func, select
+
+import models
+import suggestions
+
+
+def dirty_rows(db):
+    return db.execute(
+        select(models.SuggestionDirty.product_id, func.count()).group_by(models.SuggestionDirty.product_id)
+    ).all()
+
+
+def test_marks_are_deduplicated(app_module, monkeypatch):
+    monkeypatch.setattr(suggestions, "SUGGESTIONS_REFRESH_SECONDS", 10)
+    db = app_module.SessionLocal()
+    try:
+        db.execute(models.SuggestionDirty.__table__.delete())
+        for _ in range(3):
+            suggestions.mark_dirty(db, [1, 2, 2])
+        assert sorted(dirty_rows(db)) == [(1, 1), (2, 1)]
+        before = db.execute(select(func.max(models.SuggestionDirty.id))).scalar()
+
+        # 重新标记的商品取得更大的 id，进行中的重算清除 id <= max_id 的标记时不会丢掉它
+        suggestions.mark_dirty(db, [1])
+        assert db.execute(
+            select(models.SuggestionDirty.id).where(models.SuggestionDirty.product_id == 1)
+        ).scalar() > before
+
+        # 全部商品的标记取代之前的所有标记
+        suggestions.mark_dirty(db)
+        suggestions.mark_dirty(db)
+        assert dirty_rows(db) == [(None, 1)]
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_no_marks_when_refresh_disabled(app_module, monkeypatch):
+    monkeypatch.setattr(suggestions, "SUGGESTIONS_REFRESH_SECONDS", 0)
+    db = app_module.SessionLocal()
+    try:
+        db.execute(models.SuggestionDirty.__table__.delete())
+        suggestions.mark_dirty(db, [1])
+        suggestions.mark_dirty(db)
+        assert dirty_rows(db) == []
+    finally:
+        db.rollback()
+        db.close()
@@ -0,0 +1,41 @@
+import io
+
+import pandas as pd
+
+
+def test_stock_template_regenerates_when_products_change(client):
+    r = client.get("/api/download-stock-template")
+    assert r.status_code == 200, r.text
+    etag = r.headers["ETag"]
+
+    # 没有变化：带上 ETag 返回 304，再次下载命中缓存文件
+    r = client.get("/api/download-stock-template", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    hits = client.get("/api/template-cache/stats").json()["hits"]
+    r = client.get("/api/download-stock-template")
+    assert r.headers["ETag"] == etag
+    assert client.get("/api/template-cache/stats").json()["hits"] == hits + 1
+
+    # 新增商品后 ETag 变化，模板重新生成并包含新商品
+    r = client.post("/api/products/", json={"code": "TC1", "name": "模板", "unit": "个"})
+    product_id = r.json()["id"]
+    r = client.get("/api/download-stock-template", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert "TC1" in pd.read_excel(io.BytesIO(r.content))["商品编码"].astype(str).tolist()
+
+    # 改编码后旧 ETag 同样失效
+    etag = r.headers["ETag"]
+    client.put(f"/api/products/{product_id}", json={"code": "TC1B", "name": "模板", "unit": "个"})
+    r = client.get("/api/download-stock-template", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    codes = pd.read_excel(io.BytesIO(r.content))["商品编码"].astype(str).tolist()
+    assert "TC1B" in codes and "TC1" not in codes
+
+
+def test_template_formats_are_cached_separately(client):
+    xlsx = client.get("/api/download-product-template")
+    csv = client.get("/api/download-product-template", params={"format": "csv"})
+    assert xlsx.status_code == csv.status_code == 200
+    assert xlsx.headers["ETag"] != csv.headers["ETag"]
+    assert csv.content.decode("utf-8-sig").splitlines()[0] == "商品编码,商品名称,单位,规格,预估天数,描述"
@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+import schemas
+
+
+def test_write_jobs_see_uncommitted_products(app_module, client):
+    # 批量事务中前一个任务新增的商品尚未提交，只读连接看不到，后面的任务也要能找到
+    main = app_module
+    main.catalog.refresh()
+    today = date.today()
+    db = main.SessionLocal()
+    try:
+        product = main.apply_product_create(db, schemas.ProductCreate(code="WL1", name="同批新增", unit="个"))
+        arrival = main.apply_arrival_create(db, schemas.ArrivalCreate(
+            product_id=product.id, order_date=today, expected_date=today + timedelta(days=1), quantity=2
+        ))
+        assert (arrival.product_code, arrival.product_name) == ("WL1", "同批新增")
+
+        inserted, updated, errors = main.apply_sales_batch(db, [
+            (0, product.id, None, today, 3.0),
+            (1, None, "WL1", today - timedelta(days=1), 4.0),
+        ])
+        assert (inserted, updated, errors) == (2, 0, [])
+
+        # 同一事务中改名后更新到货记录，取到的是新名称
+        main.apply_product_update(db, product.id, schemas.ProductCreate(code="WL1", name="同批改名", unit="个"))
+        arrival = main.apply_arrival_update(db, arrival.id, schemas.ArrivalUpdate(quantity=5))
+        assert arrival.product_name == "同批改名"
+    finally:
+        db.rollback()
+        db.close()
+
+    # 没有提交，缓存里也没有
+    assert main.catalog.refresh().get_by_code("WL1") is None
+
+
+def test_session_lookups_load_products_in_one_query(app_module, client):
+    # 写会话里按行查找商品时先按 IN 条件批量加载，不再每行一条 SELECT
+    main = app_module
+    today = date.today()
+    db = main.SessionLocal()
+    statements = []
+
+    def count_product_selects(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM products" in statement:
+            statements.append(statement)
+
+    try:
+        products = [
+            main.apply_product_create(db, schemas.ProductCreate(code=f"WLN{i}", name=f"批量查找{i}", unit="个"))
+            for i in range(20)
+        ]
+        items = [(i, product.id, None, today, 1.0) for i, product in enumerate(products[:10])]
+        items += [(10 + i, None, product.code, today, 2.0) for i, product in enumerate(products[10:])]
+        items.append((20, None, "WLN-MISSING", today, 1.0))
+        event.listen(main.engine, "before_cursor_execute", count_product_selects)
+        try:
+            inserted, updated, errors = main.apply_sales_batch(db, items)
+        finally:
+            event.remove(main.engine, "before_cursor_execute", count_product_selects)
+        assert (inserted, updated) == (20, 0)
+        assert [error["index"] for error in errors] == [20]
+        # 一条按 ID、一条按编码
+        assert len(statements) == 2
+    finally:
+        db.rollback()
+        db.close()
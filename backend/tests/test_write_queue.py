@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+from sqlalchemy import delete, select
+
+import models
+from write_queue import WriteQueue, after_commit
+
+
+def test_failing_job_does_not_roll_back_its_batch(app_module, client):
+    # 同一事务中每个任务一个 SAVEPOINT，失败的任务只回滚自己
+    queue = WriteQueue(session_factory=app_module.SessionLocal)
+    release = threading.Event()
+    committed = []
+
+    def hold(db):
+        release.wait(5)
+
+    def add_product(db, code, fail=False):
+        db.add(models.Product(code=code, name=code, unit="个"))
+        db.flush()
+        after_commit(db, committed.append, code)
+        if fail:
+            raise ValueError("任务失败")
+        return code
+
+    try:
+        # 先用一个大操作占住写线程，后面的小操作排队后合并成一个事务
+        blocker = queue.submit(hold, batchable=False)
+        futures = [
+            queue.submit(add_product, "WQ1"),
+            queue.submit(add_product, "WQ2", fail=True),
+            queue.submit(add_product, "WQ3"),
+        ]
+        release.set()
+        blocker.result(5)
+        assert futures[0].result(5) == "WQ1"
+        with pytest.raises(ValueError):
+            futures[1].result(5)
+        assert futures[2].result(5) == "WQ3"
+
+        stats = queue.stats()
+        assert stats["transactions"] == 2 and stats["max_batch_size"] == 3
+        assert (stats["completed"], stats["failed"]) == (3, 1)
+        # 失败任务登记的提交回调被丢弃
+        assert committed == ["WQ1", "WQ3"]
+        with app_module.engine.connect() as conn:
+            codes = conn.execute(
+                select(models.Product.code).where(models.Product.code.in_(["WQ1", "WQ2", "WQ3"]))
+            ).scalars().all()
+        assert sorted(codes) == ["WQ1", "WQ3"]
+    finally:
+        release.set()
+        queue.stop(5)
+        with app_module.engine.begin() as conn:
+            conn.execute(delete(models.Product).where(models.Product.code.in_(["WQ1", "WQ2", "WQ3"])))
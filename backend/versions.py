@@ -0,0 +1,184 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import models
+from database import read_engine, async_read_engine
+from workers import WORKER_LOCK_DIR
+from write_queue import after_commit
+
+logger = logging.getLogger(__name__)
+
+# 表级变更计数器，保存在 change_versions 表中，多个进程共享
+PRODUCTS = "products"
+SALES = "sales"
+STOCK = "stock"
+ARRIVALS = "arrivals"
+ALL_COUNTERS = (PRODUCTS, SALES, STOCK, ARRIVALS)
+
+# 进程内计数器镜像的有效秒数，超过后从数据库重新读取（其他进程的写入最多延迟这么久可见）
+VERSION_MIRROR_TTL = float(os.getenv("VERSION_MIRROR_TTL", "1"))
+# 同一台机器上多个进程共享的计数器文件（内存映射），写操作提交后写入新版本，
+# 镜像使用前先比较这块共享内存，其他进程的写入立即可见；设为空关闭，只靠 VERSION_MIRROR_TTL
+VERSION_SHARED_FILE = os.getenv("VERSION_SHARED_FILE", os.path.join(WORKER_LOCK_DIR, "versions.shm"))
+
+
+def bump_version(db: Session, *names: str) -> Dict[str, int]:
+    """在当前写事务中把计数器加一，随事务一起提交或回滚；返回加一后的值"""
+    for name in names:
+        updated = db.execute(
+            update(models.ChangeVersion)
+            .where(models.ChangeVersion.name == name)
+            .values(version=models.ChangeVersion.version + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.add(models.ChangeVersion(name=name, version=1))
+            db.flush()
+    versions = read_versions(db, names)
+    after_commit(db, version_mirror.advance, versions)
+    return versions
+
+
+def version_query(names: Iterable[str]):
+    return select(models.ChangeVersion.name, models.ChangeVersion.version).where(
+        models.ChangeVersion.name.in_(list(names))
+    )
+
+
+def read_versions(connection, names: Iterable[str]) -> Dict[str, int]:
+    """读取计数器，不存在的记为 0。connection 可以是 Connection 或 Session"""
+    names = list(names)
+    versions = dict.fromkeys(names, 0)
+    versions.update({name: version for name, version in connection.execute(version_query(names))})
+    return versions
+
+
+async def read_versions_async(connection, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    versions = dict.fromkeys(names, 0)
+    versions.update({name: version for name, version in await connection.execute(version_query(names))})
+    return versions
+
+
+class SharedVersions:
+    """各计数器在共享内存中占一个 8 字节槽位，保存最近一次提交写入的版本。
+
+    读者只比较槽位是否变化，变化后以数据库为准重新读取；两个进程同时写入时槽位可能被较小的
+    版本覆盖，但覆盖本身也是一次变化，不会漏掉。
+    """
+
+    _format = "<%dq" % len(ALL_COUNTERS)
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._map: Optional[mmap.mmap] = None
+        self._failed = False
+        self._lock = threading.Lock()
+
+    def _open(self) -> Optional[mmap.mmap]:
+        """第一次使用时映射文件；打不开时返回 None，镜像退回只按 TTL 过期"""
+        if self._map is None and not self._failed:
+            with self._lock:
+                if self._map is None and not self._failed:
+                    size = struct.calcsize(self._format)
+                    try:
+                        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+                        try:
+                            if os.fstat(fd).st_size < size:
+                                os.ftruncate(fd, size)
+                            self._map = mmap.mmap(fd, size)
+                        finally:
+                            os.close(fd)
+                    except (OSError, ValueError) as e:
+                        self._failed = True
+                        logger.warning("无法映射共享计数器文件 %s（%s），其他进程的写入最多延迟 %s 秒可见",
+                                       self.path, e, VERSION_MIRROR_TTL)
+        return self._map
+
+    def read(self) -> Optional[Tuple[int, ...]]:
+        shared = self._open()
+        return struct.unpack_from(self._format, shared) if shared is not None else None
+
+    def publish(self, versions: Dict[str, int]):
+        shared = self._open()
+        if shared is None:
+            return
+        for name, version in versions.items():
+            if name in ALL_COUNTERS:
+                struct.pack_into("<q", shared, ALL_COUNTERS.index(name) * 8, version)
+
+
+class VersionMirror:
+    """计数器的进程内镜像，条件请求（ETag）据此判断数据是否变化，不必每次查数据库。
+
+    本进程的写操作提交后立即推进镜像，并把新版本写入共享内存；其他进程的写入在共享内存变化时
+    立即重新读取，没有共享内存时在 VERSION_MIRROR_TTL 秒内重新读取时发现。
+    """
+
+    def __init__(self, ttl=VERSION_MIRROR_TTL, shared: Optional[SharedVersions] = None):
+        self._ttl = ttl
+        self._shared = shared
+        self._versions: Dict[str, int] = {}
+        self._loaded_at = None
+        # 上次从数据库读取前共享内存中的值
+        self._seen = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _expired(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl:
+            return True
+        return self._shared is not None and self._shared.read() != self._seen
+
+    def _merge(self, versions, seen):
+        with self._lock:
+            self._seen = seen
+            for name, version in versions.items():
+                # 只前进不后退，避免旧的读取结果覆盖已提交的新版本
+                if version > self._versions.get(name, -1):
+                    self._versions[name] = version
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+
+    def advance(self, versions: Dict[str, int]):
+        """本进程的写事务提交后调用（在写操作返回给调用方之前）"""
+        with self._lock:
+            for name, version in versions.items():
+                if version > self._versions.get(name, -1):
+                    self._versions[name] = version
+        if self._shared is not None:
+            # 不更新 _seen：同时发生的其他进程的写入仍会在下次使用时被发现
+            self._shared.publish(versions)
+
+    def get(self, names: Iterable[str]) -> Dict[str, int]:
+        if self._expired():
+            seen = self._shared.read() if self._shared is not None else None
+            with read_engine.connect() as conn:
+                self._merge(read_versions(conn, ALL_COUNTERS), seen)
+        return {name: self._versions.get(name, 0) for name in names}
+
+    async def get_async(self, names: Iterable[str]) -> Dict[str, int]:
+        if self._expired():
+            seen = self._shared.read() if self._shared is not None else None
+            async with async_read_engine.connect() as conn:
+                self._merge(await read_versions_async(conn, ALL_COUNTERS), seen)
+        return {name: self._versions.get(name, 0) for name in names}
+
+    def stats(self):
+        return {
+            "versions": dict(self._versions),
+            "shared_file": self._shared.path if self._shared is not None else None,
+            "reloads": self.reloads,
+        }
+
+
+version_mirror = VersionMirror(shared=SharedVersions(VERSION_SHARED_FILE) if VERSION_SHARED_FILE else None)
@@ -0,0 +1,71 @@
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 工作进程数，大于 1 时 python main.py 以多进程方式启动 uvicorn
+WORKERS = int(os.getenv("WORKERS", "1"))
+# 工作进程槽位锁文件所在目录；同一个数据库的所有进程必须使用同一目录
+WORKER_LOCK_DIR = os.path.abspath(os.getenv("WORKER_LOCK_DIR", "./workers"))
+# 最多尝试的槽位数（uvicorn 重启工作进程时旧进程可能还没退出）
+MAX_WORKER_SLOTS = 64
+
+
+def _try_lock(path: str):
+    """非阻塞地对文件加排他锁，成功返回打开的文件（进程退出时锁自动释放），失败返回 None"""
+    f = open(path, "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+class WorkerSlot:
+    """每个进程启动时占用一个编号最小的空闲槽位（文件锁），用来区分同一数据库上的多个进程：
+
+    - 槽位 0 的进程是主进程，只有它运行定期归档、分析快照、日志压缩等后台任务；
+    - 进程各自的磁盘文件（销量存储的内存映射）按槽位命名，重启后由接替该槽位的进程复用。
+
+    主进程退出后锁随之释放，uvicorn 补起的新进程会接替槽位 0。
+    """
+
+    def __init__(self, directory=WORKER_LOCK_DIR):
+        self._dir = directory
+        self._file = None
+        self.slot: Optional[int] = None
+
+    def claim(self) -> int:
+        if self.slot is not None:
+            return self.slot
+        os.makedirs(self._dir, exist_ok=True)
+        for slot in range(MAX_WORKER_SLOTS):
+            f = _try_lock(os.path.join(self._dir, f"slot-{slot}.lock"))
+            if f is not None:
+                self._file, self.slot = f, slot
+                logger.info("工作进程 %s 占用槽位 %s%s", os.getpid(), slot, "（主进程）" if slot == 0 else "")
+                return slot
+        raise RuntimeError(f"{self._dir} 中的 {MAX_WORKER_SLOTS} 个工作进程槽位都已被占用")
+
+    @property
+    def is_leader(self) -> bool:
+        return self.claim() == 0
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file, self.slot = None, None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pid": os.getpid(), "slot": self.slot, "leader": self.slot == 0, "workers": WORKERS}
+
+
+worker_slot = WorkerSlot()
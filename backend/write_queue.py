@@ -0,0 +1,223 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# 一个事务里最多合并的小写操作数
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "64"))
+# 取到第一个小写操作后，额外等待更多写操作加入同一事务的毫秒数（0 表示只合并已排队的）
+WRITE_QUEUE_BATCH_WINDOW_MS = float(os.getenv("WRITE_QUEUE_BATCH_WINDOW_MS", "0"))
+
+_AFTER_COMMIT = "after_commit"
+
+
+def after_commit(db, fn, *args, **kwargs):
+    """登记一个回调，当前写操作所在事务提交成功后由写线程按顺序执行（用于同步内存中的数据）；
+    操作失败或事务回滚时回调被丢弃"""
+    db.info.setdefault(_AFTER_COMMIT, []).append((fn, args, kwargs))
+
+
+class WriteJob:
+    __slots__ = ("fn", "args", "kwargs", "batchable", "future", "context", "enqueued_at")
+
+    def __init__(self, fn, args, kwargs, batchable):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.batchable = batchable
+        self.future = concurrent.futures.Future()
+        # 在调用方的上下文里执行，请求级的 contextvars 在写线程中同样可见
+        self.context = contextvars.copy_context()
+        self.enqueued_at = time.perf_counter()
+
+    def run(self, db):
+        db.info[_AFTER_COMMIT] = []
+        return self.context.run(self.fn, db, *self.args, **self.kwargs)
+
+    def take_callbacks(self, db):
+        return [(self.context, callback) for callback in db.info.pop(_AFTER_COMMIT, [])]
+
+
+class WriteQueue:
+    """进程内的单写线程队列。
+
+    所有修改数据的操作以 fn(db, *args, **kwargs) 的形式提交，由唯一的写线程在写连接上执行。
+    可合并的小写操作会被放进同一个事务（每个操作一个 SAVEPOINT，互不影响），
+    导入等大操作单独一个事务。调用方拿到的是各自函数的返回值或异常。
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_batch=WRITE_QUEUE_MAX_BATCH,
+                 batch_window_ms=WRITE_QUEUE_BATCH_WINDOW_MS):
+        self._session_factory = session_factory
+        self._max_batch = max_batch
+        self._batch_window = batch_window_ms / 1000
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "transactions": 0,
+            "max_batch_size": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "exec_seconds_total": 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(None)
+            self._thread = None
+        thread.join(timeout)
+
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, batchable=True, **kwargs) -> concurrent.futures.Future:
+        if self.in_writer_thread():
+            raise RuntimeError("不能在写线程内部再次提交写操作")
+        self.start()
+        job = WriteJob(fn, args, kwargs, batchable)
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        self._queue.put(job)
+        return job.future
+
+    async def run(self, fn, *args, batchable=True, **kwargs):
+        """在 async 端点中提交写操作并等待结果"""
+        return await asyncio.wrap_future(self.submit(fn, *args, batchable=batchable, **kwargs))
+
+    def call(self, fn, *args, batchable=True, **kwargs):
+        """在同步代码（线程池中的 def 端点、后台任务）中提交写操作并阻塞等待结果"""
+        return self.submit(fn, *args, batchable=batchable, **kwargs).result()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        finished = stats["completed"] + stats["failed"]
+        stats["queue_depth"] = self._queue.qsize() + (1 if self._carry is not None else 0)
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["avg_wait_ms"] = round(stats["wait_seconds_total"] / finished * 1000, 3) if finished else 0.0
+        stats["max_wait_ms"] = round(stats["wait_seconds_max"] * 1000, 3)
+        stats["avg_batch_size"] = round(finished / stats["transactions"], 3) if stats["transactions"] else 0.0
+        return stats
+
+    def _next_job(self, timeout=None):
+        if self._carry is not None:
+            job, self._carry = self._carry, None
+            return job
+        if timeout is None:
+            return self._queue.get()
+        return self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                break
+            batch = [job]
+            if job.batchable:
+                deadline = time.perf_counter() + self._batch_window
+                while len(batch) < self._max_batch:
+                    try:
+                        next_job = self._next_job(timeout=max(0.0, deadline - time.perf_counter()))
+                    except queue.Empty:
+                        break
+                    if next_job is None or not next_job.batchable:
+                        # 大操作或停止信号留到下一轮单独处理
+                        self._carry = next_job
+                        break
+                    batch.append(next_job)
+            try:
+                self._execute(batch)
+            except Exception as e:
+                # 连接失败等意外错误：通知所有还在等待的调用方，写线程继续运行
+                logger.exception("写队列执行出错")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+        logger.info("写线程已停止")
+
+    def _execute(self, batch):
+        started = time.perf_counter()
+        outcomes = []
+        callbacks = []
+        db = self._session_factory(expire_on_commit=False)
+        try:
+            if len(batch) == 1:
+                job = batch[0]
+                try:
+                    outcomes.append((job, job.run(db), None))
+                    callbacks = job.take_callbacks(db)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    outcomes = [(job, None, e)]
+                    callbacks = []
+            else:
+                for job in batch:
+                    try:
+                        with db.begin_nested():
+                            result = job.run(db)
+                    except Exception as e:
+                        db.info.pop(_AFTER_COMMIT, None)
+                        outcomes.append((job, None, e))
+                        continue
+                    callbacks.extend(job.take_callbacks(db))
+                    outcomes.append((job, result, None))
+                try:
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    outcomes = [(job, None, e) for job, _, _ in outcomes]
+                    callbacks = []
+        finally:
+            db.close()
+
+        for context, (fn, args, kwargs) in callbacks:
+            try:
+                context.run(fn, *args, **kwargs)
+            except Exception:
+                # 数据已经提交，回调失败只记录日志，不影响调用方
+                logger.exception("写事务提交后的回调执行出错")
+
+        finished = time.perf_counter()
+        with self._stats_lock:
+            stats = self._stats
+            stats["transactions"] += 1
+            stats["max_batch_size"] = max(stats["max_batch_size"], len(batch))
+            stats["exec_seconds_total"] += finished - started
+            for job, _, error in outcomes:
+                wait = started - job.enqueued_at
+                stats["wait_seconds_total"] += wait
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], wait)
+                stats["failed" if error is not None else "completed"] += 1
+
+        for job, result, error in outcomes:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+
+write_queue = WriteQueue()